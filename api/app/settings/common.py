@@ -541,10 +541,43 @@ if ENABLE_DB_LOGGING:
         "handlers": ["console"],
     }
 
+# Log the number of queries (and rows) that each build of the environment
+# documents takes to the environments.document_builder logger.
+ENABLE_DOCUMENT_BUILD_REPORTING = env.bool(
+    "ENABLE_DOCUMENT_BUILD_REPORTING", default=False
+)
+
 CACHE_FLAGS_SECONDS = env.int("CACHE_FLAGS_SECONDS", default=0)
 FLAGS_CACHE_LOCATION = "environment-flags"
+
+# Store the rendered JSON bytes for the SDK endpoints in the relevant caches (and
+# write them directly to the response) rather than the python data structures.
+CACHE_RENDERED_SDK_RESPONSES = env.bool("CACHE_RENDERED_SDK_RESPONSES", default=False)
+# Also store a gzipped copy of the rendered JSON bytes which is served to clients
+# which accept gzip encoding.
+CACHE_RENDERED_SDK_RESPONSES_GZIP = env.bool(
+    "CACHE_RENDERED_SDK_RESPONSES_GZIP", default=False
+)
 CHARGEBEE_CACHE_LOCATION = "chargebee-objects"
 
+# Settings for the read-through caches of environments, environment documents and
+# segments (see util.cache). Entries are served for up to CACHE_STALE_SECONDS
+# after they expire while a single worker rebuilds them, and are rebuilt early at
+# a random point in the last CACHE_EARLY_REFRESH_FRACTION of their timeout.
+CACHE_STALE_SECONDS = env.int("CACHE_STALE_SECONDS", default=30)
+CACHE_EARLY_REFRESH_FRACTION = env.float("CACHE_EARLY_REFRESH_FRACTION", default=0.1)
+CACHE_REBUILD_LOCK_SECONDS = env.int("CACHE_REBUILD_LOCK_SECONDS", default=10)
+# Optionally keep the values from these caches in process memory as well, for up
+# to LOCAL_CACHE_TIER_SECONDS, to avoid a round trip to the shared cache (and
+# unpickling the value) on every request. Disabled by default.
+LOCAL_CACHE_TIER_SECONDS = env.int("LOCAL_CACHE_TIER_SECONDS", default=0)
+LOCAL_CACHE_TIER_MAX_ENTRIES = env.int("LOCAL_CACHE_TIER_MAX_ENTRIES", default=1000)
+# How often each value in the local tier checks whether it has been invalidated in
+# the shared cache (by another process).
+LOCAL_CACHE_TIER_VERSION_CHECK_SECONDS = env.int(
+    "LOCAL_CACHE_TIER_VERSION_CHECK_SECONDS", default=1
+)
+
 ENVIRONMENT_CACHE_SECONDS = env.int("ENVIRONMENT_CACHE_SECONDS", default=60)
 ENVIRONMENT_CACHE_BACKEND = env.str(
     "ENVIRONMENT_CACHE_BACKEND",
@@ -587,6 +620,22 @@ CACHE_BAD_ENVIRONMENTS_AFTER_FAILURES = env.int(
     "CACHE_BAD_ENVIRONMENTS_AFTER_FAILURES", 1
 )
 
+# Keep a bloom filter of all the environment keys in each process so that
+# requests with unknown keys can be rejected without querying the cache or the
+# database (see environments.api_key_filter).
+ENVIRONMENT_KEY_FILTER_ENABLED = env.bool("ENVIRONMENT_KEY_FILTER_ENABLED", False)
+ENVIRONMENT_KEY_FILTER_REFRESH_SECONDS = env.int(
+    "ENVIRONMENT_KEY_FILTER_REFRESH_SECONDS", 5
+)
+# Rebuild the filter at least this often, so that processes that don't share the
+# environment cache (and so don't see the version change) pick up new keys.
+ENVIRONMENT_KEY_FILTER_MAX_AGE_SECONDS = env.int(
+    "ENVIRONMENT_KEY_FILTER_MAX_AGE_SECONDS", 300
+)
+ENVIRONMENT_KEY_FILTER_FALSE_POSITIVE_RATE = env.float(
+    "ENVIRONMENT_KEY_FILTER_FALSE_POSITIVE_RATE", 0.01
+)
+
 CACHE_PROJECT_SEGMENTS_SECONDS = env.int("CACHE_PROJECT_SEGMENTS_SECONDS", 0)
 PROJECT_SEGMENTS_CACHE_LOCATION = "project-segments"
 
@@ -602,6 +651,78 @@ ENVIRONMENT_SEGMENTS_CACHE_BACKEND = env(
 
 CACHE_ENVIRONMENT_DOCUMENT_SECONDS = env.int("CACHE_ENVIRONMENT_DOCUMENT_SECONDS", 0)
 ENVIRONMENT_DOCUMENT_CACHE_LOCATION = "environment-documents"
+# Store the environment documents in the cache as gzipped JSON, which is also
+# served directly by the SDK environment document endpoint to clients which
+# accept gzip encoding.
+CACHE_ENVIRONMENT_DOCUMENT_GZIP = env.bool("CACHE_ENVIRONMENT_DOCUMENT_GZIP", False)
+# The number of recent versions of each environment document to keep in the
+# environment document cache, for the SDK environment document delta endpoint to
+# build deltas from. Set to 0 to disable, in which case the endpoint always
+# returns the full document.
+ENVIRONMENT_DOCUMENT_DELTA_VERSIONS = env.int("ENVIRONMENT_DOCUMENT_DELTA_VERSIONS", 0)
+# How long to keep each of those versions for, after which SDKs holding it are
+# sent the full document.
+ENVIRONMENT_DOCUMENT_DELTA_VERSION_SECONDS = env.int(
+    "ENVIRONMENT_DOCUMENT_DELTA_VERSION_SECONDS", 60 * 60 * 24
+)
+
+# Evaluate the flags for the SDK identities endpoint in memory, against a cached
+# copy of the environment (see environments.sdk.evaluation), rather than in the
+# database. Set to 0 to disable.
+CACHE_ENVIRONMENT_EVALUATION_CONTEXT_SECONDS = env.int(
+    "CACHE_ENVIRONMENT_EVALUATION_CONTEXT_SECONDS", default=0
+)
+
+# Cache the identity, traits and overrides needed to evaluate the flags for an
+# identity in memory (see environments.identities.evaluation_cache). Only used
+# when CACHE_ENVIRONMENT_EVALUATION_CONTEXT_SECONDS is also set. Entries are
+# updated when identities are written to through the API, so a backend that is
+# shared between processes should be used when running more than one. Set to 0
+# to disable.
+CACHE_IDENTITY_EVALUATION_SECONDS = env.int(
+    "CACHE_IDENTITY_EVALUATION_SECONDS", default=0
+)
+IDENTITY_EVALUATION_CACHE_NAME = "identity-evaluation"
+IDENTITY_EVALUATION_CACHE_BACKEND = env.str(
+    "IDENTITY_EVALUATION_CACHE_BACKEND",
+    default="django.core.cache.backends.locmem.LocMemCache",
+)
+IDENTITY_EVALUATION_CACHE_LOCATION = env.str(
+    "IDENTITY_EVALUATION_CACHE_LOCATION", default=IDENTITY_EVALUATION_CACHE_NAME
+)
+
+# The maximum number of identities that can be identified in a single request to
+# the SDK bulk identities endpoint.
+SDK_BULK_IDENTIFY_MAX_IDENTITIES = env.int(
+    "SDK_BULK_IDENTIFY_MAX_IDENTITIES", default=100
+)
+
+# Buffer the identity and trait writes from the SDK endpoints and persist them in
+# batches, instead of writing them inline. See environments.identities.write_behind.
+SDK_IDENTITY_WRITE_BEHIND = env.bool("SDK_IDENTITY_WRITE_BEHIND", default=False)
+SDK_IDENTITY_WRITE_BEHIND_FLUSH_SECONDS = env.float(
+    "SDK_IDENTITY_WRITE_BEHIND_FLUSH_SECONDS", default=5.0
+)
+SDK_IDENTITY_WRITE_BEHIND_BATCH_SIZE = env.int(
+    "SDK_IDENTITY_WRITE_BEHIND_BATCH_SIZE", default=500
+)
+
+# The identity integrations (e.g. Amplitude, Segment) are sent the identities
+# from a shared pool of worker threads, with a bounded queue per integration.
+# See integrations.common.dispatcher.
+IDENTITY_INTEGRATIONS_DISPATCHER_WORKERS = env.int(
+    "IDENTITY_INTEGRATIONS_DISPATCHER_WORKERS", default=4
+)
+IDENTITY_INTEGRATIONS_DISPATCHER_QUEUE_SIZE = env.int(
+    "IDENTITY_INTEGRATIONS_DISPATCHER_QUEUE_SIZE", default=1000
+)
+IDENTITY_INTEGRATIONS_DISPATCHER_BATCH_SIZE = env.int(
+    "IDENTITY_INTEGRATIONS_DISPATCHER_BATCH_SIZE", default=50
+)
+# How long to wait for the queued identities to be sent when the process exits.
+IDENTITY_INTEGRATIONS_DISPATCHER_DRAIN_SECONDS = env.int(
+    "IDENTITY_INTEGRATIONS_DISPATCHER_DRAIN_SECONDS", default=5
+)
 
 CACHES = {
     "default": {
@@ -649,6 +770,11 @@ CACHES = {
         "LOCATION": ENVIRONMENT_SEGMENTS_CACHE_LOCATION,
         "TIMEOUT": ENVIRONMENT_SEGMENTS_CACHE_SECONDS,
     },
+    IDENTITY_EVALUATION_CACHE_NAME: {
+        "BACKEND": IDENTITY_EVALUATION_CACHE_BACKEND,
+        "LOCATION": IDENTITY_EVALUATION_CACHE_LOCATION,
+        "TIMEOUT": CACHE_IDENTITY_EVALUATION_SECONDS,
+    },
 }
 
 TRENCH_AUTH = {
@@ -750,6 +876,12 @@ DEFAULT_ORG_STORE_TRAITS_VALUE = env.bool("DEFAULT_ORG_STORE_TRAITS_VALUE", True
 
 # DynamoDB table name for storing environment
 ENVIRONMENTS_TABLE_NAME_DYNAMO = env.str("ENVIRONMENTS_TABLE_NAME_DYNAMO", None)
+# Write the environment documents to dynamodb as gzipped JSON to keep the items
+# well within dynamodb's size limit. Documents are read in either format, but any
+# other services that read the table need to support it before this is enabled.
+ENVIRONMENTS_TABLE_GZIP_DOCUMENTS_DYNAMO = env.bool(
+    "ENVIRONMENTS_TABLE_GZIP_DOCUMENTS_DYNAMO", False
+)
 
 # DynamoDB table name for storing identities
 IDENTITIES_TABLE_NAME_DYNAMO = env.str("IDENTITIES_TABLE_NAME_DYNAMO", None)
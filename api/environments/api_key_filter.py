@@ -0,0 +1,149 @@
+"""
+In-process filter of the environment keys that exist.
+
+Requests with keys that don't exist (e.g. from bots or misconfigured clients)
+would otherwise need a round trip to the environment cache and a query to the
+database before they can be rejected. When `ENVIRONMENT_KEY_FILTER_ENABLED` is
+set, each process keeps a bloom filter of all the environment keys (client and
+server side) so that most unknown keys can be rejected without either. Keys
+that get past the filter (false positives, or keys that have been deleted since
+the filter was built) fall through to the database and `bad_environments_cache`.
+
+The filter is rebuilt whenever keys are created or deleted in any process. This
+is tracked by a version stored in the environment cache, which each process
+checks at most every `ENVIRONMENT_KEY_FILTER_REFRESH_SECONDS`, so a new key can
+be rejected by other processes for up to that long after it is created.
+
+The version is only seen by other processes if the environment cache is shared
+between them (e.g. redis or memcached, rather than the default local memory
+cache), so each process also rebuilds its filter once it is older than
+`ENVIRONMENT_KEY_FILTER_MAX_AGE_SECONDS`, whatever the version.
+"""
+import hashlib
+import math
+import threading
+import time
+import typing
+
+from django.conf import settings
+from django.core.cache import caches
+
+environment_cache = caches[settings.ENVIRONMENT_CACHE_NAME]
+
+_VERSION_CACHE_KEY = "environment-keys-filter-version"
+
+
+class BloomFilter:
+    __slots__ = ("_bits", "_size", "_hash_count")
+
+    def __init__(self, capacity: int, false_positive_rate: float) -> None:
+        capacity = max(capacity, 1)
+        self._size = max(
+            int(-capacity * math.log(false_positive_rate) / math.log(2) ** 2), 8
+        )
+        self._hash_count = max(round(self._size / capacity * math.log(2)), 1)
+        self._bits = bytearray((self._size + 7) // 8)
+
+    def add(self, key: str) -> None:
+        for position in self._get_positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._get_positions(key)
+        )
+
+    def _get_positions(self, key: str) -> typing.Iterator[int]:
+        # derive all the hashes from two halves of a single digest
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        first_hash = int.from_bytes(digest[:8], "little")
+        second_hash = int.from_bytes(digest[8:], "little")
+        for i in range(self._hash_count):
+            yield (first_hash + i * second_hash) % self._size
+
+
+class EnvironmentKeyFilter:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._bloom_filter: typing.Optional[BloomFilter] = None
+        self._version = None
+        self._checked_at = 0.0
+        self._built_at = 0.0
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return settings.ENVIRONMENT_KEY_FILTER_ENABLED
+
+    def might_exist(self, api_key: str) -> bool:
+        """
+        Return False if the key definitely doesn't exist.
+        """
+        if not self.is_enabled():
+            return True
+
+        return api_key in self._get_bloom_filter()
+
+    def add(self, api_key: str) -> None:
+        """
+        Add a newly created key to the filter in this process and make the other
+        processes rebuild theirs.
+        """
+        with self._lock:
+            if self._bloom_filter is not None:
+                self._bloom_filter.add(api_key)
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        """
+        Make all processes rebuild their filter the next time they check it.
+        """
+        environment_cache.set(_VERSION_CACHE_KEY, time.time_ns(), timeout=None)
+        # this process doesn't need to wait to check it
+        self._checked_at = 0.0
+
+    def _get_bloom_filter(self) -> BloomFilter:
+        bloom_filter = self._bloom_filter
+        if (
+            bloom_filter is not None
+            and time.monotonic()
+            < self._checked_at + settings.ENVIRONMENT_KEY_FILTER_REFRESH_SECONDS
+        ):
+            return bloom_filter
+
+        with self._lock:
+            checked_at = time.monotonic()
+            # read the version before reading the keys so that any keys created
+            # while the filter is being built change it
+            version = environment_cache.get(_VERSION_CACHE_KEY)
+            if (
+                self._bloom_filter is None
+                or version != self._version
+                or checked_at
+                >= self._built_at + settings.ENVIRONMENT_KEY_FILTER_MAX_AGE_SECONDS
+            ):
+                self._bloom_filter = self._build_bloom_filter()
+                self._version = version
+                self._built_at = checked_at
+            self._checked_at = checked_at
+            return self._bloom_filter
+
+    @staticmethod
+    def _build_bloom_filter() -> BloomFilter:
+        from environments.models import Environment, EnvironmentAPIKey
+
+        api_keys = [
+            *Environment.objects.values_list("api_key", flat=True),
+            *EnvironmentAPIKey.objects.values_list("key", flat=True),
+        ]
+        # leave room for the keys that are added before the filter is rebuilt
+        bloom_filter = BloomFilter(
+            capacity=len(api_keys) * 2,
+            false_positive_rate=settings.ENVIRONMENT_KEY_FILTER_FALSE_POSITIVE_RATE,
+        )
+        for api_key in api_keys:
+            bloom_filter.add(api_key)
+        return bloom_filter
+
+
+environment_key_filter = EnvironmentKeyFilter()
@@ -0,0 +1,139 @@
+"""
+Compact record of an environment for the SDK endpoints.
+
+Every request to the SDK endpoints gets the environment for its key from the
+environment cache (see `Environment.get_from_cache`). Rather than caching the
+pickled `Environment` instance, along with its project, organisation and
+integration configurations, `EnvironmentAuthRecord` stores just the field values
+of each of them as tuples, and builds the model instances from them, as if they
+had been read from the database, when it is used. This keeps the cached payload
+small and means that each request gets its own instances.
+"""
+import typing
+from functools import lru_cache
+
+from django.db import models
+
+if typing.TYPE_CHECKING:
+    from environments.models import Environment
+
+# the integration configurations that are needed to identify users in the SDK
+# endpoints, which are selected along with the environment
+INTEGRATION_CONFIG_RELATED_NAMES = (
+    "mixpanel_config",
+    "segment_config",
+    "amplitude_config",
+    "heap_config",
+    "dynatrace_config",
+)
+
+# environment fields that aren't needed by the SDK endpoints
+ENVIRONMENT_DEFERRED_FIELDS = ("description",)
+
+FieldValues = typing.Tuple[typing.Any, ...]
+
+
+class EnvironmentAuthRecord:
+    __slots__ = (
+        "db",
+        "environment_values",
+        "project_values",
+        "organisation_values",
+        "integration_config_values",
+    )
+
+    def __init__(
+        self,
+        db: str,
+        environment_values: FieldValues,
+        project_values: FieldValues,
+        organisation_values: FieldValues,
+        integration_config_values: typing.Tuple[typing.Optional[FieldValues], ...],
+    ) -> None:
+        self.db = db
+        self.environment_values = environment_values
+        self.project_values = project_values
+        self.organisation_values = organisation_values
+        self.integration_config_values = integration_config_values
+
+    @classmethod
+    def from_environment(cls, environment: "Environment") -> "EnvironmentAuthRecord":
+        """
+        Build the record from an environment that has been read from the
+        database with its project, organisation and integration configurations
+        selected.
+        """
+        integration_config_values = []
+        for related_name in INTEGRATION_CONFIG_RELATED_NAMES:
+            config = getattr(environment, related_name, None)
+            integration_config_values.append(
+                _get_field_values(config) if config is not None else None
+            )
+
+        return cls(
+            db=environment._state.db,
+            environment_values=_get_field_values(
+                environment, ENVIRONMENT_DEFERRED_FIELDS
+            ),
+            project_values=_get_field_values(environment.project),
+            organisation_values=_get_field_values(environment.project.organisation),
+            integration_config_values=tuple(integration_config_values),
+        )
+
+    def get_environment(self) -> "Environment":
+        from environments.models import Environment
+
+        environment = self._from_values(
+            Environment, self.environment_values, ENVIRONMENT_DEFERRED_FIELDS
+        )
+        project_field = Environment._meta.get_field("project")
+        project = self._from_values(project_field.related_model, self.project_values)
+        organisation_field = project._meta.get_field("organisation")
+        organisation = self._from_values(
+            organisation_field.related_model, self.organisation_values
+        )
+
+        organisation_field.set_cached_value(project, organisation)
+        project_field.set_cached_value(environment, project)
+
+        for related_name, values in zip(
+            INTEGRATION_CONFIG_RELATED_NAMES, self.integration_config_values
+        ):
+            relation = Environment._meta.get_field(related_name)
+            config = None
+            if values is not None:
+                config = self._from_values(relation.related_model, values)
+                relation.field.set_cached_value(config, environment)
+            # cache missing configurations too so that accessing them doesn't
+            # query the database
+            relation.set_cached_value(environment, config)
+
+        return environment
+
+    def _from_values(
+        self,
+        model: typing.Type[models.Model],
+        values: FieldValues,
+        deferred_fields: typing.Tuple[str, ...] = (),
+    ) -> models.Model:
+        return model.from_db(self.db, _get_field_names(model, deferred_fields), values)
+
+
+@lru_cache()
+def _get_field_names(
+    model: typing.Type[models.Model], deferred_fields: typing.Tuple[str, ...] = ()
+) -> typing.Tuple[str, ...]:
+    return tuple(
+        field.attname
+        for field in model._meta.concrete_fields
+        if field.name not in deferred_fields
+    )
+
+
+def _get_field_values(
+    instance: models.Model, deferred_fields: typing.Tuple[str, ...] = ()
+) -> FieldValues:
+    return tuple(
+        getattr(instance, field_name)
+        for field_name in _get_field_names(type(instance), deferred_fields)
+    )
@@ -0,0 +1,252 @@
+"""
+Incremental updates to the environment documents stored in dynamodb.
+
+Rebuilding an environment document reads (and maps) every feature state and
+segment in the project, which is slow for large projects. Most changes only
+affect a single feature or segment though, so, for those, the document that is
+already stored is patched by replacing only the parts of it that were built
+from the changed object (see `get_environment_document_patch`).
+
+Any other change (e.g. to the environment itself, or to its integrations) or
+any change that the patch can't be applied to (e.g. because the document
+doesn't exist yet) falls back to rebuilding the whole document.
+"""
+import typing
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from dataclasses import dataclass
+
+from django.db.models import Prefetch, QuerySet
+from flag_engine.segments.models import SegmentModel
+
+from audit.related_object_type import RelatedObjectType
+from features.models import FeatureState
+from features.multivariate.models import MultivariateFeatureStateValue
+from segments.models import Segment
+from util.mappers import map_engine_model_to_document
+from util.mappers.dynamodb import Document
+from util.mappers.engine import (
+    map_feature_states_to_engine,
+    map_segment_rule_to_engine,
+)
+
+if typing.TYPE_CHECKING:
+    from audit.models import AuditLog
+    from environments.models import Environment
+
+
+class EnvironmentDocumentPatch(ABC):
+    @abstractmethod
+    def apply(
+        self, document: Document, environment: "Environment"
+    ) -> typing.Optional[Document]:
+        """
+        Patch the (previous) document for the environment, returning None if
+        the document needs to be rebuilt instead.
+        """
+
+
+@dataclass(frozen=True)
+class FeatureDocumentPatch(EnvironmentDocumentPatch):
+    """
+    Replaces the environment and segment override feature states for a feature.
+    """
+
+    feature_id: int
+
+    def apply(
+        self, document: Document, environment: "Environment"
+    ) -> typing.Optional[Document]:
+        environment_feature_states = []
+        segment_feature_states = defaultdict(list)
+        for feature_state in _get_feature_states(environment).filter(
+            feature_id=self.feature_id
+        ):
+            if feature_state.feature_segment_id is None:
+                environment_feature_states.append(feature_state)
+            else:
+                segment_feature_states[feature_state.feature_segment.segment_id].append(
+                    feature_state
+                )
+
+        project_document = document["project"]
+        segment_documents_by_id = {
+            int(segment_document["id"]): segment_document
+            for segment_document in project_document["segments"]
+        }
+        if not set(segment_feature_states).issubset(segment_documents_by_id):
+            # the document is missing a segment that the feature is overridden for
+            return None
+
+        environment_feature_state_models = map_feature_states_to_engine(
+            environment_feature_states
+        )
+        _replace_feature_state_documents(
+            document["feature_states"],
+            self.feature_id,
+            map(map_engine_model_to_document, environment_feature_state_models),
+        )
+        for segment_id, segment_document in segment_documents_by_id.items():
+            _replace_feature_state_documents(
+                segment_document["feature_states"],
+                self.feature_id,
+                map(
+                    map_engine_model_to_document,
+                    map_feature_states_to_engine(
+                        segment_feature_states.get(segment_id, [])
+                    ),
+                ),
+            )
+
+        server_key_only_feature_ids = [
+            feature_id
+            for feature_id in project_document["server_key_only_feature_ids"]
+            if feature_id != self.feature_id
+        ]
+        if (
+            environment_feature_state_models
+            and environment_feature_states[0].feature.is_server_key_only
+        ):
+            server_key_only_feature_ids.append(self.feature_id)
+        project_document["server_key_only_feature_ids"] = server_key_only_feature_ids
+
+        return _set_updated_at(document, environment)
+
+
+@dataclass(frozen=True)
+class SegmentDocumentPatch(EnvironmentDocumentPatch):
+    """
+    Replaces a segment, along with its rules and overrides, in the project.
+    """
+
+    segment_id: int
+
+    def apply(
+        self, document: Document, environment: "Environment"
+    ) -> typing.Optional[Document]:
+        segment = (
+            Segment.objects.filter(
+                id=self.segment_id, project_id=environment.project_id
+            )
+            .prefetch_related(
+                "rules",
+                "rules__rules",
+                "rules__conditions",
+                "rules__rules__conditions",
+                "rules__rules__rules",
+            )
+            .first()
+        )
+
+        segment_documents = [
+            segment_document
+            for segment_document in document["project"]["segments"]
+            if segment_document["id"] != self.segment_id
+        ]
+        if segment:
+            segment_model = SegmentModel(
+                id=segment.pk,
+                name=segment.name,
+                rules=[
+                    map_segment_rule_to_engine(segment_rule)
+                    for segment_rule in segment.rules.all()
+                ],
+                feature_states=map_feature_states_to_engine(
+                    _get_feature_states(environment).filter(
+                        feature_segment__segment_id=segment.pk
+                    )
+                ),
+            )
+            segment_documents.append(map_engine_model_to_document(segment_model))
+            segment_documents.sort(key=lambda segment_document: segment_document["id"])
+        document["project"]["segments"] = segment_documents
+
+        return _set_updated_at(document, environment)
+
+
+def get_environment_document_patch(
+    audit_log: "AuditLog",
+) -> typing.Optional[EnvironmentDocumentPatch]:
+    """
+    Get the patch for the change recorded by the audit log, or None if the
+    environment documents need to be rebuilt.
+    """
+    related_object_id = audit_log.related_object_id
+    if not related_object_id:
+        return None
+
+    related_object_type = audit_log.related_object_type
+    if related_object_type == RelatedObjectType.FEATURE.name:
+        return FeatureDocumentPatch(feature_id=related_object_id)
+
+    if related_object_type == RelatedObjectType.SEGMENT.name:
+        return SegmentDocumentPatch(segment_id=related_object_id)
+
+    if related_object_type == RelatedObjectType.FEATURE_STATE.name:
+        history_record_class_path = audit_log.history_record_class_path
+        if (
+            history_record_class_path
+            == MultivariateFeatureStateValue.history_record_class_path
+        ):
+            # these are recorded against the feature rather than the feature state
+            return FeatureDocumentPatch(feature_id=related_object_id)
+
+        if history_record_class_path in (None, FeatureState.history_record_class_path):
+            feature_id = (
+                FeatureState.objects.filter(id=related_object_id)
+                .values_list("feature_id", flat=True)
+                .first()
+            )
+            if feature_id:
+                return FeatureDocumentPatch(feature_id=feature_id)
+
+    return None
+
+
+def _get_feature_states(environment: "Environment") -> "QuerySet[FeatureState]":
+    return (
+        FeatureState.objects.filter(environment=environment, identity__isnull=True)
+        .select_related("feature", "feature_state_value", "feature_segment")
+        .prefetch_related(
+            Prefetch(
+                "multivariate_feature_state_values",
+                queryset=MultivariateFeatureStateValue.objects.select_related(
+                    "multivariate_feature_option"
+                ),
+            )
+        )
+    )
+
+
+def _replace_feature_state_documents(
+    feature_state_documents: typing.List[Document],
+    feature_id: int,
+    new_feature_state_documents: typing.Iterable[Document],
+) -> None:
+    """
+    Replace the documents for the feature's feature states in place, keeping
+    their position in the list.
+    """
+    new_feature_state_documents = list(new_feature_state_documents)
+    index = next(
+        (
+            i
+            for i, feature_state_document in enumerate(feature_state_documents)
+            if feature_state_document["feature"]["id"] == feature_id
+        ),
+        len(feature_state_documents),
+    )
+    feature_state_documents[:] = [
+        *feature_state_documents[:index],
+        *new_feature_state_documents,
+        *(
+            feature_state_document
+            for feature_state_document in feature_state_documents[index:]
+            if feature_state_document["feature"]["id"] != feature_id
+        ),
+    ]
+
+
+def _set_updated_at(document: Document, environment: "Environment") -> Document:
+    document["updated_at"] = environment.updated_at.isoformat()
+    return document
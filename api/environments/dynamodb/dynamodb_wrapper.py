@@ -4,8 +4,9 @@ from contextlib import suppress
 from typing import Iterable
 
 import boto3
-from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.conditions import Attr, Key
 from botocore.config import Config
+from botocore.exceptions import ClientError
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
 from flag_engine.environments.builders import build_environment_model
@@ -19,8 +20,10 @@ from util.mappers import (
     map_environment_to_environment_document,
     map_identity_to_identity_document,
 )
+from util.renderers import parse_gzipped_json, render_gzipped_json
 
 if typing.TYPE_CHECKING:
+    from environments.dynamodb.document_patches import EnvironmentDocumentPatch
     from environments.identities.models import Identity
     from environments.models import Environment, EnvironmentAPIKey
 
@@ -144,22 +147,85 @@ class DynamoIdentityWrapper(DynamoWrapper):
 class DynamoEnvironmentWrapper(DynamoWrapper):
     table_name = settings.ENVIRONMENTS_TABLE_NAME_DYNAMO
 
+    # attribute that holds the gzipped document, see
+    # `ENVIRONMENTS_TABLE_GZIP_DOCUMENTS_DYNAMO`
+    gzipped_document_attribute = "gzipped_document"
+
     def write_environment(self, environment: "Environment"):
         self.write_environments([environment])
 
     def write_environments(self, environments: Iterable["Environment"]):
+        self.write_environment_documents(
+            map_environment_to_environment_document(environment)
+            for environment in environments
+        )
+
+    def write_environment_documents(self, environment_documents: Iterable[dict]):
         with self._table.batch_writer() as writer:
-            for environment in environments:
-                writer.put_item(
-                    Item=map_environment_to_environment_document(environment),
+            for environment_document in environment_documents:
+                writer.put_item(Item=self._get_item(environment_document))
+
+    def patch_environments(
+        self,
+        environments: Iterable["Environment"],
+        patch: "EnvironmentDocumentPatch",
+    ) -> typing.List[int]:
+        """
+        Apply the patch to the existing documents for the environments, returning
+        the ids of the environments whose documents need to be rebuilt instead.
+        """
+        environment_ids_to_rebuild = []
+        for environment in environments:
+            try:
+                document = self.get_item(environment.api_key)
+            except ObjectDoesNotExist:
+                environment_ids_to_rebuild.append(environment.id)
+                continue
+
+            previous_updated_at = document["updated_at"]
+            document = patch.apply(document, environment)
+            if document is None:
+                environment_ids_to_rebuild.append(environment.id)
+                continue
+
+            try:
+                # make sure that the document hasn't been written by another
+                # process since it was read so that its changes aren't lost
+                self._table.put_item(
+                    Item=self._get_item(document),
+                    ConditionExpression=Attr("updated_at").eq(previous_updated_at),
                 )
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                    raise
+                environment_ids_to_rebuild.append(environment.id)
+
+        return environment_ids_to_rebuild
 
     def get_item(self, api_key: str) -> dict:
         try:
-            return self._table.get_item(Key={"api_key": api_key})["Item"]
+            item = self._table.get_item(Key={"api_key": api_key})["Item"]
         except KeyError as e:
             raise ObjectDoesNotExist() from e
 
+        if self.gzipped_document_attribute in item:
+            gzipped_document = item[self.gzipped_document_attribute]
+            return parse_gzipped_json(
+                getattr(gzipped_document, "value", gzipped_document)
+            )
+        return item
+
+    def _get_item(self, document: dict) -> dict:
+        if not settings.ENVIRONMENTS_TABLE_GZIP_DOCUMENTS_DYNAMO:
+            return document
+
+        return {
+            "api_key": document["api_key"],
+            # needed to write patched documents conditionally
+            "updated_at": document["updated_at"],
+            self.gzipped_document_attribute: render_gzipped_json(document),
+        }
+
 
 class DynamoEnvironmentAPIKeyWrapper(DynamoWrapper):
     table_name = settings.ENVIRONMENTS_API_KEY_TABLE_NAME_DYNAMO
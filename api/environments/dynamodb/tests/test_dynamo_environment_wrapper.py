@@ -1,9 +1,12 @@
+import json
+
 import pytest
 from django.core.exceptions import ObjectDoesNotExist
 
 from environments.dynamodb import DynamoEnvironmentWrapper
 from environments.models import Environment
 from util.mappers import map_environment_to_environment_document
+from util.renderers import render_json
 
 
 def test_write_environments_calls_internal_methods_with_correct_arguments(
@@ -59,3 +62,34 @@ def test_get_item_raises_object_does_not_exists_if_get_item_does_not_return_any_
     # Then
     with pytest.raises(ObjectDoesNotExist):
         dynamo_environment_wrapper.get_item(api_key)
+
+
+def test_write_environments_writes_gzipped_documents_if_configured(
+    mocker, settings, project, environment
+):
+    # Given
+    settings.ENVIRONMENTS_TABLE_GZIP_DOCUMENTS_DYNAMO = True
+    dynamo_environment_wrapper = DynamoEnvironmentWrapper()
+    mocked_dynamo_table = mocker.patch.object(dynamo_environment_wrapper, "_table")
+
+    expected_environment_document = map_environment_to_environment_document(environment)
+    environments = Environment.objects.filter(id=environment.id)
+
+    # When
+    dynamo_environment_wrapper.write_environments(environments)
+
+    # Then
+    mocked_put_item = (
+        mocked_dynamo_table.batch_writer.return_value.__enter__.return_value.put_item
+    )
+    _, kwargs = mocked_put_item.call_args
+    item = kwargs["Item"]
+    assert set(item) == {"api_key", "updated_at", "gzipped_document"}
+    assert item["api_key"] == environment.api_key
+
+    # and the document is decoded when it is read
+    mocked_dynamo_table.get_item.return_value = {"Item": {**item}}
+    document = dynamo_environment_wrapper.get_item(environment.api_key)
+    assert json.loads(render_json(document)) == json.loads(
+        render_json(expected_environment_document)
+    )
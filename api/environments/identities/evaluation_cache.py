@@ -0,0 +1,261 @@
+"""
+Cache of the data needed to evaluate the flags for an identity in memory.
+
+With in-memory evaluation (see `environments.sdk.evaluation`), the only data
+that the SDK identities endpoint needs from the database is the identity itself,
+its traits and its overrides. This module caches a compact record of these,
+keyed on the environment and identifier, so that repeat requests for the same
+identity don't need to read from the database at all.
+
+Each identity also has a version, stored under its own key, which is changed
+whenever the identity's traits or overrides are written to. A record is only
+used while its version matches the identity's current version (and it was built
+from the current version of the environment) so a record that was being built
+while the identity was written to is never used. Trait writes made by
+`Identity.update_traits` and `Identity.generate_traits` update the cached record
+in place (write-through) rather than just invalidating it. The version is also
+used as the ETag for the identity (see `environments.sdk.etags`).
+
+Writes are only tracked when they are made through the API, and concurrent
+writes to the same identity may leave a record that doesn't include all of them,
+so entries expire after `CACHE_IDENTITY_EVALUATION_SECONDS` to bound how long
+they can be stale for.
+"""
+import hashlib
+import time
+import typing
+
+from django.conf import settings
+from django.core.cache import caches
+
+from environments.identities.traits.models import Trait
+from util.mappers.engine import map_identity_to_engine
+
+if typing.TYPE_CHECKING:
+    import datetime
+
+    from flag_engine.features.models import FeatureStateModel
+
+    from environments.identities.models import Identity
+    from environments.models import Environment
+
+identity_evaluation_cache = caches[settings.IDENTITY_EVALUATION_CACHE_NAME]
+
+_TRAIT_FIELD_NAMES = tuple(field.attname for field in Trait._meta.concrete_fields)
+
+
+def is_identity_evaluation_cache_enabled() -> bool:
+    return settings.CACHE_IDENTITY_EVALUATION_SECONDS > 0
+
+
+class IdentityEvaluationRecord:
+    __slots__ = (
+        "identity_id",
+        "created_date",
+        "environment_updated_at",
+        "identity_features",
+        "trait_values",
+        "version",
+    )
+
+    def __init__(
+        self,
+        identity_id: int,
+        created_date: "datetime.datetime",
+        environment_updated_at: float,
+        identity_features: typing.List["FeatureStateModel"],
+        traits: typing.Iterable[Trait],
+        version: int,
+    ) -> None:
+        self.identity_id = identity_id
+        self.created_date = created_date
+        self.environment_updated_at = environment_updated_at
+        self.identity_features = identity_features
+        self.trait_values = tuple(
+            tuple(getattr(trait, field_name) for field_name in _TRAIT_FIELD_NAMES)
+            for trait in traits
+        )
+        self.version = version
+
+    def get_identity(self, environment: "Environment", identifier: str) -> "Identity":
+        """
+        Get an identity instance for the record, with its traits prefetched, so
+        that the identity and its traits can be used (and updated) as if they had
+        been read from the database.
+        """
+        from environments.identities.models import Identity
+
+        identity = Identity.from_db(
+            None,
+            ("id", "identifier", "created_date", "environment_id"),
+            (self.identity_id, identifier, self.created_date, environment.id),
+        )
+        identity.environment = environment
+
+        traits = []
+        for values in self.trait_values:
+            trait = Trait.from_db(None, _TRAIT_FIELD_NAMES, values)
+            trait.identity = identity
+            traits.append(trait)
+
+        # populate the prefetch cache in the same way as prefetch_related would
+        queryset = identity.identity_traits.all()
+        queryset._result_cache = traits
+        queryset._prefetch_done = True
+        identity._prefetched_objects_cache = {"identity_traits": queryset}
+
+        return identity
+
+    def with_traits(
+        self, traits: typing.Iterable[Trait], version: int
+    ) -> "IdentityEvaluationRecord":
+        return IdentityEvaluationRecord(
+            identity_id=self.identity_id,
+            created_date=self.created_date,
+            environment_updated_at=self.environment_updated_at,
+            identity_features=self.identity_features,
+            traits=traits,
+            version=version,
+        )
+
+
+def get_identity_evaluation_record(
+    environment: "Environment", identifier: str
+) -> typing.Optional[IdentityEvaluationRecord]:
+    """
+    Get the record for the given identity, or None if the identity doesn't exist.
+    """
+    record, _ = _get_identity_evaluation_record(environment, identifier, create=False)
+    return record
+
+
+def get_or_create_identity_evaluation_record(
+    environment: "Environment", identifier: str
+) -> typing.Tuple[IdentityEvaluationRecord, bool]:
+    """
+    Get the record for the given identity, creating the identity if it doesn't
+    exist, and whether the identity was created.
+    """
+    return _get_identity_evaluation_record(environment, identifier, create=True)
+
+
+def update_identity_evaluation_record_traits(
+    identity: "Identity", traits: typing.Iterable[Trait]
+) -> None:
+    """
+    Update the cached record for the given identity with the full list of its
+    traits after they have been written to the database.
+    """
+    if not is_identity_evaluation_cache_enabled():
+        return
+
+    record_key, version_key = _get_cache_keys(
+        identity.environment_id, identity.identifier
+    )
+    cached_values = identity_evaluation_cache.get_many([record_key, version_key])
+    record = cached_values.get(record_key)
+
+    version = _get_new_version()
+    values = {version_key: version}
+    if record is not None and record.version == cached_values.get(version_key):
+        values[record_key] = record.with_traits(traits, version)
+
+    identity_evaluation_cache.set_many(
+        values, timeout=settings.CACHE_IDENTITY_EVALUATION_SECONDS
+    )
+
+
+def invalidate_identity_evaluation_records(
+    identities: typing.Iterable["Identity"],
+) -> None:
+    """
+    Change the version of the given identities so that any cached records for
+    them are no longer used.
+    """
+    if not is_identity_evaluation_cache_enabled():
+        return
+
+    version = _get_new_version()
+    identity_evaluation_cache.set_many(
+        {
+            _get_cache_keys(identity.environment_id, identity.identifier)[1]: version
+            for identity in identities
+        },
+        timeout=settings.CACHE_IDENTITY_EVALUATION_SECONDS,
+    )
+
+
+def _get_identity_evaluation_record(
+    environment: "Environment", identifier: str, create: bool
+) -> typing.Tuple[typing.Optional[IdentityEvaluationRecord], bool]:
+    from environments.identities.models import Identity
+    from environments.sdk.evaluation import get_identity_features_prefetch
+
+    record_key, version_key = _get_cache_keys(environment.id, identifier)
+    cached_values = identity_evaluation_cache.get_many([record_key, version_key])
+    record = cached_values.get(record_key)
+    version = cached_values.get(version_key)
+
+    environment_updated_at = environment.updated_at.timestamp()
+    if (
+        record is not None
+        and record.version == version
+        and record.environment_updated_at == environment_updated_at
+    ):
+        return record, False
+
+    if version is None:
+        # set the version before reading from the database so that any writes
+        # made while the record is being built will change it
+        version = _get_new_version()
+        identity_evaluation_cache.set(
+            version_key, version, timeout=settings.CACHE_IDENTITY_EVALUATION_SECONDS
+        )
+
+    queryset = Identity.objects.prefetch_related(
+        "identity_traits", get_identity_features_prefetch()
+    )
+    if create:
+        identity, created = queryset.get_or_create(
+            identifier=identifier, environment=environment
+        )
+    else:
+        identity = queryset.filter(
+            identifier=identifier, environment=environment
+        ).first()
+        if identity is None:
+            return None, False
+        created = False
+
+    if created:
+        identity_features, traits = [], []
+    else:
+        identity.environment = environment
+        identity_features = list(map_identity_to_engine(identity).identity_features)
+        traits = identity.identity_traits.all()
+
+    record = IdentityEvaluationRecord(
+        identity_id=identity.id,
+        created_date=identity.created_date,
+        environment_updated_at=environment_updated_at,
+        identity_features=identity_features,
+        traits=traits,
+        version=version,
+    )
+    identity_evaluation_cache.set(
+        record_key, record, timeout=settings.CACHE_IDENTITY_EVALUATION_SECONDS
+    )
+    return record, created
+
+
+def _get_cache_keys(environment_id: int, identifier: str) -> typing.Tuple[str, str]:
+    # identifiers can contain characters that aren't valid in memcached keys
+    identifier_hash = hashlib.md5(identifier.encode("utf-8")).hexdigest()
+    key_prefix = f"{environment_id}:{identifier_hash}"
+    return f"{key_prefix}:identity-record", f"{key_prefix}:identity-version"
+
+
+def _get_new_version() -> int:
+    # use the time so that the version never goes back to a previous value if
+    # the key is evicted from the cache
+    return time.time_ns()
@@ -1,6 +1,53 @@
+import typing
+
 from django.db.models import Manager
 
+if typing.TYPE_CHECKING:
+    from environments.identities.models import Identity
+    from environments.models import Environment
+
 
 class IdentityManager(Manager):
     def get_by_natural_key(self, identifier, environment_api_key):
         return self.get(identifier=identifier, environment__api_key=environment_api_key)
+
+    def get_or_create_in_bulk(
+        self, environment: "Environment", identifiers: typing.Iterable[str]
+    ) -> typing.Tuple[typing.Dict[str, "Identity"], typing.Set[str]]:
+        """
+        Get or create the identities with the given identifiers in the given
+        environment using a fixed number of queries.
+
+        :return: tuple of the identities keyed on identifier and the set of
+            identifiers for which a new identity was created
+        """
+        identifiers = set(identifiers)
+        existing_identifiers = set(
+            self.filter(
+                environment=environment, identifier__in=identifiers
+            ).values_list("identifier", flat=True)
+        )
+        created_identifiers = identifiers - existing_identifiers
+
+        if created_identifiers:
+            # use ignore_conflicts to handle any identities that were created by a
+            # concurrent request since the query above.
+            self.bulk_create(
+                [
+                    self.model(identifier=identifier, environment=environment)
+                    for identifier in created_identifiers
+                ],
+                ignore_conflicts=True,
+            )
+
+        identities = {
+            identity.identifier: identity
+            for identity in self.filter(
+                environment=environment, identifier__in=identifiers
+            )
+        }
+        for identity in identities.values():
+            # avoid further queries to get the environment
+            identity.environment = environment
+
+        return identities, created_identifiers
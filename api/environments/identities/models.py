@@ -1,14 +1,20 @@
 import typing
+from collections import defaultdict
 
-from django.db import models
+from django.db import IntegrityError, connection, models, transaction
 from django.db.models import Prefetch, Q
 from django.utils import timezone
 
+from environments.identities.evaluation_cache import (
+    invalidate_identity_evaluation_records,
+    update_identity_evaluation_record_traits,
+)
 from environments.identities.managers import IdentityManager
 from environments.identities.traits.models import Trait
 from environments.models import Environment
-from features.models import FeatureState
+from features.models import FeatureSegment, FeatureState
 from features.multivariate.models import MultivariateFeatureStateValue
+from segments.evaluator import get_traits_by_key
 from segments.models import Segment
 
 
@@ -51,6 +57,7 @@ class Identity(models.Model):
         self,
         traits: list[Trait] | None = None,
         additional_filters: Q | None = None,
+        feature_name: str | None = None,
     ) -> list[FeatureState]:
         """
         Get all feature states for an identity. This method returns a single flag for
@@ -61,10 +68,15 @@ class Identity(models.Model):
             2. Segment - flag overridden for a segment this identity belongs to
             3. Environment - default value for the environment
 
+        If feature_name is provided, only the flag for the feature with that name is
+        evaluated (and returned).
+
         :return: (list) flags for an identity with the correct values based on
             identity / segment priorities
         """
-        segments = self.get_segments(traits=traits, overrides_only=True)
+        segments = self.get_segments(
+            traits=traits, overrides_only=True, feature_name=feature_name
+        )
 
         # define sub queries
         belongs_to_environment_query = Q(environment=self.environment)
@@ -92,6 +104,9 @@ class Identity(models.Model):
         if additional_filters:
             full_query &= additional_filters
 
+        if feature_name:
+            full_query &= Q(feature__name=feature_name)
+
         select_related_args = [
             "feature",
             "feature_state_value",
@@ -131,28 +146,48 @@ class Identity(models.Model):
         return list(identity_flags.values())
 
     def get_segments(
-        self, traits: typing.List[Trait] = None, overrides_only: bool = False
+        self,
+        traits: typing.List[Trait] = None,
+        overrides_only: bool = False,
+        feature_name: str = None,
     ) -> typing.List[Segment]:
         """
         Get the list of segments this identity is a part of.
 
         :param traits: override the identity's traits when evaluating segments
         :param overrides_only: only retrieve the segments which have a valid override in the environment
+        :param feature_name: only retrieve the segments which have an override for the given feature
+            in the environment (requires overrides_only)
         :return: List of matching segments
         """
-        matching_segments = []
         traits = self.identity_traits.all() if traits is None else traits
+        traits_by_key = get_traits_by_key(traits)
 
         if overrides_only:
-            all_segments = self.environment.get_segments_from_cache()
+            segment_index = self.environment.get_segment_index_from_cache()
         else:
-            all_segments = self.environment.project.get_segments_from_cache()
+            segment_index = self.environment.project.get_segment_index_from_cache()
 
-        for segment in all_segments:
-            if segment.does_identity_match(self, traits=traits):
-                matching_segments.append(segment)
+        # only evaluate the segments that could match given the identity's traits
+        candidate_segments = segment_index.get_candidate_segments(traits_by_key)
 
-        return matching_segments
+        if overrides_only and feature_name:
+            overriding_segment_ids = set(
+                FeatureSegment.objects.filter(
+                    environment=self.environment, feature__name=feature_name
+                ).values_list("segment_id", flat=True)
+            )
+            candidate_segments = [
+                segment
+                for segment in candidate_segments
+                if segment.id in overriding_segment_ids
+            ]
+
+        return [
+            segment
+            for segment in candidate_segments
+            if segment.get_compiled_segment().matches(traits_by_key, self)
+        ]
 
     def get_all_user_traits(self):
         # this is pointless, we should probably replace all uses with the below code
@@ -189,6 +224,7 @@ class Identity(models.Model):
 
         if persist:
             Trait.objects.bulk_create(trait_models)
+            update_identity_evaluation_record_traits(self, trait_models)
 
         return trait_models
 
@@ -198,7 +234,7 @@ class Identity(models.Model):
         Return the full list of traits for the given identity after these changes.
 
         :param trait_data_items: list of dictionaries validated by TraitSerializerFull
-        :return: queryset of updated trait models
+        :return: list of trait models
         """
         current_traits = {t.trait_key: t for t in self.identity_traits.all()}
 
@@ -214,6 +250,7 @@ class Identity(models.Model):
                 # build a list of trait keys to delete having been nulled by the
                 # input data
                 keys_to_delete.append(trait_key)
+                current_traits.pop(trait_key, None)
                 continue
 
             trait_value_data = Trait.generate_trait_value_data(trait_value)
@@ -221,7 +258,10 @@ class Identity(models.Model):
             if trait_key in current_traits:
                 current_trait = current_traits[trait_key]
                 # Don't update the trait if the value hasn't changed
-                if current_trait.trait_value == trait_value:
+                if all(
+                    getattr(current_trait, attr) == value
+                    for attr, value in trait_value_data.items()
+                ):
                     continue
 
                 for attr, value in trait_value_data.items():
@@ -238,12 +278,134 @@ class Identity(models.Model):
 
         Trait.objects.bulk_update(updated_traits, fields=Trait.BULK_UPDATE_FIELDS)
 
-        # use ignore_conflicts to handle race conditions which result in IntegrityError if another request
-        # has added a particular trait_key for the identity while this method has been determining what to
-        # update or create.
-        # See: https://github.com/Flagsmith/flagsmith/issues/370
+        if not (keys_to_delete or updated_traits or new_traits):
+            return list(current_traits.values())
+
+        if new_traits and not self._create_traits(new_traits):
+            traits = list(Trait.objects.filter(identity=self))
+        else:
+            # current_traits is ordered by id and the new traits are created last,
+            # so this matches the order of the traits as stored in the database
+            traits = [*current_traits.values(), *new_traits]
+
+        update_identity_evaluation_record_traits(self, traits)
+        return traits
+
+    @staticmethod
+    def _create_traits(traits: typing.List[Trait]) -> bool:
+        """
+        Create the given traits, returning whether they have been given their
+        primary keys by the database.
+        """
+        try:
+            # don't use ignore_conflicts here so that the database sets the
+            # primary keys of the created traits (where supported)
+            with transaction.atomic():
+                Trait.objects.bulk_create(traits)
+        except IntegrityError:
+            # another request has added a particular trait_key for the identity
+            # while this method has been determining what to update or create.
+            # See: https://github.com/Flagsmith/flagsmith/issues/370
+            Trait.objects.bulk_create(traits, ignore_conflicts=True)
+            return False
+
+        return connection.features.can_return_rows_from_bulk_insert
+
+    def get_updated_traits(self, trait_data_items) -> typing.List[Trait]:
+        """
+        Given a list of traits, apply them to the identity's current traits in memory
+        (without persisting them) and return the full list of traits for the identity.
+
+        :param trait_data_items: list of dictionaries validated by TraitSerializerFull
+        :return: list of trait models
+        """
+        current_traits = {t.trait_key: t for t in self.identity_traits.all()}
+
+        for trait_data_item in trait_data_items:
+            trait_key = trait_data_item["trait_key"]
+            trait_value = trait_data_item["trait_value"]
+
+            if trait_value is None:
+                current_traits.pop(trait_key, None)
+                continue
+
+            trait_value_data = Trait.generate_trait_value_data(trait_value)
+            if trait_key in current_traits:
+                for attr, value in trait_value_data.items():
+                    setattr(current_traits[trait_key], attr, value)
+            else:
+                current_traits[trait_key] = Trait(
+                    **trait_value_data, trait_key=trait_key, identity=self
+                )
+
+        return list(current_traits.values())
+
+    @classmethod
+    def bulk_update_traits(
+        cls,
+        trait_data_items_by_identity: typing.Dict["Identity", typing.List[dict]],
+    ) -> None:
+        """
+        Equivalent of `update_traits` for many identities using a fixed number of
+        queries, regardless of the number of identities.
+
+        :param trait_data_items_by_identity: dictionary of identity to a list of
+            dictionaries validated by TraitSerializerFull
+        """
+        current_traits = defaultdict(dict)
+        for trait in Trait.objects.filter(
+            identity__in=trait_data_items_by_identity.keys()
+        ):
+            current_traits[trait.identity_id][trait.trait_key] = trait
+
+        delete_filter_query = Q()
+        new_traits = []
+        updated_traits = []
+
+        for identity, trait_data_items in trait_data_items_by_identity.items():
+            identity_traits = current_traits[identity.id]
+            keys_to_delete = []
+
+            for trait_data_item in trait_data_items:
+                trait_key = trait_data_item["trait_key"]
+                trait_value = trait_data_item["trait_value"]
+
+                if trait_value is None:
+                    keys_to_delete.append(trait_key)
+                    continue
+
+                trait_value_data = Trait.generate_trait_value_data(trait_value)
+
+                if trait_key in identity_traits:
+                    current_trait = identity_traits[trait_key]
+                    # Don't update the trait if the value hasn't changed
+                    if all(
+                        getattr(current_trait, attr) == value
+                        for attr, value in trait_value_data.items()
+                    ):
+                        continue
+
+                    for attr, value in trait_value_data.items():
+                        setattr(current_trait, attr, value)
+                    updated_traits.append(current_trait)
+                else:
+                    new_traits.append(
+                        Trait(
+                            **trait_value_data, trait_key=trait_key, identity=identity
+                        )
+                    )
+
+            if keys_to_delete:
+                delete_filter_query |= Q(
+                    identity=identity, trait_key__in=keys_to_delete
+                )
+
+        if delete_filter_query:
+            Trait.objects.filter(delete_filter_query).delete()
+
+        Trait.objects.bulk_update(updated_traits, fields=Trait.BULK_UPDATE_FIELDS)
+
+        # see update_traits for why we use ignore_conflicts here
         Trait.objects.bulk_create(new_traits, ignore_conflicts=True)
 
-        # return the full list of traits for this identity by refreshing from the db
-        # TODO: handle this in the above logic to avoid a second hit to the DB
-        return self.identity_traits.all()
+        invalidate_identity_evaluation_records(trait_data_items_by_identity)
@@ -63,6 +63,10 @@ class SDKIdentitiesResponseSerializer(serializers.Serializer):
     traits = serializers.ListSerializer(child=_TraitSerializer())
 
 
+class SDKBulkIdentitiesResponseSerializer(SDKIdentitiesResponseSerializer):
+    identifier = serializers.CharField()
+
+
 class SDKIdentitiesQuerySerializer(serializers.Serializer):
     identifier = serializers.CharField(required=True)
 
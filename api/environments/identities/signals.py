@@ -0,0 +1,32 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from environments.identities.evaluation_cache import (
+    invalidate_identity_evaluation_records,
+    is_identity_evaluation_cache_enabled,
+)
+from environments.identities.models import Identity
+from environments.identities.traits.models import Trait
+from features.models import FeatureState
+
+
+@receiver(post_save, sender=Trait)
+def invalidate_identity_evaluation_record_for_trait(instance, **kwargs):
+    if is_identity_evaluation_cache_enabled():
+        invalidate_identity_evaluation_records([instance.identity])
+
+
+@receiver(post_delete, sender=Identity)
+def invalidate_identity_evaluation_record_for_identity(instance, **kwargs):
+    invalidate_identity_evaluation_records([instance])
+
+
+@receiver(post_save, sender=FeatureState)
+@receiver(post_delete, sender=FeatureState)
+def invalidate_identity_evaluation_record_for_identity_override(instance, **kwargs):
+    if instance.identity_id and is_identity_evaluation_cache_enabled():
+        invalidate_identity_evaluation_records(
+            Identity.objects.filter(id=instance.identity_id).only(
+                "identifier", "environment_id"
+            )
+        )
@@ -0,0 +1,28 @@
+import typing
+
+from environments.identities.models import Identity
+from environments.models import Environment
+from task_processor.decorators import register_task_handler
+
+
+@register_task_handler()
+def persist_identity_traits(
+    environment_id: int, identity_trait_items: typing.Dict[str, typing.List[dict]]
+) -> None:
+    """
+    Create any missing identities and upsert the given traits for them, using a
+    fixed number of queries regardless of the number of identities.
+
+    :param identity_trait_items: dictionary of identifier to a list of trait data
+        items, in the form {"trait_key": "key", "trait_value": "value"}
+    """
+    environment = Environment.objects.get(id=environment_id)
+    identities, _ = Identity.objects.get_or_create_in_bulk(
+        environment, identity_trait_items.keys()
+    )
+    Identity.bulk_update_traits(
+        {
+            identities[identifier]: trait_data_items
+            for identifier, trait_data_items in identity_trait_items.items()
+        }
+    )
@@ -2,10 +2,29 @@ import typing
 
 from core.constants import BOOLEAN, FLOAT, INTEGER, STRING
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import F
+from django.utils import timezone
 
 from environments.identities.traits.exceptions import TraitPersistenceError
 
+if typing.TYPE_CHECKING:
+    from environments.identities.models import Identity
+
+# increment the value of an integer trait, creating it if it doesn't exist, in a
+# single statement. An existing trait that isn't an integer is left unchanged, in
+# which case no row is returned.
+_INCREMENT_TRAIT_VALUE_SQL = """
+    INSERT INTO environments_trait
+        (identity_id, trait_key, value_type, integer_value, created_date)
+    VALUES (%s, %s, %s, %s, %s)
+    ON CONFLICT (trait_key, identity_id) DO UPDATE
+    SET integer_value = COALESCE(environments_trait.integer_value, 0)
+        + EXCLUDED.integer_value
+    WHERE environments_trait.value_type = EXCLUDED.value_type
+    RETURNING id, integer_value, created_date
+"""
+
 
 class Trait(models.Model):
     TRAIT_VALUE_TYPES = (
@@ -113,6 +132,64 @@ class Trait(models.Model):
     def __str__(self):
         return "Identity: %s - %s" % (self.identity.identifier, self.trait_key)
 
+    @classmethod
+    def increment_value(
+        cls, identity: "Identity", trait_key: str, increment_by: int
+    ) -> typing.Optional["Trait"]:
+        """
+        Atomically increment the value of an integer trait for the identity,
+        creating the trait with a value of `increment_by` if it doesn't exist.
+
+        :return: the trait with its new value, or None if the trait exists but is
+            not an integer
+        """
+        if not identity.environment.project.organisation.persist_trait_data:
+            raise TraitPersistenceError(
+                "Not possible to persist traits for this organisation."
+            )
+
+        if connection.vendor != "postgresql":
+            return cls._increment_value_with_lock(identity, trait_key, increment_by)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                _INCREMENT_TRAIT_VALUE_SQL,
+                [identity.id, trait_key, INTEGER, increment_by, timezone.now()],
+            )
+            row = cursor.fetchone()
+
+        if row is None:
+            return None
+
+        id_, integer_value, created_date = row
+        return cls(
+            id=id_,
+            identity=identity,
+            trait_key=trait_key,
+            value_type=INTEGER,
+            integer_value=integer_value,
+            created_date=created_date,
+        )
+
+    @classmethod
+    def _increment_value_with_lock(
+        cls, identity: "Identity", trait_key: str, increment_by: int
+    ) -> typing.Optional["Trait"]:
+        with transaction.atomic():
+            trait, created = cls.objects.select_for_update().get_or_create(
+                identity=identity,
+                trait_key=trait_key,
+                defaults={"value_type": INTEGER, "integer_value": increment_by},
+            )
+            if trait.value_type != INTEGER:
+                return None
+            if not created:
+                cls.objects.filter(id=trait.id).update(
+                    integer_value=F("integer_value") + increment_by
+                )
+                trait.refresh_from_db(fields=["integer_value"])
+        return trait
+
     def save(self, *args, **kwargs):
         if not self.identity.environment.project.organisation.persist_trait_data:
             # this is a final line of defense to ensure that traits are never saved
@@ -1,6 +1,8 @@
-from core.constants import INTEGER
 from rest_framework import exceptions, serializers
 
+from environments.identities.evaluation_cache import (
+    invalidate_identity_evaluation_records,
+)
 from environments.identities.models import Identity
 from environments.identities.serializers import IdentitySerializer
 from environments.identities.traits.fields import TraitValueField
@@ -43,30 +45,25 @@ class IncrementTraitValueSerializer(serializers.Serializer):
         }
 
     def create(self, validated_data):
-        trait, _ = Trait.objects.get_or_create(
-            **self._build_query_data(validated_data),
-            defaults=self._build_default_data(),
+        environment = self.context.get("request").environment
+        identity, _ = Identity.objects.get_or_create(
+            identifier=validated_data.get("identifier"), environment=environment
         )
+        identity.environment = environment
 
-        if trait.value_type != INTEGER:
+        trait = Trait.increment_value(
+            identity=identity,
+            trait_key=validated_data.get("trait_key"),
+            increment_by=validated_data.get("increment_by"),
+        )
+        if trait is None:
             raise exceptions.ValidationError("Trait is not an integer.")
 
-        trait.integer_value += validated_data.get("increment_by")
-        trait.save()
+        # the trait is written directly to the database, so the post_save signal
+        # that would usually invalidate the cached identity isn't sent
+        invalidate_identity_evaluation_records([identity])
         return trait
 
-    def _build_query_data(self, validated_data):
-        identity_data = {
-            "identifier": validated_data.get("identifier"),
-            "environment": self.context.get("request").environment,
-        }
-        identity, _ = Identity.objects.get_or_create(**identity_data)
-
-        return {"trait_key": validated_data.get("trait_key"), "identity": identity}
-
-    def _build_default_data(self):
-        return {"value_type": INTEGER, "integer_value": 0}
-
     def validate(self, attrs):
         request = self.context["request"]
         if not request.environment.trait_persistence_allowed(request):
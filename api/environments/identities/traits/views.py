@@ -1,6 +1,5 @@
 from django.conf import settings
 from django.core.exceptions import BadRequest
-from django.db.models import Q
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import mixins, status, viewsets
@@ -13,6 +12,10 @@ from edge_api.identities.edge_request_forwarder import (
     forward_trait_requests,
 )
 from environments.authentication import EnvironmentKeyAuthentication
+from environments.identities.evaluation_cache import (
+    invalidate_identity_evaluation_records,
+    is_identity_evaluation_cache_enabled,
+)
 from environments.identities.models import Identity
 from environments.identities.traits.models import Trait
 from environments.identities.traits.serializers import (
@@ -100,14 +103,27 @@ class TraitViewSet(viewsets.ModelViewSet):
     def destroy(self, request, *args, **kwargs):
         if request.query_params.get("deleteAllMatchingTraits") in ("true", "True"):
             trait = self.get_object()
+            identities = Identity.objects.filter(
+                environment=trait.identity.environment,
+                identity_traits__trait_key=trait.trait_key,
+            ).only("identifier", "environment_id")
+            if is_identity_evaluation_cache_enabled():
+                # read the identities before their traits are deleted
+                identities = list(identities)
+
             Trait.objects.filter(
                 trait_key=trait.trait_key,
                 identity__environment=trait.identity.environment,
             ).delete()
+            invalidate_identity_evaluation_records(identities)
             return Response(status=status.HTTP_204_NO_CONTENT)
         else:
             return super(TraitViewSet, self).destroy(request, *args, **kwargs)
 
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        invalidate_identity_evaluation_records([self.identity])
+
 
 class SDKTraitsDeprecated(SDKAPIView):
     # API to handle /api/v1/identities/<identifier>/traits/<trait_key> endpoints
@@ -245,24 +261,8 @@ class SDKTraits(mixins.CreateModelMixin, viewsets.GenericViewSet):
                 raise BadRequest("Unable to set traits with client key.")
 
             # endpoint allows users to delete existing traits by sending null values
-            # for the trait value so we need to filter those out here
-            traits = []
-            delete_filter_query = Q()
-
-            for trait in request.data:
-                if trait.get("trait_value") is None:
-                    delete_filter_query = delete_filter_query | Q(
-                        trait_key=trait.get("trait_key"),
-                        identity__identifier=trait["identity"]["identifier"],
-                        identity__environment=request.environment,
-                    )
-                else:
-                    traits.append(trait)
-
-            if delete_filter_query:
-                Trait.objects.filter(delete_filter_query).delete()
-
-            serializer = self.get_serializer(data=traits, many=True)
+            # for the trait value, which the serializer handles along with the rest
+            serializer = self.get_serializer(data=request.data, many=True)
             serializer.is_valid(raise_exception=True)
             serializer.save()
 
@@ -276,7 +276,15 @@ class SDKTraits(mixins.CreateModelMixin, viewsets.GenericViewSet):
                     )
                 )
 
-            return Response(serializer.data, status=200)
+            # only return the traits that have been set
+            return Response(
+                [
+                    trait
+                    for trait in serializer.data
+                    if trait["trait_value"] is not None
+                ],
+                status=200,
+            )
 
         except (TypeError, AttributeError) as excinfo:
             logger.error("Invalid request data: %s" % str(excinfo))
@@ -5,18 +5,26 @@ from core.constants import FLAGSMITH_UPDATED_AT_HEADER
 from core.request_origin import RequestOrigin
 from django.conf import settings
 from django.db.models import Q
+from django.http import HttpResponse
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import cache_page
+from django.views.decorators.http import condition
 from drf_yasg.utils import swagger_auto_schema
+from flag_engine.features.models import FeatureStateModel
 from rest_framework import status, viewsets
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
 from app.pagination import CustomPagination
 from edge_api.identities.edge_request_forwarder import forward_identity_request
+from environments.identities.evaluation_cache import (
+    get_or_create_identity_evaluation_record,
+    is_identity_evaluation_cache_enabled,
+)
 from environments.identities.models import Identity
 from environments.identities.serializers import (
     IdentitySerializer,
+    SDKBulkIdentitiesResponseSerializer,
     SDKIdentitiesQuerySerializer,
     SDKIdentitiesResponseSerializer,
 )
@@ -26,15 +34,26 @@ from environments.permissions.constants import (
     VIEW_IDENTITIES,
 )
 from environments.permissions.permissions import NestedEnvironmentPermissions
+from environments.sdk.etags import get_identity_etag
+from environments.sdk.evaluation import (
+    get_environment_evaluation_context,
+    get_identity_flags_data,
+)
+from environments.sdk.rendered_payloads import (
+    RenderedPayload,
+    get_rendered_payload_response,
+)
 from environments.sdk.serializers import (
     IdentifyWithTraitsSerializer,
     IdentitySerializerWithTraitsAndSegments,
+    SDKBulkIdentifyWithTraitsSerializer,
 )
 from features.serializers import SDKFeatureStateSerializer
 from integrations.integration import (
     IDENTITY_INTEGRATIONS,
     identify_integrations,
 )
+from util.renderers import render_json
 from util.views import SDKAPIView
 
 
@@ -165,6 +184,7 @@ class SDKIdentities(SDKAPIView):
             cache=settings.GET_IDENTITIES_ENDPOINT_CACHE_NAME,
         )
     )
+    @method_decorator(condition(etag_func=get_identity_etag))
     def get(self, request):
         identifier = request.query_params.get("identifier")
         if not identifier:
@@ -172,18 +192,28 @@ class SDKIdentities(SDKAPIView):
                 {"detail": "Missing identifier"}
             )  # TODO: add 400 status - will this break the clients?
 
-        identity, _ = (
-            Identity.objects.select_related(
-                "environment",
-                "environment__project",
-                *[
-                    f"environment__{integration['relation_name']}"
-                    for integration in IDENTITY_INTEGRATIONS
-                ],
+        if is_identity_evaluation_cache_enabled() and (
+            get_environment_evaluation_context(request.environment)
+        ):
+            self.identity_record, _ = get_or_create_identity_evaluation_record(
+                request.environment, identifier
+            )
+            identity = self.identity_record.get_identity(
+                request.environment, identifier
+            )
+        else:
+            identity, _ = (
+                Identity.objects.select_related(
+                    "environment",
+                    "environment__project",
+                    *[
+                        f"environment__{integration['relation_name']}"
+                        for integration in IDENTITY_INTEGRATIONS
+                    ],
+                )
+                .prefetch_related("identity_traits")
+                .get_or_create(identifier=identifier, environment=request.environment)
             )
-            .prefetch_related("identity_traits")
-            .get_or_create(identifier=identifier, environment=request.environment)
-        )
         self.identity = identity
 
         if settings.EDGE_API_URL and request.environment.project.enable_dynamo_db:
@@ -254,7 +284,7 @@ class SDKIdentities(SDKAPIView):
             instance=instance,
             context=self.get_serializer_context(),
         )
-        return Response(
+        return self._get_response(
             response_serializer.data,
             headers={
                 FLAGSMITH_UPDATED_AT_HEADER: request.environment.updated_at.timestamp()
@@ -272,16 +302,38 @@ class SDKIdentities(SDKAPIView):
         feature_name: str,
         headers: dict[str, typing.Any],
     ) -> Response:
+        evaluation_context = get_environment_evaluation_context(
+            self.request.environment
+        )
+        if evaluation_context:
+            flags_data = get_identity_flags_data(
+                evaluation_context,
+                identity,
+                self.request.originated_from,
+                feature_name=feature_name,
+                identity_features=self._get_cached_identity_features(),
+            )
+            if flags_data:
+                return Response(
+                    data=flags_data[0], status=status.HTTP_200_OK, headers=headers
+                )
+            return Response(
+                {"detail": "Given feature not found"},
+                status=status.HTTP_404_NOT_FOUND,
+                headers=headers,
+            )
+
         context = self.get_serializer_context()
 
-        for feature_state in identity.get_all_feature_states(
+        feature_states = identity.get_all_feature_states(
             additional_filters=self._get_additional_filters(),
-        ):
-            if feature_state.feature.name == feature_name:
-                serializer = SDKFeatureStateSerializer(feature_state, context=context)
-                return Response(
-                    data=serializer.data, status=status.HTTP_200_OK, headers=headers
-                )
+            feature_name=feature_name,
+        )
+        if feature_states:
+            serializer = SDKFeatureStateSerializer(feature_states[0], context=context)
+            return Response(
+                data=serializer.data, status=status.HTTP_200_OK, headers=headers
+            )
 
         return Response(
             {"detail": "Given feature not found"},
@@ -300,10 +352,29 @@ class SDKIdentities(SDKAPIView):
         :param identity: Identity model to return feature states for
         :return: Response containing lists of both serialized flags and traits
         """
+        serializer_class = self.get_serializer_class()
+
+        evaluation_context = get_environment_evaluation_context(
+            self.request.environment
+        )
+        if evaluation_context:
+            serializer = serializer_class(
+                {
+                    "flags_data": get_identity_flags_data(
+                        evaluation_context,
+                        identity,
+                        self.request.originated_from,
+                        identity_features=self._get_cached_identity_features(),
+                    ),
+                    "traits": identity.identity_traits.all(),
+                },
+                context=self.get_serializer_context(),
+            )
+            return self._get_response(serializer.data, headers=headers)
+
         all_feature_states = identity.get_all_feature_states(
             additional_filters=self._get_additional_filters(),
         )
-        serializer_class = self.get_serializer_class()
         serializer = serializer_class(
             {
                 "flags": all_feature_states,
@@ -314,6 +385,68 @@ class SDKIdentities(SDKAPIView):
 
         identify_integrations(identity, all_feature_states)
 
+        return self._get_response(serializer.data, headers=headers)
+
+    def _get_cached_identity_features(self) -> list[FeatureStateModel] | None:
+        identity_record = getattr(self, "identity_record", None)
+        return identity_record.identity_features if identity_record else None
+
+    def _get_response(
+        self, data: dict[str, typing.Any], headers: dict[str, typing.Any]
+    ) -> Response | HttpResponse:
+        if settings.CACHE_RENDERED_SDK_RESPONSES:
+            # The response is specific to the identity, so there's no benefit to
+            # gzipping it up front, but we can still bypass the DRF renderer.
+            return get_rendered_payload_response(
+                self.request, RenderedPayload(render_json(data)), headers=headers
+            )
+        return Response(data=data, status=status.HTTP_200_OK, headers=headers)
+
+
+class SDKBulkIdentities(SDKAPIView):
+    serializer_class = SDKBulkIdentifyWithTraitsSerializer
+    pagination_class = None  # set here to ensure documentation is correct
+    throttle_classes = []
+
+    @swagger_auto_schema(
+        request_body=SDKBulkIdentifyWithTraitsSerializer(many=True),
+        responses={200: SDKBulkIdentitiesResponseSerializer(many=True)},
+        operation_id="bulk_identify_users_with_traits",
+    )
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        if settings.EDGE_API_URL and request.environment.project.enable_dynamo_db:
+            # the edge api has no bulk equivalent so forward each identity as an
+            # individual request
+            for identity_data in request.data:
+                forward_identity_request.delay(
+                    args=(
+                        request.method,
+                        dict(request.headers),
+                        request.environment.project.id,
+                    ),
+                    kwargs={"request_data": identity_data},
+                )
+
         return Response(
-            data=serializer.data, status=status.HTTP_200_OK, headers=headers
+            serializer.data,
+            status=status.HTTP_200_OK,
+            headers={
+                FLAGSMITH_UPDATED_AT_HEADER: request.environment.updated_at.timestamp()
+            },
         )
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if hasattr(self.request, "environment"):
+            # only set it if the request has the attribute to ensure that the
+            # documentation works correctly still
+            context["environment"] = self.request.environment
+        if self.request.originated_from is RequestOrigin.CLIENT:
+            context["feature_states_additional_filters"] = Q(
+                feature__is_server_key_only=False
+            )
+        return context
@@ -0,0 +1,129 @@
+"""
+Opt-in write-behind persistence of identities and traits for the SDK endpoints.
+
+When `SDK_IDENTITY_WRITE_BEHIND` is enabled, the SDK endpoints evaluate flags
+using the traits from the request data and, rather than writing the traits (and
+any identities that only the traits endpoints would create) to the database
+inline, add them to a process-local buffer. The buffer is flushed in batches
+by the `persist_identity_traits` task, either once it has been waiting for
+`SDK_IDENTITY_WRITE_BEHIND_FLUSH_SECONDS` or as soon as it holds
+`SDK_IDENTITY_WRITE_BEHIND_BATCH_SIZE` identities, whichever comes first.
+
+The buffer is also flushed when the process exits (e.g. when gunicorn recycles
+a worker after `max_requests`, or on deploys). Note that this still trades
+durability for latency: buffered writes are lost if the process is killed
+before they are flushed, and reads that happen before a flush will
+not see them. Identities that need to be evaluated are still created inline
+since their database id is used as the hash key for percentage splits and
+multivariate allocations.
+"""
+import atexit
+import logging
+import threading
+import typing
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+from environments.identities.tasks import persist_identity_traits
+
+logger = logging.getLogger(__name__)
+
+
+def is_write_behind_enabled(environment) -> bool:
+    return (
+        settings.SDK_IDENTITY_WRITE_BEHIND
+        and environment.project.organisation.persist_trait_data
+    )
+
+
+class IdentityWriteBuffer:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # trait values keyed on trait key, identifier and environment id so that
+        # only the latest value for each trait is written when flushed
+        self._writes: typing.Dict[
+            int, typing.Dict[str, typing.Dict[str, typing.Any]]
+        ] = {}
+        self._identity_count = 0
+        self._timer: typing.Optional[threading.Timer] = None
+
+    def add(
+        self,
+        environment_id: int,
+        identifier: str,
+        trait_data_items: typing.List[dict],
+    ) -> None:
+        """
+        Add the identity (and the given trait data items, validated by
+        TraitSerializerFull or TraitValueField) to the buffer.
+        """
+        with self._lock:
+            environment_writes = self._writes.setdefault(environment_id, {})
+            if identifier not in environment_writes:
+                self._identity_count += 1
+            identity_writes = environment_writes.setdefault(identifier, {})
+
+            for trait_data_item in trait_data_items:
+                trait_value = trait_data_item["trait_value"]
+                if isinstance(trait_value, dict):
+                    # deserialized output from TraitValueField
+                    trait_value = trait_value["value"]
+                identity_writes[trait_data_item["trait_key"]] = trait_value
+
+            flush_now = (
+                self._identity_count >= settings.SDK_IDENTITY_WRITE_BEHIND_BATCH_SIZE
+            )
+            if not flush_now and self._timer is None:
+                self._timer = threading.Timer(
+                    settings.SDK_IDENTITY_WRITE_BEHIND_FLUSH_SECONDS,
+                    self.flush_outside_request,
+                )
+                self._timer.daemon = True
+                self._timer.start()
+
+        if flush_now:
+            self.flush()
+
+    def flush_outside_request(self) -> None:
+        """
+        Flush the buffer from a thread that isn't handling a request (i.e. the
+        timer thread, or on exit), closing the database connections that the
+        flush opened in it since nothing else will.
+        """
+        close_old_connections()
+        try:
+            self.flush()
+        finally:
+            connections.close_all()
+
+    def flush(self) -> None:
+        with self._lock:
+            writes, self._writes = self._writes, {}
+            self._identity_count = 0
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        for environment_id, environment_writes in writes.items():
+            logger.debug(
+                "Flushing writes for %d identities in environment %d.",
+                len(environment_writes),
+                environment_id,
+            )
+            persist_identity_traits.delay(
+                kwargs={
+                    "environment_id": environment_id,
+                    "identity_trait_items": {
+                        identifier: [
+                            {"trait_key": trait_key, "trait_value": trait_value}
+                            for trait_key, trait_value in identity_writes.items()
+                        ]
+                        for identifier, identity_writes in environment_writes.items()
+                    },
+                }
+            )
+
+
+identity_write_buffer = IdentityWriteBuffer()
+atexit.register(identity_write_buffer.flush_outside_request)
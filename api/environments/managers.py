@@ -1,12 +1,24 @@
+import logging
+import typing
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from django.conf import settings
 from django.db.models import Prefetch
 from softdelete.models import SoftDeleteManager
 
 from features.models import FeatureSegment, FeatureState
 from features.multivariate.models import MultivariateFeatureStateValue
+from util.queryset import count_queries
+
+document_builder_logger = logging.getLogger("environments.document_builder")
 
 
 class EnvironmentManager(SoftDeleteManager):
     def filter_for_document_builder(self, *args, **kwargs):
+        # the segment overrides are prefetched through the project, so they
+        # need to be limited to the environments that are being built
+        environment_ids = super().filter(*args, **kwargs).values("id")
         return (
             super()
             .select_related(
@@ -23,9 +35,9 @@ class EnvironmentManager(SoftDeleteManager):
             .prefetch_related(
                 Prefetch(
                     "feature_states",
-                    queryset=FeatureState.objects.select_related(
-                        "feature", "feature_state_value"
-                    ),
+                    queryset=FeatureState.objects.filter(
+                        feature_segment__isnull=True, identity__isnull=True
+                    ).select_related("feature", "feature_state_value"),
                 ),
                 Prefetch(
                     "feature_states__multivariate_feature_state_values",
@@ -41,7 +53,9 @@ class EnvironmentManager(SoftDeleteManager):
                 "project__segments__rules__rules__rules",
                 Prefetch(
                     "project__segments__feature_segments",
-                    queryset=FeatureSegment.objects.select_related("segment"),
+                    queryset=FeatureSegment.objects.filter(
+                        environment_id__in=environment_ids
+                    ).select_related("segment"),
                 ),
                 Prefetch(
                     "project__segments__feature_segments__feature_states",
@@ -64,3 +78,38 @@ class EnvironmentManager(SoftDeleteManager):
 
     def get_by_natural_key(self, api_key):
         return self.get(api_key=api_key)
+
+
+@dataclass
+class DocumentBuildReport:
+    project_id: typing.Optional[int] = None
+    environment_count: int = 0
+
+
+@contextmanager
+def report_document_build() -> typing.Iterator[DocumentBuildReport]:
+    """
+    Log the number of queries (and rows) that building the environment
+    documents in the block takes to the `environments.document_builder` logger,
+    when ENABLE_DOCUMENT_BUILD_REPORTING is set. The caller sets the project and
+    number of environments on the report.
+    """
+    report = DocumentBuildReport()
+    if not settings.ENABLE_DOCUMENT_BUILD_REPORTING:
+        yield report
+        return
+
+    with count_queries() as query_count:
+        yield report
+
+    if not report.environment_count:
+        return
+
+    document_builder_logger.info(
+        "Built %d environment document(s) for project %s with %d queries "
+        "returning %d rows",
+        report.environment_count,
+        report.project_id,
+        query_count.queries,
+        query_count.rows,
+    )
@@ -10,12 +10,13 @@ from core.request_origin import RequestOrigin
 from django.conf import settings
 from django.contrib.contenttypes.fields import GenericRelation
 from django.core.cache import caches
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Q
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from django_lifecycle import (
     AFTER_CREATE,
+    AFTER_DELETE,
     AFTER_SAVE,
     AFTER_UPDATE,
     LifecycleModel,
@@ -30,22 +31,48 @@ from audit.constants import (
     ENVIRONMENT_UPDATED_MESSAGE,
 )
 from audit.related_object_type import RelatedObjectType
+from environments.api_key_filter import environment_key_filter
 from environments.api_keys import (
     generate_client_api_key,
     generate_server_api_key,
 )
+from environments.auth_record import (
+    ENVIRONMENT_DEFERRED_FIELDS,
+    INTEGRATION_CONFIG_RELATED_NAMES,
+    EnvironmentAuthRecord,
+)
 from environments.dynamodb import (
     DynamoEnvironmentAPIKeyWrapper,
     DynamoEnvironmentWrapper,
 )
+from environments.dynamodb.document_patches import (
+    get_environment_document_patch,
+)
 from environments.exceptions import EnvironmentHeaderNotPresentError
-from environments.managers import EnvironmentManager
+from environments.managers import EnvironmentManager, report_document_build
+from environments.sdk.document_deltas import add_environment_document_version
+from environments.sdk.rendered_payloads import RenderedPayload
 from features.models import Feature, FeatureSegment, FeatureState
+from features.scheduling import (
+    get_next_scheduled_change,
+    get_timeout_until_scheduled_change,
+)
 from metadata.models import Metadata
+from segments.evaluator import SegmentIndex
 from segments.models import Segment
+from util.cache import (
+    LocalCacheTier,
+    get_or_build,
+    invalidate_local_cache_tiers,
+    set_built_value,
+)
 from util.mappers import map_environment_to_environment_document
+from util.renderers import parse_gzipped_json, render_gzipped_json
 from webhooks.models import AbstractBaseExportableWebhookModel
 
+if typing.TYPE_CHECKING:
+    from audit.models import AuditLog
+
 logger = logging.getLogger(__name__)
 
 environment_cache = caches[settings.ENVIRONMENT_CACHE_NAME]
@@ -53,6 +80,10 @@ environment_document_cache = caches[settings.ENVIRONMENT_DOCUMENT_CACHE_LOCATION
 environment_segments_cache = caches[settings.ENVIRONMENT_SEGMENTS_CACHE_NAME]
 bad_environments_cache = caches[settings.BAD_ENVIRONMENTS_CACHE_LOCATION]
 
+environment_cache_local_tier = LocalCacheTier("environment")
+environment_document_cache_local_tier = LocalCacheTier("environment-document")
+environment_segments_cache_local_tier = LocalCacheTier("environment-segments")
+
 # Intialize the dynamo environment wrapper(s) globaly
 environment_wrapper = DynamoEnvironmentWrapper()
 environment_api_key_wrapper = DynamoEnvironmentAPIKeyWrapper()
@@ -140,10 +171,25 @@ class Environment(
                 else feature.default_enabled,
             )
 
+    @hook(AFTER_CREATE)
+    @hook(AFTER_UPDATE, when="api_key", has_changed=True)
+    def add_api_key_to_filter(self):
+        if environment_key_filter.is_enabled():
+            # other processes must not rebuild their filter before the key is
+            # visible to them, otherwise they would never include it
+            api_key = self.api_key
+            transaction.on_commit(lambda: environment_key_filter.add(api_key))
+
+    @hook(AFTER_DELETE)
+    def remove_api_key_from_filter(self):
+        if environment_key_filter.is_enabled():
+            environment_key_filter.invalidate()
+
     @hook(AFTER_UPDATE)
     def clear_environment_cache(self):
         # TODO: this could rebuild the cache itself (using an async task)
         environment_cache.delete(self.initial_value("api_key"))
+        invalidate_local_cache_tiers(environment_cache, [self.initial_value("api_key")])
 
     def __str__(self):
         return "Project %s - Environment %s" % (self.project.name, self.name)
@@ -189,48 +235,125 @@ class Environment(
                 logger.warning("Requested environment with null api_key.")
                 return None
 
+            if not environment_key_filter.might_exist(api_key):
+                return None
+
             if cls.is_bad_key(api_key):
                 return None
 
-            environment = environment_cache.get(api_key)
-            if not environment:
-                select_related_args = (
-                    "project",
-                    "project__organisation",
-                    "mixpanel_config",
-                    "segment_config",
-                    "amplitude_config",
-                    "heap_config",
-                    "dynatrace_config",
-                )
-                base_qs = cls.objects.select_related(*select_related_args).defer(
-                    "description"
-                )
-                qs_for_embedded_api_key = base_qs.filter(api_key=api_key)
-                qs_for_fk_api_key = base_qs.filter(api_keys__key=api_key)
-
-                environment = qs_for_embedded_api_key.union(qs_for_fk_api_key).get()
-                environment_cache.set(
-                    api_key, environment, timeout=settings.ENVIRONMENT_CACHE_SECONDS
-                )
-            return environment
+            auth_record = get_or_build(
+                environment_cache,
+                api_key,
+                lambda: cls._get_auth_record_from_db(api_key),
+                timeout=settings.ENVIRONMENT_CACHE_SECONDS,
+                local_tier=environment_cache_local_tier,
+            )
+            return auth_record.get_environment()
         except cls.DoesNotExist:
             cls.set_bad_key(api_key)
             logger.info("Environment with api_key %s does not exist" % api_key)
 
+    def rebuild_environment_cache(self, api_keys: typing.List[str]) -> None:
+        """
+        Replace the cached auth records for the given keys of the environment
+        with one for its current version, so that SDK requests don't need to
+        read the environment from the database after it changes.
+        """
+        if settings.ENVIRONMENT_CACHE_SECONDS <= 0:
+            return
+
+        try:
+            environment = self._get_auth_record_queryset().get(id=self.id)
+        except self.DoesNotExist:
+            # the environment has been deleted
+            environment_cache.delete_many(api_keys)
+            return
+
+        auth_record = EnvironmentAuthRecord.from_environment(environment)
+        for api_key in api_keys:
+            set_built_value(
+                environment_cache,
+                api_key,
+                auth_record,
+                timeout=settings.ENVIRONMENT_CACHE_SECONDS,
+            )
+
+    @classmethod
+    def _get_auth_record_queryset(cls) -> models.QuerySet:
+        return cls.objects.select_related(
+            "project", "project__organisation", *INTEGRATION_CONFIG_RELATED_NAMES
+        ).defer(*ENVIRONMENT_DEFERRED_FIELDS)
+
+    @classmethod
+    def _get_auth_record_from_db(cls, api_key: str) -> EnvironmentAuthRecord:
+        base_qs = cls._get_auth_record_queryset()
+        qs_for_embedded_api_key = base_qs.filter(api_key=api_key)
+        qs_for_fk_api_key = base_qs.filter(api_keys__key=api_key)
+
+        environment = qs_for_embedded_api_key.union(qs_for_fk_api_key).get()
+        return EnvironmentAuthRecord.from_environment(environment)
+
     @classmethod
     def write_environments_to_dynamodb(
-        cls, environment_id: int = None, project_id: int = None
-    ) -> None:
-        # use a list to make sure the entire qs is evaluated up front
+        cls,
+        environment_id: int = None,
+        project_id: int = None,
+        audit_log: "AuditLog" = None,
+    ) -> typing.Dict[int, dict[str, typing.Any]]:
+        """
+        Write the documents for the environment, or all of the environments in
+        the project, to dynamodb. If the audit log for the change is given and
+        the change only affects part of the documents, the existing documents
+        are patched rather than rebuilt.
+
+        Returns the documents that were rebuilt, by environment id, so that they
+        can be reused rather than built again (e.g. to warm the document cache).
+        """
         environments_filter = (
             Q(id=environment_id) if environment_id else Q(project_id=project_id)
         )
-        environments = list(
-            cls.objects.filter_for_document_builder(environments_filter)
-        )
+
+        patch = get_environment_document_patch(audit_log) if audit_log else None
+        if patch:
+            # only the changed objects are read to patch the documents so the
+            # related objects of the environments aren't needed
+            environments = list(cls.objects.filter(environments_filter))
+            if not cls._should_write_environments_to_dynamodb(environments):
+                return {}
+
+            environment_ids = environment_wrapper.patch_environments(
+                environments, patch
+            )
+            if not environment_ids:
+                return {}
+            environments_filter = Q(id__in=environment_ids)
+
+        with report_document_build() as report:
+            # use a list to make sure the entire qs is evaluated up front
+            environments = list(
+                cls.objects.filter_for_document_builder(environments_filter)
+            )
+            if not cls._should_write_environments_to_dynamodb(environments):
+                return {}
+
+            report.project_id = environments[0].project_id
+            report.environment_count = len(environments)
+            environment_documents = {
+                environment.id: map_environment_to_environment_document(environment)
+                for environment in environments
+            }
+            environment_wrapper.write_environment_documents(
+                environment_documents.values()
+            )
+
+        return environment_documents
+
+    @staticmethod
+    def _should_write_environments_to_dynamodb(
+        environments: typing.List["Environment"],
+    ) -> bool:
         if not environments:
-            return
+            return False
 
         # grab the first project and verify that each environment is for the same
         # project (which should always be the case). Since we're working with fairly
@@ -240,10 +363,7 @@ class Environment(
             if not environment.project == project:
                 raise RuntimeError("Environments must all belong to the same project.")
 
-        if not all([project, project.enable_dynamo_db, environment_wrapper.is_enabled]):
-            return
-
-        environment_wrapper.write_environments(environments)
+        return all([project, project.enable_dynamo_db, environment_wrapper.is_enabled])
 
     def get_feature_state(
         self, feature_id: int, filter_kwargs: dict = None
@@ -293,31 +413,114 @@ class Environment(
         """
         Get any segments that have been overridden in this environment.
         """
-        segments = environment_segments_cache.get(self.id)
-        if not segments:
-            segments = list(
-                Segment.objects.filter(
-                    feature_segments__feature_states__environment=self
-                ).prefetch_related(
-                    "rules",
-                    "rules__conditions",
-                    "rules__rules",
-                    "rules__rules__conditions",
-                    "rules__rules__rules",
-                )
-            )
-            environment_segments_cache.set(self.id, segments)
-        return segments
+        return self.get_segment_index_from_cache().segments
+
+    def get_segment_index_from_cache(self) -> SegmentIndex:
+        return get_or_build(
+            environment_segments_cache,
+            self.id,
+            self._build_segment_index,
+            local_tier=environment_segments_cache_local_tier,
+        )
+
+    def _build_segment_index(self) -> SegmentIndex:
+        segments = Segment.objects.filter(
+            feature_segments__feature_states__environment=self
+        ).prefetch_related(
+            "rules",
+            "rules__conditions",
+            "rules__rules",
+            "rules__rules__conditions",
+            "rules__rules__rules",
+        )
+        # building the index compiles the segments so that the compiled rules
+        # are cached along with them
+        return SegmentIndex(segments)
 
     @classmethod
     def get_environment_document(
         cls,
         api_key: str,
     ) -> dict[str, typing.Any]:
-        if settings.CACHE_ENVIRONMENT_DOCUMENT_SECONDS > 0:
-            return cls._get_environment_document_from_cache(api_key)
+        if settings.CACHE_ENVIRONMENT_DOCUMENT_SECONDS > 0 and (
+            environment := cls.get_from_cache(api_key)
+        ):
+            return cls._get_environment_document_from_cache(environment)
         return cls._get_environment_document_from_db(api_key)
 
+    @classmethod
+    def get_rendered_environment_document(cls, api_key: str) -> RenderedPayload:
+        if settings.CACHE_ENVIRONMENT_DOCUMENT_SECONDS > 0 and (
+            environment := cls.get_from_cache(api_key)
+        ):
+            return get_or_build(
+                environment_document_cache,
+                f"{cls._get_environment_document_cache_key(environment)}:rendered",
+                lambda: RenderedPayload.from_data(
+                    cls._get_environment_document_from_db(api_key)
+                ),
+                timeout=lambda payload: cls._get_environment_document_cache_timeout(
+                    environment
+                ),
+                local_tier=environment_document_cache_local_tier,
+            )
+        return RenderedPayload.from_data(cls._get_environment_document_from_db(api_key))
+
+    @classmethod
+    def get_gzipped_environment_document(cls, api_key: str) -> typing.Optional[bytes]:
+        """
+        Get the document, as gzipped JSON, from the cache or None if the
+        documents aren't cached gzipped.
+        """
+        if (
+            settings.CACHE_ENVIRONMENT_DOCUMENT_SECONDS > 0
+            and settings.CACHE_ENVIRONMENT_DOCUMENT_GZIP
+            and (environment := cls.get_from_cache(api_key))
+        ):
+            return cls._get_gzipped_environment_document_from_cache(environment)
+        return None
+
+    def rebuild_environment_document_cache(
+        self, environment_document: dict[str, typing.Any] = None
+    ) -> None:
+        """
+        Add the document (and rendered payload) for the current version of the
+        environment to the cache, so that readers switch to them as soon as they
+        see the new version of the environment, and to the recent versions that
+        deltas are built from. The document is built unless one that has just
+        been built for the current version is given.
+        """
+        cache_document = settings.CACHE_ENVIRONMENT_DOCUMENT_SECONDS > 0
+        if not (cache_document or settings.ENVIRONMENT_DOCUMENT_DELTA_VERSIONS > 0):
+            return
+
+        if environment_document is None:
+            environment_document = self._get_environment_document_from_db(self.api_key)
+        add_environment_document_version(self, environment_document)
+        if not cache_document:
+            return
+
+        cache_key = self._get_environment_document_cache_key(self)
+        timeout = self._get_environment_document_cache_timeout(self)
+        if settings.CACHE_ENVIRONMENT_DOCUMENT_GZIP:
+            set_built_value(
+                environment_document_cache,
+                f"{cache_key}:gzip",
+                render_gzipped_json(environment_document),
+                timeout,
+            )
+        else:
+            set_built_value(
+                environment_document_cache, cache_key, environment_document, timeout
+            )
+        if settings.CACHE_RENDERED_SDK_RESPONSES:
+            set_built_value(
+                environment_document_cache,
+                f"{cache_key}:rendered",
+                RenderedPayload.from_data(environment_document),
+                timeout,
+            )
+
     def get_create_log_message(self, history_instance) -> typing.Optional[str]:
         return ENVIRONMENT_CREATED_MESSAGE % self.name
 
@@ -333,21 +536,66 @@ class Environment(
     @classmethod
     def _get_environment_document_from_cache(
         cls,
-        api_key: str,
+        environment: "Environment",
     ) -> dict[str, typing.Any]:
-        environment_document = environment_document_cache.get(api_key)
-        if not environment_document:
-            environment_document = cls._get_environment_document_from_db(api_key)
-            environment_document_cache.set(api_key, environment_document)
-        return environment_document
+        if settings.CACHE_ENVIRONMENT_DOCUMENT_GZIP:
+            return parse_gzipped_json(
+                cls._get_gzipped_environment_document_from_cache(environment)
+            )
+
+        return get_or_build(
+            environment_document_cache,
+            cls._get_environment_document_cache_key(environment),
+            lambda: cls._get_environment_document_from_db(environment.api_key),
+            timeout=lambda environment_document: (
+                cls._get_environment_document_cache_timeout(environment)
+            ),
+            local_tier=environment_document_cache_local_tier,
+        )
+
+    @classmethod
+    def _get_gzipped_environment_document_from_cache(
+        cls,
+        environment: "Environment",
+    ) -> bytes:
+        return get_or_build(
+            environment_document_cache,
+            f"{cls._get_environment_document_cache_key(environment)}:gzip",
+            lambda: render_gzipped_json(
+                cls._get_environment_document_from_db(environment.api_key)
+            ),
+            timeout=lambda gzipped_environment_document: (
+                cls._get_environment_document_cache_timeout(environment)
+            ),
+            local_tier=environment_document_cache_local_tier,
+        )
+
+    @staticmethod
+    def _get_environment_document_cache_key(environment: "Environment") -> str:
+        # The documents are keyed on the version of the environment, which
+        # changes whenever the document does, so they never need to be
+        # invalidated (see `rebuild_environment_document_cache`).
+        return f"{environment.api_key}:{environment.updated_at.timestamp()}"
+
+    @staticmethod
+    def _get_environment_document_cache_timeout(environment: "Environment") -> int:
+        # The document only includes feature states that are currently live, so
+        # it needs to be rebuilt when the next scheduled change goes live.
+        return get_timeout_until_scheduled_change(
+            settings.CACHE_ENVIRONMENT_DOCUMENT_SECONDS,
+            get_next_scheduled_change(environment),
+        )
 
     @classmethod
     def _get_environment_document_from_db(
         cls,
         api_key: str,
     ) -> dict[str, typing.Any]:
-        environment = cls.objects.filter_for_document_builder(api_key=api_key).get()
-        return map_environment_to_environment_document(environment)
+        with report_document_build() as report:
+            environment = cls.objects.filter_for_document_builder(api_key=api_key).get()
+            report.project_id = environment.project_id
+            report.environment_count = 1
+            return map_environment_to_environment_document(environment)
 
     def _get_environment(self):
         return self
@@ -440,6 +688,17 @@ class EnvironmentAPIKey(LifecycleModel):
     def is_valid(self) -> bool:
         return self.active and (not self.expires_at or self.expires_at > timezone.now())
 
+    @hook(AFTER_CREATE)
+    def add_key_to_filter(self):
+        if environment_key_filter.is_enabled():
+            key = self.key
+            transaction.on_commit(lambda: environment_key_filter.add(key))
+
+    @hook(AFTER_DELETE)
+    def remove_key_from_filter(self):
+        if environment_key_filter.is_enabled():
+            environment_key_filter.invalidate()
+
     @hook(AFTER_SAVE)
     def send_to_dynamo(self):
         if (
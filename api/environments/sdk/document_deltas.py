@@ -0,0 +1,209 @@
+"""
+Deltas between versions of the environment documents for local evaluation SDKs.
+
+Rather than downloading the full environment document every time they poll,
+SDKs can send the version of the document they hold (the value of the
+`X-Flagsmith-Document-Updated-At` header that it was served with) to the delta
+endpoint, and only receive the parts of the document that have changed since.
+
+To do this, each time an environment is updated (see
+`environments.tasks.process_environment_update`) its new document is added to a
+ring buffer of its last `ENVIRONMENT_DOCUMENT_DELTA_VERSIONS` documents in the
+environment document cache, each of which is kept for up to
+`ENVIRONMENT_DOCUMENT_DELTA_VERSION_SECONDS`. The buffer is only updated while
+holding a lock in the cache, so concurrent updates can't overwrite each other's
+versions. An update that can't take the lock skips adding its version, so SDKs
+holding it get the full document.
+
+If the version that the SDK holds is no longer in the buffer, or scheduled
+changes have gone live since it was added (which change the document without
+changing its version, so the SDK may hold a different document for it), the
+full document is returned instead.
+
+A delta contains the top level attributes of the environment and its project
+that have changed, along with the feature states (keyed on the feature id) and
+segments (keyed on the segment id) that have been added, changed or removed.
+"""
+import datetime
+import logging
+import typing
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from features.models import FeatureState
+from util.mappers.dynamodb import Document
+
+if typing.TYPE_CHECKING:
+    from environments.models import Environment
+
+logger = logging.getLogger(__name__)
+
+environment_document_cache = caches[settings.ENVIRONMENT_DOCUMENT_CACHE_LOCATION]
+
+
+def get_environment_document_version(environment: "Environment") -> str:
+    # this matches the value of the `X-Flagsmith-Document-Updated-At` header
+    return str(environment.updated_at.timestamp())
+
+
+def add_environment_document_version(
+    environment: "Environment", environment_document: Document
+) -> None:
+    """
+    Add the document for the current version of the environment to the ring
+    buffer of its recent versions.
+    """
+    if settings.ENVIRONMENT_DOCUMENT_DELTA_VERSIONS <= 0:
+        return
+
+    versions_key = _get_versions_cache_key(environment)
+    version = get_environment_document_version(environment)
+    if not _acquire_versions_lock(versions_key):
+        logger.debug(
+            "Versions of environment %d are being updated, skipping version %s.",
+            environment.id,
+            version,
+        )
+        return
+
+    try:
+        versions = environment_document_cache.get(versions_key) or []
+        if version in versions:
+            return
+
+        versions.append(version)
+        evicted_count = max(
+            len(versions) - settings.ENVIRONMENT_DOCUMENT_DELTA_VERSIONS, 0
+        )
+        evicted_versions, versions = versions[:evicted_count], versions[evicted_count:]
+        environment_document_cache.set_many(
+            {
+                versions_key: versions,
+                _get_document_cache_key(environment, version): (
+                    timezone.now(),
+                    environment_document,
+                ),
+            },
+            timeout=settings.ENVIRONMENT_DOCUMENT_DELTA_VERSION_SECONDS,
+        )
+        if evicted_versions:
+            environment_document_cache.delete_many(
+                [
+                    _get_document_cache_key(environment, evicted_version)
+                    for evicted_version in evicted_versions
+                ]
+            )
+    finally:
+        environment_document_cache.delete(f"{versions_key}:building")
+
+
+def get_environment_document_delta(
+    environment: "Environment",
+    environment_document: Document,
+    base_version: typing.Optional[str],
+) -> dict[str, typing.Any]:
+    """
+    Get the delta from the given version of the environment's document to its
+    current document, or the full document if the delta can't be built.
+    """
+    base = (
+        environment_document_cache.get(
+            _get_document_cache_key(environment, base_version)
+        )
+        if base_version
+        else None
+    )
+    if base is None:
+        return {"delta": False, "document": environment_document}
+
+    built_at, base_document = base
+    if _has_scheduled_changes_since(environment, built_at):
+        # the document that the SDK has for this version may not match ours
+        return {"delta": False, "document": environment_document}
+
+    return {
+        "delta": True,
+        **build_environment_document_delta(base_document, environment_document),
+    }
+
+
+def build_environment_document_delta(
+    base_document: Document, environment_document: Document
+) -> dict[str, typing.Any]:
+    project_document = environment_document["project"]
+    base_project_document = base_document["project"]
+    return {
+        "attributes": _get_changed_attributes(
+            base_document, environment_document, exclude=("project", "feature_states")
+        ),
+        "project": _get_changed_attributes(
+            base_project_document, project_document, exclude=("segments",)
+        ),
+        "feature_states": _get_changed_items(
+            base_document["feature_states"],
+            environment_document["feature_states"],
+            key=lambda feature_state: feature_state["feature"]["id"],
+        ),
+        "segments": _get_changed_items(
+            base_project_document["segments"],
+            project_document["segments"],
+            key=lambda segment: segment["id"],
+        ),
+    }
+
+
+def _get_changed_attributes(
+    base_document: Document,
+    document: Document,
+    exclude: typing.Tuple[str, ...],
+) -> Document:
+    return {
+        attribute: value
+        for attribute, value in document.items()
+        if attribute not in exclude and base_document.get(attribute) != value
+    }
+
+
+def _get_changed_items(
+    base_items: typing.List[Document],
+    items: typing.List[Document],
+    key: typing.Callable[[Document], typing.Any],
+) -> dict[str, list]:
+    base_items_by_key = {key(base_item): base_item for base_item in base_items}
+    item_keys = {key(item) for item in items}
+    return {
+        "updated": [item for item in items if base_items_by_key.get(key(item)) != item],
+        "removed": [
+            base_item_key
+            for base_item_key in base_items_by_key
+            if base_item_key not in item_keys
+        ],
+    }
+
+
+def _has_scheduled_changes_since(
+    environment: "Environment", since: datetime.datetime
+) -> bool:
+    return FeatureState.objects.filter(
+        environment=environment,
+        live_from__gt=since,
+        live_from__lte=timezone.now(),
+        version__isnull=False,
+        deleted_at__isnull=True,
+    ).exists()
+
+
+def _acquire_versions_lock(versions_key: str) -> bool:
+    return environment_document_cache.add(
+        f"{versions_key}:building", True, timeout=settings.CACHE_REBUILD_LOCK_SECONDS
+    )
+
+
+def _get_versions_cache_key(environment: "Environment") -> str:
+    return f"{environment.api_key}:versions"
+
+
+def _get_document_cache_key(environment: "Environment", version: str) -> str:
+    return f"{environment.api_key}:versions:{version}"
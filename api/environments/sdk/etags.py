@@ -0,0 +1,86 @@
+"""
+ETag functions for use with django's `condition` decorator on the SDK endpoints.
+
+The ETags are derived from the version of the environment (and, for identities,
+from the version of the identity held in the identity evaluation cache) so that
+they can be calculated from the environment that has already been loaded by the
+authentication class, without needing to evaluate or serialize any feature
+states. This means that SDKs polling for changes can be sent a 304 as cheaply as
+possible.
+"""
+import hashlib
+import typing
+
+from django.conf import settings
+from rest_framework.request import Request
+
+from environments.identities.evaluation_cache import (
+    get_identity_evaluation_record,
+    is_identity_evaluation_cache_enabled,
+)
+from features.scheduling import get_next_scheduled_change
+
+
+def get_environment_flags_etag(
+    request: Request, identifier: str = None, *args, **kwargs
+) -> typing.Optional[str]:
+    if identifier:
+        # The (deprecated) identity flags endpoint depends on the identity's
+        # overrides and traits so the environment version is not enough.
+        return None
+
+    return _build_etag(
+        *_get_environment_version_components(request),
+        request.originated_from.name,
+    )
+
+
+def get_environment_document_etag(
+    request: Request, *args, **kwargs
+) -> typing.Optional[str]:
+    return _build_etag(*_get_environment_version_components(request))
+
+
+def get_identity_etag(request: Request, *args, **kwargs) -> typing.Optional[str]:
+    environment = request.environment
+    identifier = request.query_params.get("identifier")
+    if not identifier or (
+        settings.EDGE_API_URL and environment.project.enable_dynamo_db
+    ):
+        # Requests for projects that are being migrated to edge need to be
+        # forwarded, so we can't short circuit them.
+        return None
+
+    if not is_identity_evaluation_cache_enabled():
+        # Without the identity evaluation cache, the identity's version can only
+        # be determined by reading its traits and overrides, which would add
+        # queries to every request, whether the client sent an ETag or not.
+        return None
+
+    # the version of the identity changes whenever its traits or overrides do
+    identity_record = get_identity_evaluation_record(environment, identifier)
+    if not identity_record:
+        return None
+
+    return _build_etag(
+        *_get_environment_version_components(request),
+        request.originated_from.name,
+        identity_record.identity_id,
+        identity_record.version,
+    )
+
+
+def _get_environment_version_components(request: Request) -> tuple:
+    environment = request.environment
+    return (
+        environment.id,
+        environment.updated_at.timestamp(),
+        environment.get_hide_disabled_flags(),
+        # Scheduled changes go live without the environment being updated so
+        # we include the next one to ensure that the ETag changes when it does.
+        get_next_scheduled_change(environment),
+    )
+
+
+def _build_etag(*components: typing.Any) -> str:
+    return hashlib.md5(":".join(map(str, components)).encode("utf-8")).hexdigest()
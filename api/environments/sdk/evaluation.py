@@ -0,0 +1,230 @@
+"""
+In-memory evaluation of the flags for the SDK identities endpoint.
+
+Rather than building (and executing) a query across the environment defaults,
+segment overrides and identity overrides for every request, the environment is
+mapped to a flag engine document once per version of the environment (see
+`features.flags_cache`) and cached, along with the data needed to serialize the
+flags in the same format as `SDKFeatureStateSerializer`. The only data that
+needs to be read from the database per request is then the identity's overrides
+and traits.
+
+Environments with identity integrations configured are not evaluated in memory
+since the integrations expect `FeatureState` instances.
+"""
+import typing
+from dataclasses import dataclass
+
+from core.request_origin import RequestOrigin
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Prefetch, prefetch_related_objects
+from flag_engine.engine import get_identity_feature_states
+from flag_engine.environments.models import EnvironmentModel
+from flag_engine.features.models import FeatureStateModel
+from flag_engine.identities.models import IdentityModel, TraitModel
+
+from features.models import Feature, FeatureState
+from features.multivariate.models import MultivariateFeatureStateValue
+from features.scheduling import (
+    get_next_scheduled_change,
+    get_timeout_until_scheduled_change,
+)
+from features.serializers import SDKFeatureSerializer
+from integrations.integration import IDENTITY_INTEGRATIONS
+from util.mappers.engine import (
+    map_environment_to_engine,
+    map_identity_to_engine,
+)
+
+if typing.TYPE_CHECKING:
+    from environments.identities.models import Identity
+    from environments.identities.traits.models import Trait
+    from environments.models import Environment
+
+flags_cache = caches[settings.FLAGS_CACHE_LOCATION]
+
+
+@dataclass(frozen=True)
+class EnvironmentEvaluationContext:
+    environment_model: EnvironmentModel
+    features_data: dict[int, dict[str, typing.Any]]
+    server_key_only_feature_ids: frozenset[int]
+    feature_segment_ids: dict[int, int]
+    has_identity_integrations: bool
+
+
+def get_environment_evaluation_context(
+    environment: "Environment", build_if_cache_disabled: bool = False
+) -> typing.Optional[EnvironmentEvaluationContext]:
+    """
+    Get the evaluation context for the current version of the given environment,
+    or None if in-memory evaluation is disabled or not supported for it.
+
+    :param build_if_cache_disabled: build the context (without caching it) when
+        the cache is disabled, for callers evaluating enough identities that it
+        is worth building for a single request
+    """
+    if settings.CACHE_ENVIRONMENT_EVALUATION_CONTEXT_SECONDS <= 0:
+        if not build_if_cache_disabled:
+            return None
+        context = build_environment_evaluation_context(environment)
+        return None if context.has_identity_integrations else context
+
+    cache_key = ":".join(
+        (
+            str(environment.id),
+            str(environment.updated_at.timestamp()),
+            "evaluation-context",
+        )
+    )
+    context = flags_cache.get(cache_key)
+    if context is None:
+        context = build_environment_evaluation_context(environment)
+        flags_cache.set(
+            cache_key,
+            context,
+            timeout=get_timeout_until_scheduled_change(
+                settings.CACHE_ENVIRONMENT_EVALUATION_CONTEXT_SECONDS,
+                get_next_scheduled_change(environment),
+            ),
+        )
+
+    if context.has_identity_integrations:
+        return None
+
+    return context
+
+
+def build_environment_evaluation_context(
+    environment: "Environment",
+) -> EnvironmentEvaluationContext:
+    document_environment = (
+        type(environment).objects.filter_for_document_builder(id=environment.id).get()
+    )
+
+    features = Feature.objects.filter(project_id=environment.project_id)
+    features_data = SDKFeatureSerializer(
+        features, many=True, context={"environment": environment}
+    ).data
+
+    return EnvironmentEvaluationContext(
+        environment_model=map_environment_to_engine(document_environment),
+        features_data={data["id"]: data for data in features_data},
+        server_key_only_feature_ids=frozenset(
+            feature.id for feature in features if feature.is_server_key_only
+        ),
+        feature_segment_ids=dict(
+            FeatureState.objects.filter(
+                environment=environment, feature_segment__isnull=False
+            ).values_list("id", "feature_segment_id")
+        ),
+        has_identity_integrations=any(
+            (
+                config := getattr(
+                    document_environment, integration["relation_name"], None
+                )
+            )
+            and not config.deleted
+            for integration in IDENTITY_INTEGRATIONS
+        ),
+    )
+
+
+def get_identity_features_prefetch() -> Prefetch:
+    """
+    Prefetch the identity's overrides with everything needed to map them to the
+    engine.
+    """
+    return Prefetch(
+        "identity_features",
+        queryset=FeatureState.objects.select_related(
+            "feature", "feature_state_value"
+        ).prefetch_related(
+            Prefetch(
+                "multivariate_feature_state_values",
+                queryset=MultivariateFeatureStateValue.objects.select_related(
+                    "multivariate_feature_option"
+                ),
+            )
+        ),
+    )
+
+
+def get_identity_flags_data(
+    context: EnvironmentEvaluationContext,
+    identity: "Identity",
+    request_origin: RequestOrigin,
+    traits: typing.List["Trait"] = None,
+    feature_name: str = None,
+    identity_features: typing.List[FeatureStateModel] = None,
+) -> list[dict[str, typing.Any]]:
+    """
+    Evaluate the flags for the given identity against the given environment
+    evaluation context and serialize them in the same format as the
+    `SDKFeatureStateSerializer`.
+
+    :param traits: override the identity's traits when evaluating segments
+    :param feature_name: only return the flag for the feature with the given name
+    :param identity_features: the identity's overrides, already mapped to the
+        engine, to use instead of reading them from the database
+    """
+    environment_model = context.environment_model
+    if identity_features is None:
+        prefetch_related_objects([identity], get_identity_features_prefetch())
+        identity_model = map_identity_to_engine(identity)
+    else:
+        identity_model = IdentityModel(
+            identifier=identity.identifier,
+            environment_api_key=environment_model.api_key,
+            created_date=identity.created_date,
+            django_id=identity.id,
+            identity_features=identity_features,
+        )
+        if traits is None:
+            traits = identity.identity_traits.all()
+
+    if traits is not None:
+        identity_model.identity_traits = [
+            TraitModel(trait_key=trait.trait_key, trait_value=trait.trait_value)
+            for trait in traits
+        ]
+
+    identity_override_ids = {
+        feature_state.django_id for feature_state in identity_model.identity_features
+    }
+    identity_hash_key = identity.get_hash_key(
+        environment_model.use_identity_composite_key_for_hashing
+    )
+    hide_sensitive_data = environment_model.hide_sensitive_data
+
+    flags_data = []
+    for feature_state in get_identity_feature_states(environment_model, identity_model):
+        feature_id = feature_state.feature.id
+        if feature_name and feature_state.feature.name != feature_name:
+            continue
+        if (
+            request_origin is RequestOrigin.CLIENT
+            and feature_id in context.server_key_only_feature_ids
+        ):
+            continue
+
+        flag_data = {
+            "id": feature_state.django_id,
+            "feature": context.features_data[feature_id],
+            "feature_state_value": feature_state.get_value(identity_hash_key),
+            "environment": environment_model.id,
+            "identity": (
+                identity.id
+                if feature_state.django_id in identity_override_ids
+                else None
+            ),
+            "feature_segment": context.feature_segment_ids.get(feature_state.django_id),
+            "enabled": feature_state.enabled,
+        }
+        if hide_sensitive_data:
+            for field in ("id", "environment", "identity", "feature_segment"):
+                flag_data[field] = None
+        flags_data.append(flag_data)
+
+    return flags_data
@@ -0,0 +1,82 @@
+"""
+Pre-rendered payloads for the SDK endpoints.
+
+When `CACHE_RENDERED_SDK_RESPONSES` is enabled, the caches used by the SDK
+endpoints store the final (optionally gzipped) JSON bytes rather than the
+python data structures so that a cache hit can be written straight to the
+response without needing to be re-encoded by DRF's renderer.
+"""
+import gzip
+import typing
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+from django.middleware.gzip import re_accepts_gzip
+from django.utils.cache import patch_vary_headers
+
+from util.renderers import render_json
+
+
+@dataclass(frozen=True)
+class RenderedPayload:
+    content: bytes
+    gzipped_content: typing.Optional[bytes] = None
+
+    @classmethod
+    def from_data(cls, data: typing.Any) -> "RenderedPayload":
+        content = render_json(data)
+        gzipped_content = (
+            gzip.compress(content, mtime=0)
+            if settings.CACHE_RENDERED_SDK_RESPONSES_GZIP
+            else None
+        )
+        return cls(content=content, gzipped_content=gzipped_content)
+
+
+def get_rendered_payload_response(
+    request: HttpRequest,
+    payload: RenderedPayload,
+    status: int = 200,
+    headers: typing.Optional[dict[str, typing.Any]] = None,
+) -> HttpResponse:
+    if payload.gzipped_content is not None and accepts_gzip(request):
+        return get_gzipped_payload_response(
+            payload.gzipped_content, status=status, headers=headers
+        )
+
+    response = HttpResponse(
+        payload.content, content_type="application/json", status=status
+    )
+    if payload.gzipped_content is not None:
+        patch_vary_headers(response, ("Accept-Encoding",))
+
+    for header, value in (headers or {}).items():
+        response[header] = value
+
+    return response
+
+
+def get_gzipped_payload_response(
+    gzipped_content: bytes,
+    status: int = 200,
+    headers: typing.Optional[dict[str, typing.Any]] = None,
+) -> HttpResponse:
+    """
+    Get a response for the given gzipped JSON bytes, which should only be sent
+    to clients which accept gzip encoding.
+    """
+    response = HttpResponse(
+        gzipped_content, content_type="application/json", status=status
+    )
+    response["Content-Encoding"] = "gzip"
+    patch_vary_headers(response, ("Accept-Encoding",))
+
+    for header, value in (headers or {}).items():
+        response[header] = value
+
+    return response
+
+
+def accepts_gzip(request: HttpRequest) -> bool:
+    return bool(re_accepts_gzip.search(request.META.get("HTTP_ACCEPT_ENCODING", "")))
@@ -2,8 +2,15 @@ import typing
 from collections import defaultdict
 
 from core.constants import BOOLEAN, FLOAT, INTEGER, STRING
+from django.conf import settings
+from django.db.models import Prefetch, prefetch_related_objects
 from rest_framework import serializers
 
+from environments.identities.evaluation_cache import (
+    get_or_create_identity_evaluation_record,
+    invalidate_identity_evaluation_records,
+    is_identity_evaluation_cache_enabled,
+)
 from environments.identities.models import Identity
 from environments.identities.serializers import (
     IdentifierOnlyIdentitySerializer,
@@ -11,6 +18,17 @@ from environments.identities.serializers import (
 from environments.identities.traits.fields import TraitValueField
 from environments.identities.traits.models import Trait
 from environments.identities.traits.serializers import TraitSerializerBasic
+from environments.identities.write_behind import (
+    identity_write_buffer,
+    is_write_behind_enabled,
+)
+from environments.sdk.evaluation import (
+    EnvironmentEvaluationContext,
+    get_environment_evaluation_context,
+    get_identity_flags_data,
+)
+from features.models import FeatureState
+from features.multivariate.models import MultivariateFeatureStateValue
 from features.serializers import (
     FeatureStateSerializerFull,
     SDKFeatureStateSerializer,
@@ -20,6 +38,9 @@ from segments.serializers import SegmentSerializerBasic
 
 from .serializers_mixins import HideSensitiveFieldsSerializerMixin
 
+if typing.TYPE_CHECKING:
+    from environments.models import Environment
+
 
 class SDKCreateUpdateTraitSerializer(serializers.ModelSerializer):
     identity = IdentifierOnlyIdentitySerializer()
@@ -31,6 +52,16 @@ class SDKCreateUpdateTraitSerializer(serializers.ModelSerializer):
         fields = ("identity", "trait_value", "trait_key")
 
     def create(self, validated_data):
+        environment = self.context["environment"]
+        if is_write_behind_enabled(environment):
+            identifier = validated_data["identity"]["identifier"]
+            identity_write_buffer.add(environment.id, identifier, [validated_data])
+            return Trait(
+                identity=Identity(identifier=identifier, environment=environment),
+                trait_key=validated_data["trait_key"],
+                **Trait.generate_trait_value_data(validated_data["trait_value"]),
+            )
+
         identity = self._get_identity(validated_data["identity"]["identifier"])
 
         trait_key = validated_data["trait_key"]
@@ -79,14 +110,83 @@ class SDKBulkCreateUpdateTraitSerializer(SDKCreateUpdateTraitSerializer):
 
             def save(self, **kwargs):
                 identity_trait_items = self._build_identifier_trait_items_dictionary()
-                modified_traits = []
+                environment = self.context["request"].environment
+                if is_write_behind_enabled(environment):
+                    for identifier, trait_data_items in identity_trait_items.items():
+                        identity_write_buffer.add(
+                            environment.id, identifier, trait_data_items
+                        )
+                    self.instance = self.validated_data
+                    return self.instance
+
+                # delete the traits that have been nulled by the input data by
+                # their id, without creating any identities for them
+                keys_to_delete_by_identifier = {}
                 for identifier, trait_data_items in identity_trait_items.items():
-                    identity, _ = Identity.objects.get_or_create(
-                        identifier=identifier,
-                        environment=self.context["request"].environment,
-                    )
-                    modified_traits.extend(identity.update_traits(trait_data_items))
-                return modified_traits
+                    keys_to_delete = {
+                        item["trait_key"]
+                        for item in trait_data_items
+                        if item["trait_value"] is None
+                    }
+                    if keys_to_delete:
+                        keys_to_delete_by_identifier[identifier] = keys_to_delete
+                if keys_to_delete_by_identifier:
+                    self._delete_traits(environment, keys_to_delete_by_identifier)
+
+                # and upsert the rest for all identities at once
+                trait_data_items_by_identifier = {
+                    identifier: [
+                        item
+                        for item in trait_data_items
+                        if item["trait_value"] is not None
+                    ]
+                    for identifier, trait_data_items in identity_trait_items.items()
+                }
+                identities, _ = Identity.objects.get_or_create_in_bulk(
+                    environment,
+                    [
+                        identifier
+                        for identifier, trait_data_items in trait_data_items_by_identifier.items()
+                        if trait_data_items
+                    ],
+                )
+                Identity.bulk_update_traits(
+                    {
+                        identity: trait_data_items_by_identifier[identifier]
+                        for identifier, identity in identities.items()
+                    }
+                )
+
+                self.instance = self.validated_data
+                return self.instance
+
+            @staticmethod
+            def _delete_traits(
+                environment: "Environment",
+                keys_to_delete_by_identifier: typing.Dict[str, typing.Set[str]],
+            ) -> None:
+                # a single query for the candidate traits, which are then narrowed
+                # down to the (identifier, trait key) pairs, rather than an OR of a
+                # condition per identifier
+                trait_ids = [
+                    trait_id
+                    for trait_id, identifier, trait_key in Trait.objects.filter(
+                        identity__environment=environment,
+                        identity__identifier__in=keys_to_delete_by_identifier.keys(),
+                        trait_key__in=set().union(
+                            *keys_to_delete_by_identifier.values()
+                        ),
+                    ).values_list("id", "identity__identifier", "trait_key")
+                    if trait_key in keys_to_delete_by_identifier[identifier]
+                ]
+                if not trait_ids:
+                    return
+
+                Trait.objects.filter(id__in=trait_ids).delete()
+                invalidate_identity_evaluation_records(
+                    Identity(identifier=identifier, environment=environment)
+                    for identifier in keys_to_delete_by_identifier
+                )
 
             def _build_identifier_trait_items_dictionary(
                 self,
@@ -99,8 +199,18 @@ class SDKBulkCreateUpdateTraitSerializer(SDKCreateUpdateTraitSerializer):
                 for item in self.validated_data:
                     # item will be in the format:
                     # {"identity": {"identifier": "foo"}, "trait_key": "foo", "trait_value": "bar"}
+                    trait_value = item["trait_value"]
                     identity_trait_items[item["identity"]["identifier"]].append(
-                        dict((k, v) for k, v in item.items() if k != "identity")
+                        {
+                            "trait_key": item["trait_key"],
+                            # use the value deserialized by TraitValueField so that
+                            # it can be compared with the current value
+                            "trait_value": (
+                                trait_value["value"]
+                                if trait_value is not None
+                                else None
+                            ),
+                        }
                     )
                 return identity_trait_items
 
@@ -134,13 +244,29 @@ class IdentifyWithTraitsSerializer(
         (optionally store traits if flag set on org)
         """
         environment = self.context["environment"]
-        identity, created = Identity.objects.get_or_create(
-            identifier=self.validated_data["identifier"], environment=environment
-        )
+        identifier = self.validated_data["identifier"]
+        evaluation_context = get_environment_evaluation_context(environment)
+
+        identity_record = None
+        if evaluation_context and is_identity_evaluation_cache_enabled():
+            identity_record, created = get_or_create_identity_evaluation_record(
+                environment, identifier
+            )
+            identity = identity_record.get_identity(environment, identifier)
+        else:
+            identity, created = Identity.objects.get_or_create(
+                identifier=identifier, environment=environment
+            )
 
         trait_data_items = self.validated_data.get("traits", [])
 
-        if not created and environment.project.organisation.persist_trait_data:
+        if is_write_behind_enabled(environment):
+            # evaluate using the traits from the request and persist them later
+            trait_models = identity.get_updated_traits(trait_data_items)
+            identity_write_buffer.add(
+                environment.id, identity.identifier, trait_data_items
+            )
+        elif not created and environment.project.organisation.persist_trait_data:
             # if this is an update and we're persisting traits, then we need to
             # partially update any traits and return the full list
             trait_models = identity.update_traits(trait_data_items)
@@ -151,6 +277,21 @@ class IdentifyWithTraitsSerializer(
                 persist=environment.project.organisation.persist_trait_data,
             )
 
+        if evaluation_context:
+            return {
+                "identity": identity,
+                "traits": trait_models,
+                "flags_data": get_identity_flags_data(
+                    evaluation_context,
+                    identity,
+                    self.context["request"].originated_from,
+                    traits=trait_models,
+                    identity_features=(
+                        identity_record.identity_features if identity_record else None
+                    ),
+                ),
+            }
+
         all_feature_states = identity.get_all_feature_states(
             traits=trait_models,
             additional_filters=self.context.get("feature_states_additional_filters"),
@@ -163,6 +304,35 @@ class IdentifyWithTraitsSerializer(
             "flags": all_feature_states,
         }
 
+    def to_representation(self, instance):
+        if "flags_data" not in instance:
+            return super().to_representation(instance)
+
+        # the flags have been evaluated in memory and are already serialized
+        data = super().to_representation(
+            {key: value for key, value in instance.items() if key != "flags_data"}
+        )
+        data["flags"] = instance["flags_data"]
+        return data
+
+    def validate_traits(self, traits: typing.List[dict] = None):
+        request = self.context["request"]
+        if traits and not request.environment.trait_persistence_allowed(request):
+            raise serializers.ValidationError(
+                "Setting traits not allowed with client key."
+            )
+        return traits
+
+
+class SDKBulkIdentifyWithTraitsSerializer(
+    HideSensitiveFieldsSerializerMixin, serializers.Serializer
+):
+    identifier = serializers.CharField(required=True)
+    traits = TraitSerializerBasic(required=False, many=True)
+    flags = serializers.ListField(read_only=True)
+
+    sensitive_fields = ("traits",)
+
     def validate_traits(self, traits: typing.List[dict] = None):
         request = self.context["request"]
         if traits and not request.environment.trait_persistence_allowed(request):
@@ -170,3 +340,128 @@ class IdentifyWithTraitsSerializer(
                 "Setting traits not allowed with client key."
             )
         return traits
+
+    class Meta:
+        class BulkIdentifyListSerializer(serializers.ListSerializer):
+            """
+            Custom ListSerializer to identify all the identities in the request
+            using a fixed number of queries (outside of any identity integrations)
+            rather than handling each identity in turn as IdentifyWithTraitsSerializer
+            would.
+            """
+
+            def validate(self, attrs):
+                if len(attrs) > settings.SDK_BULK_IDENTIFY_MAX_IDENTITIES:
+                    raise serializers.ValidationError(
+                        "Cannot identify more than %d identities in a single request."
+                        % settings.SDK_BULK_IDENTIFY_MAX_IDENTITIES
+                    )
+
+                identifiers = [item["identifier"] for item in attrs]
+                if len(identifiers) != len(set(identifiers)):
+                    raise serializers.ValidationError("Identifiers must be unique.")
+
+                return attrs
+
+            def save(self, **kwargs):
+                environment = self.context["environment"]
+                persist_trait_data = environment.project.organisation.persist_trait_data
+
+                identities, _ = Identity.objects.get_or_create_in_bulk(
+                    environment, [item["identifier"] for item in self.validated_data]
+                )
+                trait_data_items_by_identity = {
+                    identities[item["identifier"]]: item.get("traits", [])
+                    for item in self.validated_data
+                }
+
+                write_behind = is_write_behind_enabled(environment)
+                if persist_trait_data and not write_behind:
+                    Identity.bulk_update_traits(trait_data_items_by_identity)
+
+                # fetch the overrides (and the persisted traits) for all the
+                # identities at once
+                prefetch_related_objects(
+                    list(identities.values()),
+                    "identity_traits",
+                    Prefetch(
+                        "identity_features",
+                        queryset=FeatureState.objects.select_related(
+                            "feature", "feature_state_value"
+                        ).prefetch_related(
+                            Prefetch(
+                                "multivariate_feature_state_values",
+                                queryset=MultivariateFeatureStateValue.objects.select_related(
+                                    "multivariate_feature_option"
+                                ),
+                            )
+                        ),
+                    ),
+                )
+                traits_by_identity_id = {}
+                for identity, trait_data_items in trait_data_items_by_identity.items():
+                    if write_behind:
+                        # evaluate using the traits from the request and persist
+                        # them later
+                        traits_by_identity_id[
+                            identity.id
+                        ] = identity.get_updated_traits(trait_data_items)
+                        identity_write_buffer.add(
+                            environment.id, identity.identifier, trait_data_items
+                        )
+                    elif persist_trait_data:
+                        traits_by_identity_id[identity.id] = list(
+                            identity.identity_traits.all()
+                        )
+                    else:
+                        traits_by_identity_id[identity.id] = identity.generate_traits(
+                            trait_data_items
+                        )
+
+                evaluation_context = get_environment_evaluation_context(
+                    environment, build_if_cache_disabled=True
+                )
+                self.instance = [
+                    self._identify(
+                        identity, traits_by_identity_id[identity.id], evaluation_context
+                    )
+                    for identity in trait_data_items_by_identity
+                ]
+                return self.instance
+
+            def _identify(
+                self,
+                identity: Identity,
+                trait_models: typing.List[Trait],
+                evaluation_context: typing.Optional[EnvironmentEvaluationContext],
+            ) -> dict:
+                if evaluation_context:
+                    flags_data = get_identity_flags_data(
+                        evaluation_context,
+                        identity,
+                        self.context["request"].originated_from,
+                        traits=trait_models,
+                    )
+                else:
+                    # the environment has identity integrations configured which
+                    # need the feature state objects
+                    all_feature_states = identity.get_all_feature_states(
+                        traits=trait_models,
+                        additional_filters=self.context.get(
+                            "feature_states_additional_filters"
+                        ),
+                    )
+                    identify_integrations(identity, all_feature_states, trait_models)
+                    flags_data = SDKFeatureStateSerializer(
+                        all_feature_states,
+                        many=True,
+                        context={**self.context, "identity": identity},
+                    ).data
+
+                return {
+                    "identifier": identity.identifier,
+                    "traits": trait_models,
+                    "flags": flags_data,
+                }
+
+        list_serializer_class = BulkIdentifyListSerializer
@@ -1,11 +1,21 @@
 from core.constants import FLAGSMITH_UPDATED_AT_HEADER
+from django.conf import settings
 from django.http import HttpRequest
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from environments.authentication import EnvironmentKeyAuthentication
 from environments.models import Environment
 from environments.permissions.permissions import EnvironmentKeyPermissions
+from environments.sdk.document_deltas import get_environment_document_delta
+from environments.sdk.etags import get_environment_document_etag
+from environments.sdk.rendered_payloads import (
+    accepts_gzip,
+    get_gzipped_payload_response,
+    get_rendered_payload_response,
+)
 
 
 class SDKEnvironmentAPIView(APIView):
@@ -15,12 +25,61 @@ class SDKEnvironmentAPIView(APIView):
     def get_authenticators(self):
         return [EnvironmentKeyAuthentication(required_key_prefix="ser.")]
 
+    @method_decorator(condition(etag_func=get_environment_document_etag))
     def get(self, request: HttpRequest) -> Response:
+        updated_at = self.request.environment.updated_at
+        headers = {FLAGSMITH_UPDATED_AT_HEADER: updated_at.timestamp()}
+
+        if settings.CACHE_RENDERED_SDK_RESPONSES:
+            return get_rendered_payload_response(
+                request,
+                Environment.get_rendered_environment_document(
+                    request.environment.api_key
+                ),
+                headers=headers,
+            )
+
+        if settings.CACHE_ENVIRONMENT_DOCUMENT_GZIP:
+            # the cached document can be sent as is to clients which accept gzip
+            headers["Vary"] = "Accept-Encoding"
+            if accepts_gzip(request) and (
+                gzipped_environment_document := (
+                    Environment.get_gzipped_environment_document(
+                        request.environment.api_key
+                    )
+                )
+            ):
+                return get_gzipped_payload_response(
+                    gzipped_environment_document, headers=headers
+                )
+
         environment_document = Environment.get_environment_document(
             request.environment.api_key
         )
-        updated_at = self.request.environment.updated_at
+        return Response(environment_document, headers=headers)
+
+
+class SDKEnvironmentDocumentDeltaAPIView(APIView):
+    """
+    Get the changes to the environment document since the version given by the
+    `since` query parameter (the `X-Flagsmith-Document-Updated-At` header that
+    it was served with), or the full document if they aren't available.
+    """
+
+    permission_classes = (EnvironmentKeyPermissions,)
+    throttle_classes = []
+
+    def get_authenticators(self):
+        return [EnvironmentKeyAuthentication(required_key_prefix="ser.")]
+
+    def get(self, request: HttpRequest) -> Response:
+        environment = request.environment
+        headers = {FLAGSMITH_UPDATED_AT_HEADER: environment.updated_at.timestamp()}
+
+        environment_document = Environment.get_environment_document(environment.api_key)
         return Response(
-            environment_document,
-            headers={FLAGSMITH_UPDATED_AT_HEADER: updated_at.timestamp()},
+            get_environment_document_delta(
+                environment, environment_document, request.GET.get("since")
+            ),
+            headers=headers,
         )
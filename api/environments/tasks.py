@@ -1,12 +1,15 @@
 from audit.models import AuditLog
 from environments.dynamodb import DynamoEnvironmentWrapper
-from environments.models import Environment
+from environments.models import Environment, environment_cache
+from features.flags_cache import rebuild_environment_flags_cache
+from features.scheduling import get_next_scheduled_change
 from sse import (
     send_environment_update_message_for_environment,
     send_environment_update_message_for_project,
 )
 from task_processor.decorators import register_task_handler
 from task_processor.models import TaskPriority
+from util.cache import invalidate_local_cache_tiers
 
 
 @register_task_handler(priority=TaskPriority.HIGH)
@@ -22,10 +25,39 @@ def process_environment_update(audit_log_id: int):
     audit_log = AuditLog.objects.get(id=audit_log_id)
 
     # Send environment document to dynamodb
-    Environment.write_environments_to_dynamodb(
-        environment_id=audit_log.environment_id, project_id=audit_log.project_id
+    environment_documents = Environment.write_environments_to_dynamodb(
+        environment_id=audit_log.environment_id,
+        project_id=audit_log.project_id,
+        audit_log=audit_log,
     )
 
+    # Build the cached flags and document for the new version of the
+    # environment(s) and make sure that the SDK endpoints pick up the new
+    # version straight away
+    environments = (
+        [audit_log.environment]
+        if audit_log.environment_id
+        else audit_log.project.environments.all()
+    )
+    for environment in environments:
+        api_keys = [
+            environment.api_key,
+            *environment.api_keys.values_list("key", flat=True),
+        ]
+        # the caches and ETags for the new version all depend on when its next
+        # scheduled change goes live, so look it up once here rather than on
+        # the first request that sees the new version
+        get_next_scheduled_change(environment)
+        # the new version of the document needs to be in the cache before the
+        # new version of the environment is (reusing the document written to
+        # dynamodb, if there is one, rather than building it again)
+        environment.rebuild_environment_document_cache(
+            environment_documents.get(environment.id)
+        )
+        environment.rebuild_environment_cache(api_keys)
+        invalidate_local_cache_tiers(environment_cache, api_keys)
+        rebuild_environment_flags_cache(environment)
+
     # send environment update message
     if audit_log.environment_id:
         send_environment_update_message_for_environment(audit_log.environment)
@@ -4,6 +4,7 @@ from unittest import mock
 
 import pytest
 from core.constants import STRING
+from django.conf import settings
 from django.test import TestCase, override_settings
 from django.utils import timezone
 
@@ -177,6 +178,7 @@ class EnvironmentTestCase(TestCase):
     def test_get_from_cache_stores_environment_in_cache_on_success(self, mock_cache):
         # Given
         self.environment.save()
+        mock_cache.get_many.return_value = {}
         mock_cache.get.return_value = None
 
         # When
@@ -184,9 +186,13 @@ class EnvironmentTestCase(TestCase):
 
         # Then
         assert environment == self.environment
-        mock_cache.set.assert_called_with(
-            self.environment.api_key, self.environment, timeout=60
+        mock_cache.set.assert_any_call(
+            self.environment.api_key,
+            mock.ANY,
+            timeout=60 + settings.CACHE_STALE_SECONDS,
         )
+        auth_record = mock_cache.set.call_args_list[0].args[1]
+        assert auth_record.get_environment() == self.environment
 
     def test_get_from_cache_returns_None_if_no_matching_environment(self):
         # Given
@@ -320,7 +326,9 @@ def test_get_from_cache_sets_the_cache_correctly_with_environment_api_key(
     assert returned_environment == environment
 
     # and
-    assert environment == environment_cache.get(environment_api_key.key)
+    assert (
+        environment == environment_cache.get(environment_api_key.key).get_environment()
+    )
 
 
 def test_updated_at_gets_updated_when_environment_audit_log_created(environment):
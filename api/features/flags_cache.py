@@ -0,0 +1,218 @@
+"""
+Cache for the serialized payloads returned by the SDK flags endpoint.
+
+Cache entries are keyed on the environment's `updated_at` value which is bumped
+every time an audit log is created for the environment (or its project). This
+means that entries never need to be explicitly invalidated since a change to
+the environment will result in a new key being used. The payloads for the new
+version are built once by the task processor (see
+`environments.tasks.process_environment_update`) so that the request path only
+needs to read from the cache.
+
+The payload also depends on the request origin (server key only features are
+excluded for client keys) and on whether disabled flags are hidden, so both of
+these form part of the key. All of the variants are built together from a
+single query.
+
+Entries are also set to expire when the next scheduled change in the environment
+goes live (see `features.scheduling`).
+
+Each entry also holds an index of the serialized flags keyed on the case-folded
+feature name so that requests for a single feature can be served from the cache.
+"""
+import typing
+from dataclasses import dataclass
+
+from core.request_origin import RequestOrigin
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Q
+
+from environments.sdk.rendered_payloads import RenderedPayload
+from features.models import FeatureState
+from features.scheduling import (
+    get_next_scheduled_change,
+    get_timeout_until_scheduled_change,
+)
+from features.serializers import SDKFeatureStateSerializer
+
+if typing.TYPE_CHECKING:
+    from environments.models import Environment
+
+flags_cache = caches[settings.FLAGS_CACHE_LOCATION]
+
+EnvironmentFlagsPayload = typing.Union[list[dict[str, typing.Any]], RenderedPayload]
+
+
+EnvironmentFlagsVariant = typing.Tuple[RequestOrigin, bool]
+
+
+@dataclass(frozen=True)
+class EnvironmentFlagsCacheValue:
+    payload: EnvironmentFlagsPayload
+    flags_by_feature_name: dict[str, dict[str, typing.Any]]
+
+
+def get_environment_flags_cache_key(
+    environment: "Environment",
+    request_origin: RequestOrigin,
+    hide_disabled_flags: bool = None,
+) -> str:
+    if hide_disabled_flags is None:
+        hide_disabled_flags = environment.get_hide_disabled_flags()
+
+    return ":".join(
+        (
+            str(environment.id),
+            str(environment.updated_at.timestamp()),
+            request_origin.name,
+            str(int(hide_disabled_flags)),
+        )
+    )
+
+
+def get_environment_flags_filters(
+    environment: "Environment", request_origin: RequestOrigin
+) -> Q:
+    filters = Q(feature_segment=None, identity=None)
+
+    if environment.get_hide_disabled_flags() is True:
+        filters &= Q(enabled=True)
+
+    if request_origin is RequestOrigin.CLIENT:
+        filters &= Q(feature__is_server_key_only=False)
+
+    return filters
+
+
+def get_environment_flags_data(
+    environment: "Environment", request_origin: RequestOrigin
+) -> EnvironmentFlagsPayload:
+    """
+    Get the serialized environment flags for the given environment, building
+    (and caching) them if they have not yet been built for the current version
+    of the environment.
+
+    If CACHE_RENDERED_SDK_RESPONSES is enabled, the flags are returned as a
+    RenderedPayload.
+    """
+    return _get_cache_value(environment, request_origin).payload
+
+
+def get_environment_flag_data(
+    environment: "Environment", request_origin: RequestOrigin, feature_name: str
+) -> typing.Optional[dict[str, typing.Any]]:
+    """
+    Get the serialized environment flag for the feature with the given name
+    (case insensitive) from the cache, or None if no such flag exists.
+    """
+    return _get_cache_value(environment, request_origin).flags_by_feature_name.get(
+        feature_name.casefold()
+    )
+
+
+def build_environment_flags_data(
+    environment: "Environment",
+) -> dict[EnvironmentFlagsVariant, list[dict[str, typing.Any]]]:
+    """
+    Build the serialized environment flags for every combination of request
+    origin and hide disabled flags using a single query. Each feature state is
+    only serialized once, regardless of how many variants it belongs to.
+    """
+    feature_states = FeatureState.get_environment_flags_list(
+        environment_id=environment.id,
+        additional_filters=Q(feature_segment=None, identity=None),
+    )
+    serialized_feature_states = SDKFeatureStateSerializer(
+        feature_states, many=True, context={"environment": environment}
+    ).data
+
+    return {
+        (request_origin, hide_disabled_flags): [
+            data
+            for feature_state, data in zip(feature_states, serialized_feature_states)
+            if _is_included_in_variant(
+                feature_state, request_origin, hide_disabled_flags
+            )
+        ]
+        for request_origin in RequestOrigin
+        for hide_disabled_flags in (False, True)
+    }
+
+
+def rebuild_environment_flags_cache(environment: "Environment") -> None:
+    """
+    Build the payloads for the current version of the environment for each
+    variant and add them to the cache.
+    """
+    if settings.CACHE_FLAGS_SECONDS <= 0:
+        return
+
+    _set_cache_values(environment, _build_cache_values(environment))
+
+
+def _is_included_in_variant(
+    feature_state: FeatureState,
+    request_origin: RequestOrigin,
+    hide_disabled_flags: bool,
+) -> bool:
+    if hide_disabled_flags and not feature_state.enabled:
+        return False
+
+    if request_origin is RequestOrigin.CLIENT:
+        return not feature_state.feature.is_server_key_only
+
+    return True
+
+
+def _get_cache_value(
+    environment: "Environment", request_origin: RequestOrigin
+) -> EnvironmentFlagsCacheValue:
+    hide_disabled_flags = environment.get_hide_disabled_flags()
+    cache_value = flags_cache.get(
+        get_environment_flags_cache_key(
+            environment, request_origin, hide_disabled_flags
+        )
+    )
+    if cache_value is None:
+        # Since all the variants are built from the same query, we may as well
+        # cache all of them rather than just the one that was requested.
+        cache_values = _build_cache_values(environment)
+        _set_cache_values(environment, cache_values)
+        cache_value = cache_values[(request_origin, hide_disabled_flags)]
+    return cache_value
+
+
+def _build_cache_values(
+    environment: "Environment",
+) -> dict[EnvironmentFlagsVariant, EnvironmentFlagsCacheValue]:
+    return {
+        variant: EnvironmentFlagsCacheValue(
+            payload=(
+                RenderedPayload.from_data(data)
+                if settings.CACHE_RENDERED_SDK_RESPONSES
+                else data
+            ),
+            flags_by_feature_name={
+                flag["feature"]["name"].casefold(): flag for flag in data
+            },
+        )
+        for variant, data in build_environment_flags_data(environment).items()
+    }
+
+
+def _set_cache_values(
+    environment: "Environment",
+    cache_values: dict[EnvironmentFlagsVariant, EnvironmentFlagsCacheValue],
+) -> None:
+    flags_cache.set_many(
+        {
+            get_environment_flags_cache_key(
+                environment, request_origin, hide_disabled_flags
+            ): value
+            for (request_origin, hide_disabled_flags), value in cache_values.items()
+        },
+        timeout=get_timeout_until_scheduled_change(
+            settings.CACHE_FLAGS_SECONDS, get_next_scheduled_change(environment)
+        ),
+    )
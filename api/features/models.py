@@ -17,7 +17,7 @@ from django.core.exceptions import (
     ValidationError,
 )
 from django.db import models
-from django.db.models import Max, Q, QuerySet
+from django.db.models import Max, Min, Q, QuerySet
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from django_lifecycle import (
@@ -812,6 +812,23 @@ class FeatureState(
         )
         return FeatureState.objects.filter(id__in=[fs.id for fs in feature_states_list])
 
+    @classmethod
+    def get_next_scheduled_live_from(
+        cls, environment_id: int
+    ) -> typing.Optional[datetime.datetime]:
+        """
+        Get the earliest live_from value, that is still in the future, of the
+        committed feature states (including segment and identity overrides) in the
+        given environment, i.e. the next time that the environment's flags will
+        change without the environment being updated.
+        """
+        return cls.objects.filter(
+            environment_id=environment_id,
+            live_from__gt=timezone.now(),
+            version__isnull=False,
+            deleted_at__isnull=True,
+        ).aggregate(next_live_from=Min("live_from"))["next_live_from"]
+
     @classmethod
     def get_next_version_number(
         cls,
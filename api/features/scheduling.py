@@ -0,0 +1,68 @@
+"""
+Helpers to make the caches used by the SDK endpoints aware of scheduled changes.
+
+Feature states that are created by a scheduled change request have a `live_from`
+value in the future. The environment is not updated when they go live (unless
+the task processor is used to create the related audit log), so any cache
+entries built before then must expire at the point that the next change goes
+live.
+"""
+import datetime
+import math
+import typing
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from features.models import FeatureState
+
+if typing.TYPE_CHECKING:
+    from environments.models import Environment
+
+flags_cache = caches[settings.FLAGS_CACHE_LOCATION]
+
+# How long to cache the fact that an environment has no scheduled changes for.
+# Scheduling a change updates the environment, so this is only a safety net.
+NO_SCHEDULED_CHANGE_CACHE_SECONDS = 60
+
+_MISSING = object()
+
+
+def get_next_scheduled_change(
+    environment: "Environment",
+) -> typing.Optional[datetime.datetime]:
+    """
+    Get the time at which the next scheduled change in the environment goes live,
+    caching it against the current version of the environment until then.
+    """
+    cache_key = f"{environment.id}:{environment.updated_at.timestamp()}:next-change"
+    next_scheduled_change = flags_cache.get(cache_key, _MISSING)
+    if next_scheduled_change is _MISSING:
+        next_scheduled_change = FeatureState.get_next_scheduled_live_from(
+            environment.id
+        )
+        flags_cache.set(
+            cache_key,
+            next_scheduled_change,
+            timeout=get_timeout_until_scheduled_change(
+                NO_SCHEDULED_CHANGE_CACHE_SECONDS, next_scheduled_change
+            ),
+        )
+    return next_scheduled_change
+
+
+def get_timeout_until_scheduled_change(
+    timeout: int, scheduled_change: typing.Optional[datetime.datetime]
+) -> int:
+    """
+    Cap the given cache timeout so that the cache entry expires when the given
+    scheduled change goes live.
+    """
+    if scheduled_change is None:
+        return timeout
+
+    seconds_until_change = math.ceil(
+        (scheduled_change - timezone.now()).total_seconds()
+    )
+    return max(min(timeout, seconds_until_change), 1)
@@ -534,13 +534,16 @@ class ProjectFeatureTestCase(TestCase):
         self.project.save()
 
         mock_dynamo_environment_wrapper.is_enabled = True
+        mock_dynamo_environment_wrapper.patch_environments.return_value = []
         mock_dynamo_environment_wrapper.reset_mock()
 
         # When
         self.client.post(url, data=data)
 
         # Then
-        mock_dynamo_environment_wrapper.write_environments.assert_called_once()
+        # the existing document is patched with the new feature
+        mock_dynamo_environment_wrapper.patch_environments.assert_called_once()
+        mock_dynamo_environment_wrapper.write_environment_documents.assert_not_called()
 
 
 @pytest.mark.django_db
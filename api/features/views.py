@@ -5,12 +5,11 @@ from functools import reduce
 from app_analytics.analytics_db_service import get_feature_evaluation_data
 from app_analytics.influxdb_wrapper import get_multiple_event_list_for_feature
 from core.constants import FLAGSMITH_UPDATED_AT_HEADER
-from core.request_origin import RequestOrigin
 from django.conf import settings
-from django.core.cache import caches
 from django.db.models import Q, QuerySet
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import cache_page
+from django.views.decorators.http import condition
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import mixins, serializers, status, viewsets
@@ -33,11 +32,21 @@ from environments.permissions.permissions import (
     EnvironmentKeyPermissions,
     NestedEnvironmentPermissions,
 )
+from environments.sdk.etags import get_environment_flags_etag
+from environments.sdk.rendered_payloads import (
+    RenderedPayload,
+    get_rendered_payload_response,
+)
 from projects.models import Project
 from projects.permissions import VIEW_PROJECT
 from users.models import FFAdminUser, UserPermissionGroup
 from webhooks.webhooks import WebhookEventType
 
+from .flags_cache import (
+    get_environment_flag_data,
+    get_environment_flags_data,
+    get_environment_flags_filters,
+)
 from .models import Feature, FeatureState
 from .permissions import (
     CreateSegmentOverridePermissions,
@@ -72,8 +81,6 @@ from .tasks import trigger_feature_state_change_webhooks
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-flags_cache = caches[settings.FLAGS_CACHE_LOCATION]
-
 
 @swagger_auto_schema(responses={200: ListCreateFeatureSerializer()}, method="get")
 @api_view(["GET"])
@@ -607,6 +614,7 @@ class SDKFeatureStates(GenericAPIView):
             cache=settings.GET_FLAGS_ENDPOINT_CACHE_NAME,
         )
     )
+    @method_decorator(condition(etag_func=get_environment_flags_etag))
     def get(self, request, identifier=None, *args, **kwargs):
         """
         USING THIS ENDPOINT WITH AN IDENTIFIER IS DEPRECATED.
@@ -620,22 +628,12 @@ class SDKFeatureStates(GenericAPIView):
             return self._get_flags_response_with_identifier(request, identifier)
 
         if "feature" in request.GET:
-            feature_states = FeatureState.get_environment_flags_list(
-                environment_id=request.environment.id,
-                feature_name=request.GET["feature"],
-                additional_filters=self._additional_filters,
-            )
-            if len(feature_states) != 1:
-                # TODO: what if more than one?
-                return Response(
-                    {"detail": "Given feature not found"},
-                    status=status.HTTP_404_NOT_FOUND,
-                )
-
-            return Response(self.get_serializer(feature_states[0]).data)
+            return self._get_single_flag_response(request, request.GET["feature"])
 
         if settings.CACHE_FLAGS_SECONDS > 0:
-            data = self._get_flags_from_cache(request.environment)
+            data = get_environment_flags_data(
+                request.environment, request.originated_from
+            )
         else:
             data = self.get_serializer(
                 FeatureState.get_environment_flags_list(
@@ -646,36 +644,43 @@ class SDKFeatureStates(GenericAPIView):
             ).data
 
         updated_at = self.request.environment.updated_at
-        return Response(
-            data,
-            headers={FLAGSMITH_UPDATED_AT_HEADER: updated_at.timestamp()},
-        )
+        headers = {FLAGSMITH_UPDATED_AT_HEADER: updated_at.timestamp()}
+        if isinstance(data, RenderedPayload):
+            return get_rendered_payload_response(request, data, headers=headers)
 
-    @property
-    def _additional_filters(self) -> Q:
-        filters = Q(feature_segment=None, identity=None)
+        return Response(data, headers=headers)
 
-        if self.request.environment.get_hide_disabled_flags() is True:
-            return filters & Q(enabled=True)
-
-        if self.request.originated_from is RequestOrigin.CLIENT:
-            return filters & Q(feature__is_server_key_only=False)
+    def _get_single_flag_response(self, request, feature_name: str) -> Response:
+        if settings.CACHE_FLAGS_SECONDS > 0:
+            data = get_environment_flag_data(
+                request.environment, request.originated_from, feature_name
+            )
+        else:
+            feature_states = FeatureState.get_environment_flags_list(
+                environment_id=request.environment.id,
+                feature_name=feature_name,
+                additional_filters=self._additional_filters,
+            )
+            # TODO: what if more than one?
+            data = (
+                self.get_serializer(feature_states[0]).data
+                if len(feature_states) == 1
+                else None
+            )
 
-        return filters
+        if data is None:
+            return Response(
+                {"detail": "Given feature not found"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
 
-    def _get_flags_from_cache(self, environment):
-        data = flags_cache.get(environment.api_key)
-        if not data:
-            data = self.get_serializer(
-                FeatureState.get_environment_flags_list(
-                    environment_id=environment.id,
-                    additional_filters=self._additional_filters,
-                ),
-                many=True,
-            ).data
-            flags_cache.set(environment.api_key, data, settings.CACHE_FLAGS_SECONDS)
+        return Response(data)
 
-        return data
+    @property
+    def _additional_filters(self) -> Q:
+        return get_environment_flags_filters(
+            self.request.environment, self.request.originated_from
+        )
 
     def _get_flags_response_with_identifier(self, request, identifier):
         identity, _ = Identity.objects.get_or_create(
@@ -2,11 +2,10 @@ import json
 import logging
 import typing
 
-import requests
-
 from environments.identities.models import Identity
 from environments.identities.traits.models import Trait
 from features.models import FeatureState
+from integrations.common.dispatcher import get_session
 from integrations.common.wrapper import AbstractBaseIdentityIntegrationWrapper
 
 from .models import AmplitudeConfiguration
@@ -20,13 +19,19 @@ class AmplitudeWrapper(AbstractBaseIdentityIntegrationWrapper):
         self.url = f"{config.base_url}/identify"
 
     def _identify_user(self, user_data: dict) -> None:
-        payload = {"api_key": self.api_key, "identification": json.dumps([user_data])}
+        self._identify_users([user_data])
+
+    def _identify_users(self, user_data: typing.List[dict]) -> None:
+        payload = {"api_key": self.api_key, "identification": json.dumps(user_data)}
 
-        response = requests.post(self.url, data=payload)
+        response = get_session().post(self.url, data=payload)
         logger.debug(
             "Sent event to Amplitude. Response code was: %s" % response.status_code
         )
 
+    def get_batch_key(self) -> typing.Hashable:
+        return self.url, self.api_key
+
     def generate_user_data(
         self,
         identity: Identity,
@@ -0,0 +1,212 @@
+"""
+Bounded, batching dispatcher for sending identities to the identity integrations.
+
+Rather than starting a new thread for every identity that is sent to every
+integration, the user data generated by the integration wrappers is added to a
+queue per integration and sent by a shared pool of (daemon) worker threads. Each
+worker takes up to `IDENTITY_INTEGRATIONS_DISPATCHER_BATCH_SIZE` items from the
+next integration with a non-empty queue and, for integrations whose API accepts
+multiple users in a single request (see
+`AbstractBaseIdentityIntegrationWrapper.get_batch_key`), sends them together.
+
+The queues are bounded by `IDENTITY_INTEGRATIONS_DISPATCHER_QUEUE_SIZE` so, if an
+integration can't keep up, new items for it are dropped rather than using an
+unbounded amount of memory. The number of items dispatched, dropped, sent and
+failed for each integration is available from `IdentityIntegrationDispatcher.stats`.
+
+Since the worker threads are daemon threads, they would be stopped with items
+still in the queues when the process exits, so the dispatcher is drained (for up
+to `IDENTITY_INTEGRATIONS_DISPATCHER_DRAIN_SECONDS`) on exit.
+
+Each worker thread uses its own `requests.Session` (see `get_session`) so that
+connections to the integrations are reused between requests.
+"""
+import atexit
+import logging
+import threading
+import typing
+from collections import Counter, defaultdict, deque
+
+import requests
+from django.conf import settings
+
+if typing.TYPE_CHECKING:
+    from integrations.common.wrapper import (
+        AbstractBaseIdentityIntegrationWrapper,
+    )
+
+logger = logging.getLogger(__name__)
+
+_thread_local = threading.local()
+
+
+def get_session() -> requests.Session:
+    """
+    Get the `requests.Session` for the current thread.
+    """
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = _thread_local.session = requests.Session()
+    return session
+
+
+class IdentityIntegrationDispatcher:
+    def __init__(
+        self,
+        max_workers: int = None,
+        max_queue_size: int = None,
+        max_batch_size: int = None,
+    ) -> None:
+        self.max_workers = (
+            max_workers or settings.IDENTITY_INTEGRATIONS_DISPATCHER_WORKERS
+        )
+        self.max_queue_size = (
+            max_queue_size or settings.IDENTITY_INTEGRATIONS_DISPATCHER_QUEUE_SIZE
+        )
+        self.max_batch_size = (
+            max_batch_size or settings.IDENTITY_INTEGRATIONS_DISPATCHER_BATCH_SIZE
+        )
+
+        self._condition = threading.Condition()
+        self._queues: typing.Dict[str, deque] = defaultdict(deque)
+        # the integrations with items in their queue, in the order that they
+        # should be processed in
+        self._ready_integrations: deque = deque()
+        self._unfinished_count = 0
+        self._workers: typing.List[threading.Thread] = []
+        self._stats: typing.Dict[str, Counter] = defaultdict(Counter)
+
+    @property
+    def stats(self) -> typing.Dict[str, typing.Dict[str, int]]:
+        with self._condition:
+            return {
+                integration: dict(counter)
+                for integration, counter in self._stats.items()
+            }
+
+    def dispatch(
+        self, wrapper: "AbstractBaseIdentityIntegrationWrapper", user_data: typing.Any
+    ) -> bool:
+        """
+        Queue the user data to be sent to the integration by the given wrapper,
+        returning False if it was dropped because the queue is full.
+        """
+        integration = type(wrapper).__name__
+
+        with self._condition:
+            queue = self._queues[integration]
+            if len(queue) >= self.max_queue_size:
+                self._stats[integration]["dropped"] += 1
+                logger.warning(
+                    "Queue for %s is full. Dropping identity integration event.",
+                    integration,
+                )
+                return False
+
+            if not queue:
+                self._ready_integrations.append(integration)
+            queue.append((wrapper, user_data))
+            self._unfinished_count += 1
+            self._stats[integration]["dispatched"] += 1
+
+            self._start_workers()
+            self._condition.notify()
+
+        return True
+
+    def join(self, timeout: float = None) -> bool:
+        """
+        Wait until everything that has been dispatched has been sent, returning
+        False if the timeout was reached first.
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: self._unfinished_count == 0, timeout=timeout
+            )
+
+    def drain(self) -> None:
+        """
+        Wait for the dispatched items to be sent before the process exits, for
+        up to IDENTITY_INTEGRATIONS_DISPATCHER_DRAIN_SECONDS.
+        """
+        if self.join(timeout=settings.IDENTITY_INTEGRATIONS_DISPATCHER_DRAIN_SECONDS):
+            return
+
+        with self._condition:
+            unfinished_count = self._unfinished_count
+        logger.warning(
+            "Exiting with %d identity integration event(s) not sent.",
+            unfinished_count,
+        )
+
+    def _start_workers(self) -> None:
+        self._workers = [worker for worker in self._workers if worker.is_alive()]
+        if len(self._workers) >= min(self.max_workers, self._unfinished_count):
+            return
+
+        worker = threading.Thread(
+            target=self._work,
+            name=f"identity-integrations-{len(self._workers)}",
+            daemon=True,
+        )
+        worker.start()
+        self._workers.append(worker)
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._ready_integrations)
+                integration = self._ready_integrations.popleft()
+                queue = self._queues[integration]
+                batch = [
+                    queue.popleft() for _ in range(min(self.max_batch_size, len(queue)))
+                ]
+                if queue:
+                    # let the other integrations have a turn before this one
+                    self._ready_integrations.append(integration)
+                    self._condition.notify()
+
+            sent_count = self._send(batch)
+
+            with self._condition:
+                failed_count = len(batch) - sent_count
+                if sent_count:
+                    self._stats[integration]["sent"] += sent_count
+                if failed_count:
+                    self._stats[integration]["failed"] += failed_count
+                self._unfinished_count -= len(batch)
+                self._condition.notify_all()
+
+    @staticmethod
+    def _send(
+        batch: typing.List[
+            typing.Tuple["AbstractBaseIdentityIntegrationWrapper", typing.Any]
+        ]
+    ) -> int:
+        # group the items that can be sent together in a single request
+        requests_to_send = defaultdict(list)
+        for index, (wrapper, user_data) in enumerate(batch):
+            batch_key = wrapper.get_batch_key()
+            key = (batch_key,) if batch_key is not None else (None, index)
+            requests_to_send[key].append((wrapper, user_data))
+
+        sent_count = 0
+        for items in requests_to_send.values():
+            wrapper = items[0][0]
+            try:
+                if len(items) == 1:
+                    wrapper._identify_user(items[0][1])
+                else:
+                    wrapper._identify_users([user_data for _, user_data in items])
+            except Exception:
+                logger.exception(
+                    "Failed to send identity to %s.", type(wrapper).__name__
+                )
+            else:
+                sent_count += len(items)
+
+        return sent_count
+
+
+identity_integration_dispatcher = IdentityIntegrationDispatcher()
+atexit.register(identity_integration_dispatcher.drain)
@@ -1,6 +1,7 @@
 import typing
 from abc import ABC, abstractmethod
 
+from integrations.common.dispatcher import identity_integration_dispatcher
 from util.util import postpone
 
 if typing.TYPE_CHECKING:
@@ -29,9 +30,25 @@ class AbstractBaseIdentityIntegrationWrapper(ABC):
     def _identify_user(self, user_data: dict) -> None:
         raise NotImplementedError()
 
-    @postpone
+    def _identify_users(self, user_data: typing.List[dict]) -> None:
+        """
+        Send the data for multiple users (generated by wrappers with the same
+        batch key) to the integration. Should be overridden by integrations that
+        return a batch key.
+        """
+        for data in user_data:
+            self._identify_user(data)
+
+    def get_batch_key(self) -> typing.Optional[typing.Hashable]:
+        """
+        Get a key that is the same for all wrappers whose user data can be sent
+        to the integration in a single request, or None if the integration
+        doesn't support this.
+        """
+        return None
+
     def identify_user_async(self, data: dict) -> None:
-        self._identify_user(data)
+        identity_integration_dispatcher.dispatch(self, data)
 
     @abstractmethod
     def generate_user_data(
@@ -1,11 +1,10 @@
 import logging
 import typing
 
-import requests
-
 from environments.identities.models import Identity
 from environments.identities.traits.models import Trait
 from features.models import FeatureState
+from integrations.common.dispatcher import get_session
 from integrations.common.wrapper import AbstractBaseIdentityIntegrationWrapper
 
 from .models import HeapConfiguration
@@ -21,7 +20,7 @@ class HeapWrapper(AbstractBaseIdentityIntegrationWrapper):
         self.url = f"{HEAP_API_URL}/api/track"
 
     def _identify_user(self, user_data: dict) -> None:
-        response = requests.post(self.url, json=user_data)
+        response = get_session().post(self.url, json=user_data)
         logger.debug("Sent event to Heap. Response code was: %s" % response.status_code)
 
     def generate_user_data(
@@ -1,11 +1,10 @@
 import logging
 import typing
 
-import requests
-
 from environments.identities.models import Identity
 from environments.identities.traits.models import Trait
 from features.models import FeatureState
+from integrations.common.dispatcher import get_session
 from integrations.common.wrapper import AbstractBaseIdentityIntegrationWrapper
 
 from .models import MixpanelConfiguration
@@ -26,8 +25,8 @@ class MixpanelWrapper(AbstractBaseIdentityIntegrationWrapper):
             "X-Mixpanel-Integration-ID": "flagsmith",
         }
 
-    def _identify_user(self, user_data: dict) -> None:
-        response = requests.post(self.url, headers=self.headers, json=user_data)
+    def _identify_user(self, user_data: list) -> None:
+        response = get_session().post(self.url, headers=self.headers, json=user_data)
         logger.debug(
             "Sent event to Mixpanel. Response code was: %s" % response.status_code
         )
@@ -35,6 +34,15 @@ class MixpanelWrapper(AbstractBaseIdentityIntegrationWrapper):
             "Sent event to Mixpanel. Response content was: %s" % response.content
         )
 
+    def _identify_users(self, user_data: typing.List[list]) -> None:
+        # the engage endpoint accepts a list of profile updates
+        self._identify_user(
+            [profile_update for updates in user_data for profile_update in updates]
+        )
+
+    def get_batch_key(self) -> typing.Hashable:
+        return self.api_key
+
     def generate_user_data(
         self,
         identity: Identity,
@@ -9,6 +9,7 @@ SDK_ENDPOINTS = (
     "/api/v1/traits",
     "/api/v1/traits/bulk",
     "/api/v1/environment-document",
+    "/api/v1/environment-document/delta",
     "/api/v1/analytics/flags",
 )
 
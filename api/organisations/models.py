@@ -42,6 +42,7 @@ from organisations.subscriptions.exceptions import (
 from organisations.subscriptions.metadata import BaseSubscriptionMetadata
 from organisations.subscriptions.xero.metadata import XeroSubscriptionMetadata
 from users.utils.mailer_lite import MailerLite
+from util.cache import invalidate_local_cache_tiers
 from webhooks.models import AbstractBaseExportableWebhookModel
 
 TRIAL_SUBSCRIPTION_ID = "trial"
@@ -142,13 +143,13 @@ class Organisation(LifecycleModelMixin, SoftDeleteExportableModel):
     def clear_environment_caches(self):
         from environments.models import Environment
 
-        environment_cache.delete_many(
-            list(
-                Environment.objects.filter(project__organisation=self).values_list(
-                    "api_key", flat=True
-                )
+        api_keys = list(
+            Environment.objects.filter(project__organisation=self).values_list(
+                "api_key", flat=True
             )
         )
+        environment_cache.delete_many(api_keys)
+        invalidate_local_cache_tiers(environment_cache, api_keys)
 
     @hook(AFTER_SAVE, when="stop_serving_flags", has_changed=True)
     def rebuild_environments(self):
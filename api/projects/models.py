@@ -2,6 +2,7 @@
 from __future__ import unicode_literals
 
 import re
+import typing
 
 from core.models import SoftDeleteExportableModel
 from django.conf import settings
@@ -25,10 +26,21 @@ from permissions.models import (
 )
 from projects.managers import ProjectManager
 from projects.tasks import write_environments_to_dynamodb
+from util.cache import (
+    LocalCacheTier,
+    get_or_build,
+    invalidate_local_cache_tiers,
+)
+
+if typing.TYPE_CHECKING:
+    from segments.evaluator import SegmentIndex
+    from segments.models import Segment
 
 project_segments_cache = caches[settings.PROJECT_SEGMENTS_CACHE_LOCATION]
 environment_cache = caches[settings.ENVIRONMENT_CACHE_NAME]
 
+project_segments_cache_local_tier = LocalCacheTier("project-segments")
+
 
 class Project(LifecycleModelMixin, SoftDeleteExportableModel):
     name = models.CharField(max_length=2000)
@@ -92,10 +104,13 @@ class Project(LifecycleModelMixin, SoftDeleteExportableModel):
             .exists()
         )
 
-    def get_segments_from_cache(self):
-        segments = project_segments_cache.get(self.id)
+    def get_segments_from_cache(self) -> typing.List["Segment"]:
+        return self.get_segment_index_from_cache().segments
+
+    def get_segment_index_from_cache(self) -> "SegmentIndex":
+        from segments.evaluator import SegmentIndex
 
-        if not segments:
+        def build_segment_index() -> "SegmentIndex":
             # This is optimised to account for rules nested one levels deep (since we
             # don't support anything above that from the UI at the moment). Anything
             # past that will require additional queries / thought on how to optimise.
@@ -106,11 +121,17 @@ class Project(LifecycleModelMixin, SoftDeleteExportableModel):
                 "rules__rules__conditions",
                 "rules__rules__rules",
             )
-            project_segments_cache.set(
-                self.id, segments, timeout=settings.CACHE_PROJECT_SEGMENTS_SECONDS
-            )
-
-        return segments
+            # building the index compiles the segments so that the compiled rules
+            # are cached along with them
+            return SegmentIndex(segments)
+
+        return get_or_build(
+            project_segments_cache,
+            self.id,
+            build_segment_index,
+            timeout=settings.CACHE_PROJECT_SEGMENTS_SECONDS,
+            local_tier=project_segments_cache_local_tier,
+        )
 
     @hook(BEFORE_CREATE)
     def set_enable_dynamo_db(self):
@@ -121,9 +142,9 @@ class Project(LifecycleModelMixin, SoftDeleteExportableModel):
 
     @hook(AFTER_SAVE)
     def clear_environments_cache(self):
-        environment_cache.delete_many(
-            list(self.environments.values_list("api_key", flat=True))
-        )
+        api_keys = list(self.environments.values_list("api_key", flat=True))
+        environment_cache.delete_many(api_keys)
+        invalidate_local_cache_tiers(environment_cache, api_keys)
 
     @hook(AFTER_UPDATE)
     def write_to_dynamo(self):
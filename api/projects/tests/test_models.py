@@ -2,10 +2,10 @@ from datetime import timedelta
 from unittest import mock
 
 import pytest
-from django.conf import settings
 from django.utils import timezone
 
 from projects.models import Project
+from segments.evaluator import SegmentIndex
 
 now = timezone.now()
 tomorrow = now + timedelta(days=1)
@@ -13,9 +13,11 @@ yesterday = now - timedelta(days=1)
 
 
 @pytest.mark.django_db()
-def test_get_segments_from_cache(project, monkeypatch):
+def test_get_segments_from_cache(project, monkeypatch, settings):
     # Given
+    settings.CACHE_PROJECT_SEGMENTS_SECONDS = 60
     mock_project_segments_cache = mock.MagicMock()
+    mock_project_segments_cache.get_many.return_value = {}
     mock_project_segments_cache.get.return_value = None
 
     monkeypatch.setattr(
@@ -27,16 +29,24 @@ def test_get_segments_from_cache(project, monkeypatch):
 
     # Then
     mock_project_segments_cache.get.assert_called_with(project.id)
-    mock_project_segments_cache.set.assert_called_with(
-        project.id, segments, timeout=settings.CACHE_PROJECT_SEGMENTS_SECONDS
+    mock_project_segments_cache.set.assert_any_call(
+        project.id, mock.ANY, timeout=60 + settings.CACHE_STALE_SECONDS
     )
+    segment_index = mock_project_segments_cache.set.call_args_list[0].args[1]
+    assert segment_index.segments == segments
 
 
 @pytest.mark.django_db()
-def test_get_segments_from_cache_set_not_called(project, segments, monkeypatch):
+def test_get_segments_from_cache_set_not_called(
+    project, segments, monkeypatch, settings
+):
     # Given
+    settings.CACHE_PROJECT_SEGMENTS_SECONDS = 60
     mock_project_segments_cache = mock.MagicMock()
-    mock_project_segments_cache.get.return_value = project.segments.all()
+    mock_project_segments_cache.get_many.return_value = {
+        project.id: SegmentIndex(project.segments.all()),
+        f"{project.id}:fresh": True,
+    }
 
     monkeypatch.setattr(
         "projects.models.project_segments_cache", mock_project_segments_cache
@@ -49,7 +59,9 @@ def test_get_segments_from_cache_set_not_called(project, segments, monkeypatch):
     assert segments
 
     # And correct calls to cache are made
-    mock_project_segments_cache.get.assert_called_once_with(project.id)
+    mock_project_segments_cache.get_many.assert_called_once_with(
+        [project.id, f"{project.id}:fresh"]
+    )
     mock_project_segments_cache.set.assert_not_called()
 
 
@@ -0,0 +1,391 @@
+"""
+Compiled segment rules for matching identities in the core API.
+
+Matching an identity against the `Segment`, `SegmentRule` and `Condition`
+models directly means re-parsing every condition value (and walking back up the
+rule tree for percentage splits) for every identity. Instead, each segment is
+compiled once into a tree of the classes below, with the condition values
+parsed up front, so that matching only needs to look up the identity's traits
+by key.
+
+The compiled segment is stored on the segment instance (see
+`Segment.get_compiled_segment`) and the project and environment segment caches
+store a `SegmentIndex` of the compiled segments, so that only the segments
+which reference the identity's traits need to be evaluated.
+"""
+import logging
+import typing
+from collections import defaultdict
+
+import semver
+from core.constants import BOOLEAN, FLOAT, INTEGER
+from flag_engine.utils.semver import is_semver, remove_semver_suffix
+
+from environments.identities.helpers import (
+    get_hashed_percentage_for_object_ids,
+)
+from segments.models import (
+    CONTAINS,
+    EQUAL,
+    GREATER_THAN,
+    GREATER_THAN_INCLUSIVE,
+    IN,
+    IS_NOT_SET,
+    IS_SET,
+    LESS_THAN,
+    LESS_THAN_INCLUSIVE,
+    MODULO,
+    NOT_CONTAINS,
+    NOT_EQUAL,
+    PERCENTAGE_SPLIT,
+    REGEX,
+    Condition,
+    Segment,
+    SegmentRule,
+)
+
+if typing.TYPE_CHECKING:
+    from environments.identities.models import Identity
+    from environments.identities.traits.models import Trait
+
+logger = logging.getLogger(__name__)
+
+try:
+    import re2 as re
+
+    logger.info("Using re2 library for regex.")
+except ImportError:
+    logger.warning("Unable to import re2. Falling back to re.")
+    import re
+
+TraitsByKey = typing.Dict[str, "Trait"]
+
+_COMPARISON_OPERATORS = {
+    EQUAL: lambda value, operand: value == operand,
+    NOT_EQUAL: lambda value, operand: value != operand,
+    GREATER_THAN: lambda value, operand: value > operand,
+    GREATER_THAN_INCLUSIVE: lambda value, operand: value >= operand,
+    LESS_THAN: lambda value, operand: value < operand,
+    LESS_THAN_INCLUSIVE: lambda value, operand: value <= operand,
+}
+_BOOLEAN_OPERATORS = {
+    operator: _COMPARISON_OPERATORS[operator] for operator in (EQUAL, NOT_EQUAL)
+}
+_STRING_OPERATORS = {
+    **_BOOLEAN_OPERATORS,
+    CONTAINS: lambda value, operand: operand in value,
+    NOT_CONTAINS: lambda value, operand: operand not in value,
+}
+
+_RULE_MATCHERS = {
+    SegmentRule.ALL_RULE: all,
+    SegmentRule.ANY_RULE: any,
+    SegmentRule.NONE_RULE: lambda results: not any(results),
+}
+
+
+def get_traits_by_key(traits: typing.Iterable["Trait"]) -> TraitsByKey:
+    traits_by_key = {}
+    for trait in traits:
+        # keep the first trait for a given key to match the behaviour of
+        # searching the list of traits
+        traits_by_key.setdefault(trait.trait_key, trait)
+    return traits_by_key
+
+
+class CompiledCondition:
+    __slots__ = (
+        "operator",
+        "property",
+        "integer_operand",
+        "float_operand",
+        "boolean_operand",
+        "is_semver",
+        "semver_operand",
+        "string_operand",
+        "regex",
+        "in_values",
+        "modulo_operands",
+    )
+
+    def __init__(self, condition: Condition) -> None:
+        self.operator = condition.operator
+        self.property = condition.property
+
+        value = condition.value
+        self.integer_operand = _parse(int, value)
+        self.float_operand = _parse(float, value)
+        self.boolean_operand = _parse_boolean(value)
+        self.is_semver = value is not None and is_semver(value)
+        self.semver_operand = (
+            _parse(semver.VersionInfo.parse, remove_semver_suffix(value))
+            if self.is_semver
+            else None
+        )
+        self.string_operand = str(value)
+        self.regex = (
+            _parse(re.compile, self.string_operand) if self.operator == REGEX else None
+        )
+        self.in_values = (
+            frozenset(value.split(","))
+            if self.operator == IN and value is not None
+            else frozenset()
+        )
+        self.modulo_operands = (
+            _parse_modulo_operands(value) if self.operator == MODULO else None
+        )
+
+    def get_trait_keys(self) -> typing.Set[str]:
+        return {self.property} if self.property is not None else set()
+
+    def can_match_without_traits(self) -> bool:
+        return self.operator == IS_NOT_SET
+
+    def matches(self, traits_by_key: TraitsByKey, identity: "Identity") -> bool:
+        trait = traits_by_key.get(self.property)
+        if trait is None:
+            return self.operator == IS_NOT_SET
+
+        if self.operator in (IS_SET, IS_NOT_SET):
+            return self.operator == IS_SET
+        elif self.operator == MODULO:
+            return (
+                trait.value_type in (INTEGER, FLOAT)
+                and self.modulo_operands is not None
+                and trait.trait_value % self.modulo_operands[0]
+                == self.modulo_operands[1]
+            )
+        elif self.operator == IN:
+            return str(trait.trait_value) in self.in_values
+        elif trait.value_type == INTEGER:
+            return _compare(
+                _COMPARISON_OPERATORS,
+                self.operator,
+                trait.integer_value,
+                self.integer_operand,
+            )
+        elif trait.value_type == FLOAT:
+            return _compare(
+                _COMPARISON_OPERATORS,
+                self.operator,
+                trait.float_value,
+                self.float_operand,
+            )
+        elif trait.value_type == BOOLEAN:
+            return _compare(
+                _BOOLEAN_OPERATORS,
+                self.operator,
+                trait.boolean_value,
+                self.boolean_operand,
+            )
+        elif self.is_semver:
+            return self._matches_semver(trait.string_value)
+        elif self.operator == REGEX:
+            return (
+                self.regex is not None
+                and self.regex.match(trait.string_value) is not None
+            )
+
+        return _compare(
+            _STRING_OPERATORS, self.operator, trait.string_value, self.string_operand
+        )
+
+    def _matches_semver(self, value: typing.Optional[str]) -> bool:
+        # neither an invalid condition value nor an invalid trait value can
+        # match, rather than falling back to comparing the strings
+        try:
+            return _compare(
+                _COMPARISON_OPERATORS, self.operator, value, self.semver_operand
+            )
+        except (TypeError, ValueError):
+            return False
+
+
+class CompiledPercentageSplitCondition:
+    __slots__ = ("segment_id", "threshold")
+
+    def __init__(self, condition: Condition, segment_id: int) -> None:
+        self.segment_id = segment_id
+        float_value = _parse(float, condition.value)
+        self.threshold = float_value / 100.0 if float_value is not None else None
+
+    def get_trait_keys(self) -> typing.Set[str]:
+        return set()
+
+    def can_match_without_traits(self) -> bool:
+        # this depends only on the identity, so we can't rule it out
+        return True
+
+    def matches(self, traits_by_key: TraitsByKey, identity: "Identity") -> bool:
+        return (
+            self.threshold is not None
+            and get_hashed_percentage_for_object_ids(
+                object_ids=[self.segment_id, identity.get_hash_key()]
+            )
+            <= self.threshold
+        )
+
+
+class CompiledRule:
+    __slots__ = ("match_type", "conditions", "rules")
+
+    def __init__(self, rule: SegmentRule, segment_id: int) -> None:
+        self.match_type = rule.type
+        self.conditions = tuple(
+            compile_condition(condition, segment_id)
+            for condition in rule.conditions.all()
+        )
+        self.rules = tuple(
+            CompiledRule(child_rule, segment_id) for child_rule in rule.rules.all()
+        )
+
+    def get_trait_keys(self) -> typing.Set[str]:
+        return set().union(
+            *(condition.get_trait_keys() for condition in self.conditions),
+            *(rule.get_trait_keys() for rule in self.rules),
+        )
+
+    def can_match_without_traits(self) -> bool:
+        """
+        Whether this rule could match an identity that has none of the traits it
+        references. This errs on the side of True where it can't be determined
+        without the identity, i.e. for percentage splits and NONE rules.
+        """
+        if self.conditions:
+            if self.match_type == SegmentRule.NONE_RULE:
+                conditions_can_match = True
+            elif self.match_type in _RULE_MATCHERS:
+                conditions_can_match = _RULE_MATCHERS[self.match_type](
+                    condition.can_match_without_traits()
+                    for condition in self.conditions
+                )
+            else:
+                conditions_can_match = False
+            if not conditions_can_match:
+                return False
+
+        return all(rule.can_match_without_traits() for rule in self.rules)
+
+    def matches(self, traits_by_key: TraitsByKey, identity: "Identity") -> bool:
+        if self.conditions:
+            rule_matcher = _RULE_MATCHERS.get(self.match_type)
+            if rule_matcher is None or not rule_matcher(
+                condition.matches(traits_by_key, identity)
+                for condition in self.conditions
+            ):
+                return False
+
+        return all(rule.matches(traits_by_key, identity) for rule in self.rules)
+
+
+class CompiledSegment:
+    __slots__ = ("segment_id", "rules")
+
+    def __init__(self, segment: Segment) -> None:
+        self.segment_id = segment.id
+        self.rules = tuple(
+            CompiledRule(rule, segment.id) for rule in segment.rules.all()
+        )
+
+    def get_trait_keys(self) -> typing.Set[str]:
+        return set().union(*(rule.get_trait_keys() for rule in self.rules))
+
+    def can_match_without_traits(self) -> bool:
+        return bool(self.rules) and all(
+            rule.can_match_without_traits() for rule in self.rules
+        )
+
+    def matches(self, traits_by_key: TraitsByKey, identity: "Identity") -> bool:
+        return bool(self.rules) and all(
+            rule.matches(traits_by_key, identity) for rule in self.rules
+        )
+
+
+class SegmentIndex:
+    """
+    Index of segments by the trait keys referenced by their rules so that only the
+    segments that could match a given identity need to be evaluated.
+
+    A segment that doesn't match an identity that has none of the traits it
+    references can only match identities that have at least one of them. Segments
+    that might match without any of their traits (e.g. those with percentage
+    split or IS_NOT_SET conditions) are always returned as candidates.
+    """
+
+    __slots__ = ("segments", "_positions_by_trait_key", "_traitless_positions")
+
+    def __init__(self, segments: typing.Iterable[Segment]) -> None:
+        self.segments = list(segments)
+
+        positions_by_trait_key = defaultdict(list)
+        traitless_positions = []
+        for position, segment in enumerate(self.segments):
+            compiled_segment = segment.get_compiled_segment()
+            if compiled_segment.can_match_without_traits():
+                traitless_positions.append(position)
+            for trait_key in compiled_segment.get_trait_keys():
+                positions_by_trait_key[trait_key].append(position)
+
+        self._positions_by_trait_key = {
+            trait_key: tuple(positions)
+            for trait_key, positions in positions_by_trait_key.items()
+        }
+        self._traitless_positions = tuple(traitless_positions)
+
+    def get_candidate_segments(
+        self, traits_by_key: TraitsByKey
+    ) -> typing.List[Segment]:
+        """
+        Get the segments that could match an identity with the given traits, in
+        the same order as the segments the index was built from.
+        """
+        positions = set(self._traitless_positions)
+        for trait_key in traits_by_key:
+            positions.update(self._positions_by_trait_key.get(trait_key, ()))
+        return [self.segments[position] for position in sorted(positions)]
+
+
+def compile_condition(
+    condition: Condition, segment_id: typing.Optional[int]
+) -> typing.Union[CompiledCondition, CompiledPercentageSplitCondition]:
+    if condition.operator == PERCENTAGE_SPLIT:
+        return CompiledPercentageSplitCondition(condition, segment_id)
+    return CompiledCondition(condition)
+
+
+def _compare(
+    operators: typing.Dict[str, typing.Callable[[typing.Any, typing.Any], bool]],
+    operator: str,
+    value: typing.Any,
+    operand: typing.Any,
+) -> bool:
+    if operand is None or operator not in operators:
+        return False
+    return operators[operator](value, operand)
+
+
+def _parse(
+    parser: typing.Callable[[str], typing.Any], value: typing.Optional[str]
+) -> typing.Any:
+    try:
+        return parser(str(value))
+    except (ValueError, re.error):
+        return None
+
+
+def _parse_boolean(value: typing.Optional[str]) -> typing.Optional[bool]:
+    if value in ("False", "false", "0"):
+        return False
+    elif value in ("True", "true", "1"):
+        return True
+    return None
+
+
+def _parse_modulo_operands(
+    value: typing.Optional[str],
+) -> typing.Optional[typing.Tuple[float, float]]:
+    try:
+        divisor, remainder = value.split("|")
+        return float(divisor), float(remainder)
+    except (AttributeError, ValueError):
+        return None
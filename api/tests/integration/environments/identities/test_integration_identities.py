@@ -176,12 +176,13 @@ def test_get_feature_states_for_identity_only_makes_one_query_to_get_mv_feature_
             variant_2_value,
         )
 
-    # When we make a request to get the flags for the identity, 6 queries are made
+    # When we make a request to get the flags for the identity, 5 queries are made
+    # (the environment has been cached when it was last updated)
     # TODO: can we reduce the number of queries?!
     base_url = reverse("api-v1:sdk-identities")
     url = f"{base_url}?identifier={identity_identifier}"
 
-    with django_assert_num_queries(6):
+    with django_assert_num_queries(5):
         first_identity_response = sdk_client.get(url)
 
     # Now, if we add another feature
@@ -207,7 +208,8 @@ def test_get_feature_states_for_identity_only_makes_one_query_to_get_mv_feature_
         variant_2_value,
     )
 
-    # Then one fewer db queries are made (since the environment is now cached)
+    # Then the same number of db queries are made (since the environment is
+    # cached again when it is updated)
     with django_assert_num_queries(5):
         second_identity_response = sdk_client.get(url)
 
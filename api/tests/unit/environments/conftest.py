@@ -1,6 +1,29 @@
+import typing
+
 import pytest
 
+from environments.models import Environment
+from util.mappers import map_environment_to_environment_document
+
+if typing.TYPE_CHECKING:
+    from util.mappers.dynamodb import Document
+
 
 @pytest.fixture()
 def mock_dynamo_env_wrapper(mocker):
     return mocker.patch("environments.models.environment_wrapper")
+
+
+@pytest.fixture()
+def environment_document_builder() -> typing.Callable[[Environment], "Document"]:
+    """
+    Build the environment document for an environment from the database, the
+    same way that the document cache and dynamo writes do.
+    """
+
+    def build_environment_document(environment: Environment) -> "Document":
+        return map_environment_to_environment_document(
+            Environment.objects.filter_for_document_builder(id=environment.id).get()
+        )
+
+    return build_environment_document
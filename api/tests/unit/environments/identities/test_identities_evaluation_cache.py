@@ -0,0 +1,203 @@
+import json
+
+import pytest
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from environments.identities.evaluation_cache import (
+    get_identity_evaluation_record,
+    identity_evaluation_cache,
+)
+from environments.identities.models import Identity
+from environments.identities.traits.models import Trait
+from environments.models import Environment, EnvironmentAPIKey
+from features.models import Feature, FeatureSegment, FeatureState
+from segments.models import Segment
+
+
+@pytest.fixture()
+def identity_evaluation_cache_enabled(settings):
+    settings.CACHE_ENVIRONMENT_EVALUATION_CONTEXT_SECONDS = 60
+    settings.CACHE_IDENTITY_EVALUATION_SECONDS = 60
+    identity_evaluation_cache.clear()
+    yield
+    identity_evaluation_cache.clear()
+
+
+@pytest.fixture()
+def identities_url(identity: Identity) -> str:
+    return "%s?identifier=%s" % (
+        reverse("api-v1:sdk-identities"),
+        identity.identifier,
+    )
+
+
+@pytest.fixture()
+def sdk_client(
+    api_client: APIClient, environment_api_key: EnvironmentAPIKey
+) -> APIClient:
+    api_client.credentials(HTTP_X_ENVIRONMENT_KEY=environment_api_key.key)
+    return api_client
+
+
+def _post_identity(client: APIClient, identifier: str, traits: list[dict]):
+    return client.post(
+        reverse("api-v1:sdk-identities"),
+        data=json.dumps({"identifier": identifier, "traits": traits}),
+        content_type="application/json",
+    )
+
+
+def test_get_identities_with_identity_evaluation_cache_matches_database(
+    sdk_client: APIClient,
+    environment: Environment,
+    identity: Identity,
+    trait: Trait,
+    feature: Feature,
+    identity_matching_segment: Segment,
+    identities_url: str,
+    settings,
+    django_assert_num_queries,
+) -> None:
+    # Given
+    feature_segment = FeatureSegment.objects.create(
+        feature=feature, segment=identity_matching_segment, environment=environment
+    )
+    FeatureState.objects.create(
+        feature=feature,
+        feature_segment=feature_segment,
+        environment=environment,
+        enabled=True,
+    )
+    override_feature = Feature.objects.create(
+        name="override_feature", project=environment.project
+    )
+    FeatureState.objects.create(
+        feature=override_feature,
+        identity=identity,
+        environment=environment,
+        enabled=True,
+    )
+
+    settings.CACHE_ENVIRONMENT_EVALUATION_CONTEXT_SECONDS = 60
+    database_response = sdk_client.get(identities_url)
+
+    settings.CACHE_IDENTITY_EVALUATION_SECONDS = 60
+    identity_evaluation_cache.clear()
+    sdk_client.get(identities_url)
+
+    # When
+    with django_assert_num_queries(0):
+        cached_response = sdk_client.get(identities_url)
+
+    # Then
+    assert cached_response.status_code == status.HTTP_200_OK
+    assert cached_response.json() == database_response.json()
+    identity_evaluation_cache.clear()
+
+
+def test_post_identities_updates_identity_evaluation_record_traits(
+    sdk_client: APIClient,
+    identity: Identity,
+    trait: Trait,
+    identities_url: str,
+    identity_evaluation_cache_enabled: None,
+    django_assert_num_queries,
+) -> None:
+    # Given
+    sdk_client.get(identities_url)
+
+    # When
+    response = _post_identity(
+        sdk_client,
+        identity.identifier,
+        [
+            {"trait_key": trait.trait_key, "trait_value": None},
+            {"trait_key": "new_trait", "trait_value": 1},
+        ],
+    )
+
+    # Then
+    assert response.status_code == status.HTTP_200_OK
+
+    # the cached record is updated with the traits, so repeat requests for the
+    # identity don't need to read from the database
+    with django_assert_num_queries(0):
+        get_response = sdk_client.get(identities_url)
+        repeat_post_response = _post_identity(
+            sdk_client,
+            identity.identifier,
+            [{"trait_key": "new_trait", "trait_value": 1}],
+        )
+
+    new_trait = Trait.objects.get(identity=identity, trait_key="new_trait")
+    expected_traits = [{"id": new_trait.id, "trait_key": "new_trait", "trait_value": 1}]
+    assert response.json()["traits"] == expected_traits
+    assert get_response.json()["traits"] == expected_traits
+    assert repeat_post_response.json()["traits"] == expected_traits
+
+
+def test_identity_override_invalidates_identity_evaluation_record(
+    sdk_client: APIClient,
+    environment: Environment,
+    identity: Identity,
+    feature: Feature,
+    identities_url: str,
+    identity_evaluation_cache_enabled: None,
+) -> None:
+    # Given
+    record = get_identity_evaluation_record(environment, identity.identifier)
+
+    # When
+    FeatureState.objects.create(
+        feature=feature, identity=identity, environment=environment, enabled=True
+    )
+
+    # Then
+    new_record = get_identity_evaluation_record(environment, identity.identifier)
+    assert new_record.version != record.version
+    assert [
+        feature_state.django_id for feature_state in new_record.identity_features
+    ] == [FeatureState.objects.get(identity=identity).id]
+
+
+def test_trait_write_changes_identity_etag(
+    sdk_client: APIClient,
+    identity: Identity,
+    trait: Trait,
+    identities_url: str,
+    identity_evaluation_cache_enabled: None,
+) -> None:
+    # Given
+    etag = sdk_client.get(identities_url).headers["ETag"]
+    assert (
+        sdk_client.get(identities_url, HTTP_IF_NONE_MATCH=etag).status_code
+        == status.HTTP_304_NOT_MODIFIED
+    )
+
+    # When
+    trait.string_value = "updated"
+    trait.save()
+
+    # Then
+    response = sdk_client.get(identities_url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["traits"][0]["trait_value"] == "updated"
+
+
+def test_identity_evaluation_record_is_not_used_for_deleted_identity(
+    sdk_client: APIClient,
+    environment: Environment,
+    identity: Identity,
+    identity_evaluation_cache_enabled: None,
+) -> None:
+    # Given
+    record = get_identity_evaluation_record(environment, identity.identifier)
+
+    # When
+    identity.delete()
+
+    # Then
+    assert get_identity_evaluation_record(environment, identity.identifier) is None
+    assert record is not None
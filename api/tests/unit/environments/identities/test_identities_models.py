@@ -1,7 +1,12 @@
+from django.db import IntegrityError
 from django.utils import timezone
+from pytest_mock import MockerFixture
 
 from environments.identities.models import Identity
-from features.models import Feature, FeatureState
+from environments.identities.traits.models import Trait
+from environments.models import Environment
+from features.models import Feature, FeatureSegment, FeatureState
+from segments.models import Segment
 
 
 def test_identity_get_all_feature_states_gets_latest_committed_version(environment):
@@ -66,3 +71,189 @@ def test_get_hash_key_with_use_identity_composite_key_for_hashing_disabled(
     assert identity.get_hash_key(use_identity_composite_key_for_hashing=False) == str(
         identity.id
     )
+
+
+def test_identity_get_all_feature_states_for_single_feature(
+    environment: Environment,
+    identity: Identity,
+    feature: Feature,
+    identity_matching_segment: Segment,
+) -> None:
+    # Given
+    Feature.objects.create(name="another_feature", project=environment.project)
+
+    feature_segment = FeatureSegment.objects.create(
+        feature=feature, segment=identity_matching_segment, environment=environment
+    )
+    segment_override = FeatureState.objects.create(
+        feature=feature,
+        feature_segment=feature_segment,
+        environment=environment,
+        enabled=True,
+    )
+
+    # When
+    feature_states = identity.get_all_feature_states(feature_name=feature.name)
+
+    # Then
+    assert feature_states == [segment_override]
+
+
+def test_identity_get_segments_for_single_feature_only_returns_overriding_segments(
+    environment: Environment,
+    identity: Identity,
+    feature: Feature,
+    identity_matching_segment: Segment,
+) -> None:
+    # Given
+    another_feature = Feature.objects.create(
+        name="another_feature", project=environment.project
+    )
+    feature_segment = FeatureSegment.objects.create(
+        feature=another_feature,
+        segment=identity_matching_segment,
+        environment=environment,
+    )
+    FeatureState.objects.create(
+        feature=another_feature,
+        feature_segment=feature_segment,
+        environment=environment,
+    )
+
+    # When
+    segments = identity.get_segments(overrides_only=True, feature_name=feature.name)
+    another_feature_segments = identity.get_segments(
+        overrides_only=True, feature_name=another_feature.name
+    )
+
+    # Then
+    assert segments == []
+    assert another_feature_segments == [identity_matching_segment]
+
+
+def test_identity_manager_get_or_create_in_bulk(
+    environment: Environment,
+    identity: Identity,
+    django_assert_num_queries,
+) -> None:
+    # When
+    with django_assert_num_queries(3):
+        identities, created_identifiers = Identity.objects.get_or_create_in_bulk(
+            environment, [identity.identifier, "new_identity"]
+        )
+
+    # Then
+    assert created_identifiers == {"new_identity"}
+    assert identities[identity.identifier] == identity
+    assert identities["new_identity"] == Identity.objects.get(
+        identifier="new_identity", environment=environment
+    )
+
+
+def test_identity_bulk_update_traits(
+    environment: Environment,
+    identity: Identity,
+    django_assert_num_queries,
+) -> None:
+    # Given
+    another_identity = Identity.objects.create(
+        identifier="another_identity", environment=environment
+    )
+    Trait.objects.create(identity=identity, trait_key="unchanged", string_value="a")
+    Trait.objects.create(identity=identity, trait_key="updated", string_value="a")
+    Trait.objects.create(identity=identity, trait_key="deleted", string_value="a")
+
+    trait_data_items_by_identity = {
+        identity: [
+            {"trait_key": "unchanged", "trait_value": "a"},
+            {"trait_key": "updated", "trait_value": "b"},
+            {"trait_key": "deleted", "trait_value": None},
+        ],
+        another_identity: [{"trait_key": "created", "trait_value": 1}],
+    }
+
+    # When
+    with django_assert_num_queries(4):
+        Identity.bulk_update_traits(trait_data_items_by_identity)
+
+    # Then
+    assert {
+        (t.identity_id, t.trait_key, t.trait_value) for t in Trait.objects.all()
+    } == {
+        (identity.id, "unchanged", "a"),
+        (identity.id, "updated", "b"),
+        (another_identity.id, "created", 1),
+    }
+
+
+def test_identity_update_traits_returns_traits_without_reading_them_back(
+    identity: Identity,
+    django_assert_num_queries,
+) -> None:
+    # Given
+    Trait.objects.create(identity=identity, trait_key="unchanged", string_value="a")
+    Trait.objects.create(identity=identity, trait_key="updated", string_value="a")
+    Trait.objects.create(identity=identity, trait_key="deleted", string_value="a")
+
+    trait_data_items = [
+        {"trait_key": "unchanged", "trait_value": "a"},
+        {"trait_key": "updated", "trait_value": "b"},
+        {"trait_key": "deleted", "trait_value": None},
+    ]
+
+    # When
+    # 1 query to fetch the current traits, 1 to delete and 1 to update
+    with django_assert_num_queries(3):
+        traits = identity.update_traits(trait_data_items)
+
+    # Then
+    assert traits == list(identity.identity_traits.all())
+    assert [(t.trait_key, t.trait_value) for t in traits] == [
+        ("unchanged", "a"),
+        ("updated", "b"),
+    ]
+
+
+def test_identity_update_traits_returns_created_traits_with_ids(
+    identity: Identity,
+    trait: Trait,
+) -> None:
+    # Given
+    trait_data_items = [
+        {"trait_key": "created", "trait_value": 1},
+        {"trait_key": trait.trait_key, "trait_value": "updated"},
+    ]
+
+    # When
+    traits = identity.update_traits(trait_data_items)
+
+    # Then
+    assert all(t.id is not None for t in traits)
+    assert traits == list(identity.identity_traits.all())
+    assert [(t.trait_key, t.trait_value) for t in traits] == [
+        (trait.trait_key, "updated"),
+        ("created", 1),
+    ]
+
+
+def test_identity_update_traits_reads_traits_back_on_conflict(
+    identity: Identity,
+    mocker: MockerFixture,
+) -> None:
+    # Given
+    # another request creates the trait while the traits are being updated
+    original_bulk_create = Trait.objects.bulk_create
+
+    def bulk_create(objs, *args, **kwargs):
+        if not kwargs.get("ignore_conflicts"):
+            raise IntegrityError()
+        return original_bulk_create(objs, *args, **kwargs)
+
+    mocker.patch.object(Trait.objects, "bulk_create", side_effect=bulk_create)
+
+    # When
+    traits = identity.update_traits([{"trait_key": "key", "trait_value": "b"}])
+
+    # Then
+    assert traits == list(identity.identity_traits.all())
+    assert traits[0].id is not None
@@ -1,13 +1,22 @@
+import json
+
+import pytest
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.test import APIClient
 
+from environments.identities.models import Identity
+from environments.identities.traits.models import Trait
 from environments.identities.views import IdentityViewSet
+from environments.models import Environment, EnvironmentAPIKey
 from environments.permissions.constants import (
     MANAGE_IDENTITIES,
     VIEW_IDENTITIES,
 )
 from environments.permissions.permissions import NestedEnvironmentPermissions
+from features.models import Feature, FeatureSegment, FeatureState
+from segments.models import Segment
 
 
 def test_user_with_view_identities_permission_can_retrieve_identity(
@@ -85,3 +94,136 @@ def test_identity_view_set_get_permissions():
         "partial_update": MANAGE_IDENTITIES,
         "destroy": MANAGE_IDENTITIES,
     }
+
+
+@pytest.mark.parametrize("evaluation_context_cache_seconds", (0, 60))
+def test_sdk_bulk_identities_returns_same_flags_as_sdk_identities(
+    api_client: APIClient,
+    environment: Environment,
+    environment_api_key: EnvironmentAPIKey,
+    identity: Identity,
+    feature: Feature,
+    multivariate_feature: Feature,
+    identity_matching_segment: Segment,
+    settings,
+    evaluation_context_cache_seconds: int,
+) -> None:
+    # Given
+    settings.CACHE_ENVIRONMENT_EVALUATION_CONTEXT_SECONDS = (
+        evaluation_context_cache_seconds
+    )
+
+    feature_segment = FeatureSegment.objects.create(
+        feature=feature, segment=identity_matching_segment, environment=environment
+    )
+    FeatureState.objects.create(
+        feature=feature,
+        feature_segment=feature_segment,
+        environment=environment,
+        enabled=True,
+    )
+
+    api_client.credentials(HTTP_X_ENVIRONMENT_KEY=environment_api_key.key)
+    bulk_data = [
+        {"identifier": identity.identifier},
+        {
+            "identifier": "new_identity",
+            "traits": [{"trait_key": "new_trait", "trait_value": 1}],
+        },
+    ]
+
+    # When
+    response = api_client.post(
+        reverse("api-v1:sdk-identities-bulk"),
+        data=json.dumps(bulk_data),
+        content_type="application/json",
+    )
+
+    # Then
+    assert response.status_code == status.HTTP_200_OK
+    response_json = response.json()
+    assert [item["identifier"] for item in response_json] == [
+        identity.identifier,
+        "new_identity",
+    ]
+
+    for identity_data, bulk_response_item in zip(bulk_data, response_json):
+        single_response = api_client.post(
+            reverse("api-v1:sdk-identities"),
+            data=json.dumps(identity_data),
+            content_type="application/json",
+        )
+        assert bulk_response_item["flags"] == single_response.json()["flags"]
+        assert bulk_response_item["traits"] == single_response.json()["traits"]
+
+    assert Trait.objects.filter(
+        identity__identifier="new_identity", trait_key="new_trait"
+    ).exists()
+
+
+def test_sdk_bulk_identities_rejects_duplicate_identifiers(
+    api_client: APIClient,
+    environment: Environment,
+) -> None:
+    # Given
+    api_client.credentials(HTTP_X_ENVIRONMENT_KEY=environment.api_key)
+    data = [{"identifier": "identity"}, {"identifier": "identity"}]
+
+    # When
+    response = api_client.post(
+        reverse("api-v1:sdk-identities-bulk"),
+        data=json.dumps(data),
+        content_type="application/json",
+    )
+
+    # Then
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert not Identity.objects.filter(environment=environment).exists()
+
+
+def test_sdk_bulk_identities_rejects_too_many_identities(
+    api_client: APIClient,
+    environment: Environment,
+    settings,
+) -> None:
+    # Given
+    settings.SDK_BULK_IDENTIFY_MAX_IDENTITIES = 1
+    api_client.credentials(HTTP_X_ENVIRONMENT_KEY=environment.api_key)
+    data = [{"identifier": "identity_1"}, {"identifier": "identity_2"}]
+
+    # When
+    response = api_client.post(
+        reverse("api-v1:sdk-identities-bulk"),
+        data=json.dumps(data),
+        content_type="application/json",
+    )
+
+    # Then
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_sdk_bulk_identities_rejects_traits_with_client_key(
+    api_client: APIClient,
+    environment: Environment,
+) -> None:
+    # Given
+    environment.allow_client_traits = False
+    environment.save()
+
+    api_client.credentials(HTTP_X_ENVIRONMENT_KEY=environment.api_key)
+    data = [
+        {
+            "identifier": "identity",
+            "traits": [{"trait_key": "foo", "trait_value": "bar"}],
+        }
+    ]
+
+    # When
+    response = api_client.post(
+        reverse("api-v1:sdk-identities-bulk"),
+        data=json.dumps(data),
+        content_type="application/json",
+    )
+
+    # Then
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
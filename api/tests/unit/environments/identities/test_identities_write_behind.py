@@ -0,0 +1,176 @@
+import json
+
+import pytest
+from django.urls import reverse
+from pytest_mock import MockerFixture
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from environments.identities.models import Identity
+from environments.identities.traits.models import Trait
+from environments.identities.write_behind import (
+    IdentityWriteBuffer,
+    identity_write_buffer,
+)
+from environments.models import Environment, EnvironmentAPIKey
+
+
+@pytest.fixture()
+def write_behind_enabled(settings):
+    settings.SDK_IDENTITY_WRITE_BEHIND = True
+    settings.SDK_IDENTITY_WRITE_BEHIND_FLUSH_SECONDS = 60
+    yield
+    identity_write_buffer.flush()
+
+
+def test_identify_with_traits_persists_traits_when_buffer_flushed(
+    api_client: APIClient,
+    environment: Environment,
+    environment_api_key: EnvironmentAPIKey,
+    identity: Identity,
+    trait: Trait,
+    write_behind_enabled: None,
+) -> None:
+    # Given
+    api_client.credentials(HTTP_X_ENVIRONMENT_KEY=environment_api_key.key)
+    data = {
+        "identifier": identity.identifier,
+        "traits": [
+            {"trait_key": trait.trait_key, "trait_value": None},
+            {"trait_key": "new_trait", "trait_value": 1},
+        ],
+    }
+
+    # When
+    response = api_client.post(
+        reverse("api-v1:sdk-identities"),
+        data=json.dumps(data),
+        content_type="application/json",
+    )
+
+    # Then
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["traits"] == [
+        {"id": None, "trait_key": "new_trait", "trait_value": 1}
+    ]
+
+    # the traits have not been written yet
+    assert list(identity.identity_traits.all()) == [trait]
+
+    # but they are once the buffer is flushed
+    identity_write_buffer.flush()
+    assert [(t.trait_key, t.trait_value) for t in identity.identity_traits.all()] == [
+        ("new_trait", 1)
+    ]
+
+
+def test_create_trait_creates_identity_and_trait_when_buffer_flushed(
+    api_client: APIClient,
+    environment: Environment,
+    environment_api_key: EnvironmentAPIKey,
+    write_behind_enabled: None,
+) -> None:
+    # Given
+    api_client.credentials(HTTP_X_ENVIRONMENT_KEY=environment_api_key.key)
+    data = {
+        "identity": {"identifier": "new_identity"},
+        "trait_key": "foo",
+        "trait_value": "bar",
+    }
+
+    # When
+    response = api_client.post(
+        reverse("api-v1:sdk-traits-list"),
+        data=json.dumps(data),
+        content_type="application/json",
+    )
+
+    # Then
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == data
+    assert not Identity.objects.filter(identifier="new_identity").exists()
+
+    identity_write_buffer.flush()
+    assert (
+        Trait.objects.get(
+            identity__identifier="new_identity", identity__environment=environment
+        ).trait_value
+        == "bar"
+    )
+
+
+def test_identity_write_buffer_keeps_latest_trait_values(
+    environment: Environment,
+    identity: Identity,
+    write_behind_enabled: None,
+) -> None:
+    # Given
+    write_buffer = IdentityWriteBuffer()
+    write_buffer.add(
+        environment.id,
+        identity.identifier,
+        [{"trait_key": "foo", "trait_value": "bar"}],
+    )
+    write_buffer.add(
+        environment.id,
+        identity.identifier,
+        [{"trait_key": "foo", "trait_value": {"type": "int", "value": 2}}],
+    )
+
+    # When
+    write_buffer.flush()
+
+    # Then
+    assert [(t.trait_key, t.trait_value) for t in identity.identity_traits.all()] == [
+        ("foo", 2)
+    ]
+
+
+def test_identity_write_buffer_flushes_when_batch_size_reached(
+    environment: Environment,
+    settings,
+    mocker: MockerFixture,
+) -> None:
+    # Given
+    settings.SDK_IDENTITY_WRITE_BEHIND_FLUSH_SECONDS = 60
+    settings.SDK_IDENTITY_WRITE_BEHIND_BATCH_SIZE = 2
+    mock_persist_identity_traits = mocker.patch(
+        "environments.identities.write_behind.persist_identity_traits"
+    )
+    write_buffer = IdentityWriteBuffer()
+
+    # When
+    write_buffer.add(environment.id, "identity_1", [])
+    mock_persist_identity_traits.delay.assert_not_called()
+    write_buffer.add(environment.id, "identity_2", [])
+
+    # Then
+    mock_persist_identity_traits.delay.assert_called_once_with(
+        kwargs={
+            "environment_id": environment.id,
+            "identity_trait_items": {"identity_1": [], "identity_2": []},
+        }
+    )
+
+
+def test_identity_write_buffer_flush_outside_request_closes_connections(
+    environment: Environment,
+    mocker: MockerFixture,
+) -> None:
+    # Given
+    mock_persist_identity_traits = mocker.patch(
+        "environments.identities.write_behind.persist_identity_traits"
+    )
+    mocker.patch("environments.identities.write_behind.close_old_connections")
+    mock_connections = mocker.patch("environments.identities.write_behind.connections")
+    mock_persist_identity_traits.delay.side_effect = RuntimeError
+    write_buffer = IdentityWriteBuffer()
+    write_buffer.add(environment.id, "identity_1", [])
+
+    # When
+    with pytest.raises(RuntimeError):
+        write_buffer.flush_outside_request()
+
+    # Then
+    mock_persist_identity_traits.delay.assert_called_once()
+    mock_connections.close_all.assert_called_once_with()
@@ -1,9 +1,15 @@
+import json
+
+import pytest
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.test import APIClient
 
+from environments.identities.models import Identity
 from environments.identities.traits.models import Trait
 from environments.identities.traits.views import TraitViewSet
+from environments.models import Environment, EnvironmentAPIKey
 from environments.permissions.constants import (
     MANAGE_IDENTITIES,
     VIEW_ENVIRONMENT,
@@ -105,3 +111,137 @@ def test_edge_identity_view_set_get_permissions():
         "partial_update": MANAGE_IDENTITIES,
         "destroy": MANAGE_IDENTITIES,
     }
+
+
+@pytest.mark.parametrize("num_identities", (1, 10))
+def test_sdk_bulk_create_traits_uses_fixed_number_of_queries(
+    api_client: APIClient,
+    environment: Environment,
+    environment_api_key: EnvironmentAPIKey,
+    identity: Identity,
+    trait: Trait,
+    django_assert_max_num_queries,
+    num_identities: int,
+) -> None:
+    # Given
+    api_client.credentials(HTTP_X_ENVIRONMENT_KEY=environment_api_key.key)
+    url = reverse("api-v1:sdk-traits-bulk-create")
+
+    data = [
+        {
+            "identity": {"identifier": identity.identifier},
+            "trait_key": trait.trait_key,
+            "trait_value": None,
+        },
+        {
+            "identity": {"identifier": identity.identifier},
+            "trait_key": "updated_trait",
+            "trait_value": "updated",
+        },
+    ]
+    for i in range(num_identities):
+        data.extend(
+            {
+                "identity": {"identifier": f"identity_{i}"},
+                "trait_key": f"trait_{j}",
+                "trait_value": j,
+            }
+            for j in range(3)
+        )
+
+    # When
+    with django_assert_max_num_queries(12):
+        response = api_client.put(
+            url, data=json.dumps(data), content_type="application/json"
+        )
+
+    # Then
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()) == len(data) - 1
+
+    assert not Trait.objects.filter(id=trait.id).exists()
+    assert identity.identity_traits.get().trait_value == "updated"
+    assert (
+        Trait.objects.filter(identity__identifier__startswith="identity_").count()
+        == num_identities * 3
+    )
+
+
+def test_sdk_bulk_create_traits_deletes_traits_with_null_values(
+    api_client: APIClient,
+    environment: Environment,
+    environment_api_key: EnvironmentAPIKey,
+    identity: Identity,
+    trait: Trait,
+) -> None:
+    # Given
+    api_client.credentials(HTTP_X_ENVIRONMENT_KEY=environment_api_key.key)
+    url = reverse("api-v1:sdk-traits-bulk-create")
+    other_trait = Trait.objects.create(
+        identity=identity, trait_key="other_trait", string_value="other"
+    )
+    other_identity = Identity.objects.create(
+        identifier="other_identity", environment=environment
+    )
+    other_identity_trait = Trait.objects.create(
+        identity=other_identity, trait_key=trait.trait_key, string_value="value"
+    )
+
+    data = [
+        {
+            "identity": {"identifier": identity.identifier},
+            "trait_key": trait.trait_key,
+            "trait_value": None,
+        },
+        {
+            "identity": {"identifier": other_identity.identifier},
+            "trait_key": other_trait.trait_key,
+            "trait_value": None,
+        },
+    ]
+
+    # When
+    response = api_client.put(
+        url, data=json.dumps(data), content_type="application/json"
+    )
+
+    # Then
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == []
+
+    assert not Trait.objects.filter(id=trait.id).exists()
+    # only the given trait keys are deleted for each identity
+    assert Trait.objects.filter(id=other_trait.id).exists()
+    assert Trait.objects.filter(id=other_identity_trait.id).exists()
+
+
+def test_sdk_increment_trait_value_uses_single_statement_for_trait(
+    api_client: APIClient,
+    environment: Environment,
+    environment_api_key: EnvironmentAPIKey,
+    identity: Identity,
+    django_assert_num_queries,
+) -> None:
+    # Given
+    api_client.credentials(HTTP_X_ENVIRONMENT_KEY=environment_api_key.key)
+    url = reverse("api-v1:sdk-traits-increment-value")
+    data = {
+        "trait_key": "login_count",
+        "identifier": identity.identifier,
+        "increment_by": 2,
+    }
+    api_client.post(url, data=data)
+
+    # When
+    # 1 query to get the identity and 1 to increment the trait
+    with django_assert_num_queries(2):
+        response = api_client.post(url, data=data)
+
+    # Then
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {
+        "trait_key": "login_count",
+        "trait_value": 4,
+        "identifier": identity.identifier,
+    }
+    assert identity.identity_traits.get(trait_key="login_count").trait_value == 4
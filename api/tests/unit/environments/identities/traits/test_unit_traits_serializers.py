@@ -48,16 +48,18 @@ def test_bulk_create_update_serializer_save_many(
     mocked_request = mocker.MagicMock(environment=identity.environment)
 
     # When
-    with django_assert_num_queries(6):
+    # (the traits to delete are looked up by id before they are deleted)
+    with django_assert_num_queries(7):
         serializer = SDKBulkCreateUpdateTraitSerializer(
             data=data,
             many=True,
             context={"environment": identity.environment, "request": mocked_request},
         )
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        instance = serializer.save()
 
     # Then
+    assert instance is serializer.instance
     assert identity.identity_traits.count() == 3
     assert (
         identity.identity_traits.get(trait_key=trait_key_to_update).trait_value
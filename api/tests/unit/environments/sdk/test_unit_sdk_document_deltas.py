@@ -0,0 +1,267 @@
+import typing
+from copy import deepcopy
+
+from core.constants import FLAGSMITH_UPDATED_AT_HEADER
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from environments.models import Environment, EnvironmentAPIKey
+from environments.sdk.document_deltas import (
+    add_environment_document_version,
+    build_environment_document_delta,
+    environment_document_cache,
+    get_environment_document_delta,
+    get_environment_document_version,
+)
+from features.models import Feature, FeatureState
+from segments.models import Segment
+
+if typing.TYPE_CHECKING:
+    from util.mappers.dynamodb import Document
+
+
+def _apply_delta(
+    base_document: "Document", delta: typing.Dict[str, typing.Any]
+) -> "Document":
+    def apply_items(
+        items: typing.List["Document"],
+        item_delta: typing.Dict[str, list],
+        key: typing.Callable[["Document"], typing.Any],
+    ) -> typing.List["Document"]:
+        updated_items = {key(item): item for item in item_delta["updated"]}
+        removed_keys = {*item_delta["removed"], *updated_items}
+        return sorted(
+            [
+                *(item for item in items if key(item) not in removed_keys),
+                *updated_items.values(),
+            ],
+            key=key,
+        )
+
+    document = deepcopy(base_document)
+    document.update(delta["attributes"])
+    document["project"].update(delta["project"])
+    document["feature_states"] = apply_items(
+        document["feature_states"],
+        delta["feature_states"],
+        key=lambda feature_state: feature_state["feature"]["id"],
+    )
+    document["project"]["segments"] = apply_items(
+        document["project"]["segments"],
+        delta["segments"],
+        key=lambda segment: segment["id"],
+    )
+    return document
+
+
+def test_build_environment_document_delta_applies_to_base_document(
+    environment: Environment,
+    feature: Feature,
+    feature_state: FeatureState,
+    segment: Segment,
+    environment_document_builder: typing.Callable[[Environment], "Document"],
+) -> None:
+    # Given
+    base_document = environment_document_builder(environment)
+
+    new_feature = Feature.objects.create(
+        name="new_feature", project=environment.project
+    )
+    FeatureState.objects.filter(id=feature_state.id).update(enabled=True)
+    Segment.objects.create(name="new_segment", project=environment.project)
+    segment.delete()
+    Environment.objects.filter(id=environment.id).update(
+        name="renamed_environment", updated_at=timezone.now()
+    )
+    environment.refresh_from_db()
+    environment_document = environment_document_builder(environment)
+
+    # When
+    delta = build_environment_document_delta(base_document, environment_document)
+
+    # Then
+    assert _apply_delta(base_document, delta) == environment_document
+    assert {
+        feature_state["feature"]["id"]
+        for feature_state in delta["feature_states"]["updated"]
+    } == {feature.id, new_feature.id}
+    assert delta["segments"]["removed"] == [segment.id]
+    assert set(delta["attributes"]) == {"name", "updated_at"}
+
+
+def test_get_environment_document_delta_returns_full_document_for_unknown_version(
+    settings,
+    environment: Environment,
+    environment_document_builder: typing.Callable[[Environment], "Document"],
+) -> None:
+    # Given
+    settings.ENVIRONMENT_DOCUMENT_DELTA_VERSIONS = 2
+    environment_document = environment_document_builder(environment)
+    add_environment_document_version(environment, environment_document)
+
+    # When
+    deltas = [
+        get_environment_document_delta(environment, environment_document, version)
+        for version in (None, "not-a-version", "0.0")
+    ]
+
+    # Then
+    assert deltas == [{"delta": False, "document": environment_document}] * 3
+
+
+def test_add_environment_document_version_evicts_oldest_version(
+    settings,
+    environment: Environment,
+    environment_document_builder: typing.Callable[[Environment], "Document"],
+) -> None:
+    # Given
+    settings.ENVIRONMENT_DOCUMENT_DELTA_VERSIONS = 2
+    versions = []
+    for _ in range(3):
+        Environment.objects.filter(id=environment.id).update(updated_at=timezone.now())
+        environment.refresh_from_db()
+        versions.append(get_environment_document_version(environment))
+
+        # When
+        add_environment_document_version(
+            environment, environment_document_builder(environment)
+        )
+
+    # Then
+    assert environment_document_cache.get(f"{environment.api_key}:versions") == (
+        versions[1:]
+    )
+    assert (
+        environment_document_cache.get(f"{environment.api_key}:versions:{versions[0]}")
+        is None
+    )
+    environment_document = environment_document_builder(environment)
+    assert get_environment_document_delta(
+        environment, environment_document, versions[1]
+    )["delta"]
+
+
+def test_add_environment_document_version_expires_versions(
+    settings,
+    environment: Environment,
+    mocker,
+    environment_document_builder: typing.Callable[[Environment], "Document"],
+) -> None:
+    # Given
+    settings.ENVIRONMENT_DOCUMENT_DELTA_VERSIONS = 2
+    settings.ENVIRONMENT_DOCUMENT_DELTA_VERSION_SECONDS = 120
+    set_many = mocker.spy(environment_document_cache, "set_many")
+
+    # When
+    add_environment_document_version(
+        environment, environment_document_builder(environment)
+    )
+
+    # Then
+    set_many.assert_called_once_with(mocker.ANY, timeout=120)
+
+
+def test_add_environment_document_version_skips_version_while_locked(
+    settings,
+    environment: Environment,
+    environment_document_builder: typing.Callable[[Environment], "Document"],
+) -> None:
+    # Given
+    settings.ENVIRONMENT_DOCUMENT_DELTA_VERSIONS = 2
+    versions_key = f"{environment.api_key}:versions"
+    # another worker is updating the versions
+    environment_document_cache.set(versions_key, ["other-version"], timeout=60)
+    environment_document_cache.add(f"{versions_key}:building", True, timeout=60)
+
+    # When
+    add_environment_document_version(
+        environment, environment_document_builder(environment)
+    )
+
+    # Then
+    assert environment_document_cache.get(versions_key) == ["other-version"]
+    assert environment_document_cache.get(f"{versions_key}:building") is True
+
+
+def test_add_environment_document_version_releases_lock(
+    settings,
+    environment: Environment,
+    environment_document_builder: typing.Callable[[Environment], "Document"],
+) -> None:
+    # Given
+    settings.ENVIRONMENT_DOCUMENT_DELTA_VERSIONS = 2
+    versions_key = f"{environment.api_key}:versions"
+
+    # When
+    add_environment_document_version(
+        environment, environment_document_builder(environment)
+    )
+
+    # Then
+    assert environment_document_cache.get(versions_key) == [
+        get_environment_document_version(environment)
+    ]
+    assert environment_document_cache.get(f"{versions_key}:building") is None
+
+
+def test_get_environment_document_delta_returns_full_document_after_scheduled_change(
+    settings,
+    environment: Environment,
+    feature: Feature,
+    environment_document_builder: typing.Callable[[Environment], "Document"],
+) -> None:
+    # Given
+    settings.ENVIRONMENT_DOCUMENT_DELTA_VERSIONS = 2
+    environment_document = environment_document_builder(environment)
+    add_environment_document_version(environment, environment_document)
+    version = get_environment_document_version(environment)
+
+    # a scheduled change that has gone live since the version was added
+    FeatureState.objects.filter(environment=environment, feature=feature).update(
+        live_from=timezone.now()
+    )
+
+    # When
+    delta = get_environment_document_delta(environment, environment_document, version)
+
+    # Then
+    assert delta["delta"] is False
+
+
+def test_get_environment_document_delta_view(
+    settings,
+    environment: Environment,
+    feature: Feature,
+    feature_state: FeatureState,
+    environment_api_key: EnvironmentAPIKey,
+) -> None:
+    # Given
+    settings.ENVIRONMENT_DOCUMENT_DELTA_VERSIONS = 2
+    environment.rebuild_environment_document_cache()
+    version = get_environment_document_version(environment)
+
+    feature_state.enabled = True
+    feature_state.save()
+    environment.refresh_from_db()
+
+    client = APIClient()
+    client.credentials(HTTP_X_ENVIRONMENT_KEY=environment_api_key.key)
+    url = reverse("api-v1:environment-document-delta")
+
+    # When
+    response = client.get(url, data={"since": version})
+
+    # Then
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers[FLAGSMITH_UPDATED_AT_HEADER] == str(
+        environment.updated_at.timestamp()
+    )
+    response_json = response.json()
+    assert response_json["delta"] is True
+    assert [
+        (feature_state["feature"]["id"], feature_state["enabled"])
+        for feature_state in response_json["feature_states"]["updated"]
+    ] == [(feature.id, True)]
+    assert response_json["segments"] == {"updated": [], "removed": []}
@@ -0,0 +1,208 @@
+from datetime import timedelta
+
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from audit.models import AuditLog
+from environments.identities.evaluation_cache import identity_evaluation_cache
+from environments.identities.models import Identity
+from environments.identities.traits.models import Trait
+from environments.models import Environment, EnvironmentAPIKey
+from features.flags_cache import flags_cache
+from features.models import Feature, FeatureState
+
+
+@pytest.fixture()
+def identity_evaluation_cache_enabled(settings):
+    settings.CACHE_ENVIRONMENT_EVALUATION_CONTEXT_SECONDS = 60
+    settings.CACHE_IDENTITY_EVALUATION_SECONDS = 60
+    identity_evaluation_cache.clear()
+    yield
+    identity_evaluation_cache.clear()
+
+
+def test_get_flags_returns_304_if_etag_matches(
+    api_client: APIClient,
+    environment: Environment,
+    feature: Feature,
+    django_assert_num_queries,
+) -> None:
+    # Given
+    api_client.credentials(HTTP_X_ENVIRONMENT_KEY=environment.api_key)
+    url = reverse("api-v1:flags")
+
+    first_response = api_client.get(url)
+    etag = first_response.headers["ETag"]
+
+    # When
+    with django_assert_num_queries(0):
+        response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    # Then
+    assert first_response.status_code == status.HTTP_200_OK
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.headers["ETag"] == etag
+
+
+def test_get_flags_returns_new_etag_when_environment_updated(
+    api_client: APIClient,
+    environment: Environment,
+    feature: Feature,
+) -> None:
+    # Given
+    api_client.credentials(HTTP_X_ENVIRONMENT_KEY=environment.api_key)
+    url = reverse("api-v1:flags")
+
+    etag = api_client.get(url).headers["ETag"]
+
+    AuditLog.objects.create(project=environment.project, environment=environment)
+
+    # When
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    # Then
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["ETag"] != etag
+
+
+def test_get_flags_etag_differs_for_client_and_server_keys(
+    api_client: APIClient,
+    environment: Environment,
+    environment_api_key: EnvironmentAPIKey,
+    feature: Feature,
+) -> None:
+    # Given
+    url = reverse("api-v1:flags")
+
+    api_client.credentials(HTTP_X_ENVIRONMENT_KEY=environment.api_key)
+    client_etag = api_client.get(url).headers["ETag"]
+
+    # When
+    api_client.credentials(HTTP_X_ENVIRONMENT_KEY=environment_api_key.key)
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=client_etag)
+
+    # Then
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["ETag"] != client_etag
+
+
+def test_get_identities_returns_304_if_etag_matches(
+    api_client: APIClient,
+    environment: Environment,
+    identity: Identity,
+    feature: Feature,
+    identity_evaluation_cache_enabled: None,
+) -> None:
+    # Given
+    api_client.credentials(HTTP_X_ENVIRONMENT_KEY=environment.api_key)
+    url = "%s?identifier=%s" % (reverse("api-v1:sdk-identities"), identity.identifier)
+
+    etag = api_client.get(url).headers["ETag"]
+
+    # When
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    # Then
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+def test_get_identities_returns_new_etag_when_traits_updated(
+    api_client: APIClient,
+    environment: Environment,
+    identity: Identity,
+    feature: Feature,
+    identity_evaluation_cache_enabled: None,
+) -> None:
+    # Given
+    api_client.credentials(HTTP_X_ENVIRONMENT_KEY=environment.api_key)
+    url = "%s?identifier=%s" % (reverse("api-v1:sdk-identities"), identity.identifier)
+
+    etag = api_client.get(url).headers["ETag"]
+
+    Trait.objects.create(identity=identity, trait_key="foo", string_value="bar")
+
+    # When
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    # Then
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["ETag"] != etag
+
+
+def test_get_identities_does_not_query_for_etag_if_identity_evaluation_cache_disabled(
+    api_client: APIClient,
+    environment: Environment,
+    identity: Identity,
+    feature: Feature,
+    settings,
+    mocker,
+) -> None:
+    # Given
+    settings.CACHE_IDENTITY_EVALUATION_SECONDS = 0
+    get_identity_evaluation_record = mocker.patch(
+        "environments.sdk.etags.get_identity_evaluation_record"
+    )
+
+    api_client.credentials(HTTP_X_ENVIRONMENT_KEY=environment.api_key)
+    url = "%s?identifier=%s" % (reverse("api-v1:sdk-identities"), identity.identifier)
+
+    # When
+    response = api_client.get(url)
+
+    # Then
+    assert response.status_code == status.HTTP_200_OK
+    assert "ETag" not in response.headers
+    get_identity_evaluation_record.assert_not_called()
+
+
+def test_get_environment_document_returns_304_if_etag_matches(
+    api_client: APIClient,
+    environment_api_key: EnvironmentAPIKey,
+    feature: Feature,
+) -> None:
+    # Given
+    api_client.credentials(HTTP_X_ENVIRONMENT_KEY=environment_api_key.key)
+    url = reverse("api-v1:environment-document")
+
+    etag = api_client.get(url).headers["ETag"]
+
+    # When
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    # Then
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+@pytest.mark.freeze_time()
+def test_get_flags_returns_new_etag_when_scheduled_change_goes_live(
+    api_client: APIClient,
+    environment: Environment,
+    feature: Feature,
+    freezer,
+) -> None:
+    # Given
+    flags_cache.clear()
+    live_from = timezone.now() + timedelta(hours=1)
+    FeatureState.objects.create(
+        environment=environment,
+        feature=feature,
+        live_from=live_from,
+        version=2,
+        enabled=True,
+    )
+
+    api_client.credentials(HTTP_X_ENVIRONMENT_KEY=environment.api_key)
+    url = reverse("api-v1:flags")
+
+    etag = api_client.get(url).headers["ETag"]
+
+    # When
+    freezer.move_to(live_from + timedelta(seconds=1))
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    # Then
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()[0]["enabled"] is True
@@ -0,0 +1,192 @@
+import json
+
+import pytest
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from environments.identities.models import Identity
+from environments.models import Environment, EnvironmentAPIKey
+from environments.sdk.evaluation import get_environment_evaluation_context
+from features.flags_cache import flags_cache
+from features.models import Feature, FeatureSegment, FeatureState
+from integrations.mixpanel.models import MixpanelConfiguration
+from segments.models import Segment
+
+
+@pytest.fixture()
+def evaluation_environment(
+    environment: Environment,
+    identity: Identity,
+    feature: Feature,
+    multivariate_feature: Feature,
+    identity_matching_segment: Segment,
+) -> Environment:
+    # a segment override for the standard feature
+    feature_segment = FeatureSegment.objects.create(
+        feature=feature, segment=identity_matching_segment, environment=environment
+    )
+    segment_override = FeatureState.objects.create(
+        feature=feature,
+        feature_segment=feature_segment,
+        environment=environment,
+        enabled=True,
+    )
+    segment_override.feature_state_value.string_value = "segment override"
+    segment_override.feature_state_value.save()
+
+    # an identity override for another feature
+    overridden_feature = Feature.objects.create(
+        name="overridden_feature", project=environment.project
+    )
+    FeatureState.objects.create(
+        feature=overridden_feature,
+        identity=identity,
+        environment=environment,
+        enabled=True,
+    )
+
+    # and a server key only feature
+    Feature.objects.create(
+        name="server_key_only_feature",
+        project=environment.project,
+        is_server_key_only=True,
+    )
+
+    flags_cache.clear()
+    return environment
+
+
+def _sort_flags(response_json: dict) -> list[dict]:
+    return sorted(response_json["flags"], key=lambda flag: flag["feature"]["id"])
+
+
+@pytest.mark.parametrize("hide_sensitive_data", (False, True))
+@pytest.mark.parametrize("use_server_key", (False, True))
+def test_get_identities_evaluated_in_memory_matches_database_evaluation(
+    api_client: APIClient,
+    evaluation_environment: Environment,
+    environment_api_key: EnvironmentAPIKey,
+    identity: Identity,
+    settings,
+    hide_sensitive_data: bool,
+    use_server_key: bool,
+) -> None:
+    # Given
+    evaluation_environment.hide_sensitive_data = hide_sensitive_data
+    evaluation_environment.save()
+
+    api_client.credentials(
+        HTTP_X_ENVIRONMENT_KEY=(
+            environment_api_key.key
+            if use_server_key
+            else evaluation_environment.api_key
+        )
+    )
+    url = "%s?identifier=%s" % (reverse("api-v1:sdk-identities"), identity.identifier)
+
+    settings.CACHE_ENVIRONMENT_EVALUATION_CONTEXT_SECONDS = 0
+    database_response = api_client.get(url)
+
+    # When
+    settings.CACHE_ENVIRONMENT_EVALUATION_CONTEXT_SECONDS = 60
+    in_memory_response = api_client.get(url)
+
+    # Then
+    assert in_memory_response.status_code == status.HTTP_200_OK
+    assert _sort_flags(in_memory_response.json()) == _sort_flags(
+        database_response.json()
+    )
+    assert in_memory_response.json()["traits"] == database_response.json()["traits"]
+
+
+def test_post_identities_evaluated_in_memory_matches_database_evaluation(
+    api_client: APIClient,
+    evaluation_environment: Environment,
+    environment_api_key: EnvironmentAPIKey,
+    identity: Identity,
+    settings,
+) -> None:
+    # Given
+    api_client.credentials(HTTP_X_ENVIRONMENT_KEY=environment_api_key.key)
+    url = reverse("api-v1:sdk-identities")
+    data = json.dumps(
+        {
+            "identifier": identity.identifier,
+            "traits": [{"trait_key": "new_trait", "trait_value": 1}],
+        }
+    )
+
+    settings.CACHE_ENVIRONMENT_EVALUATION_CONTEXT_SECONDS = 0
+    database_response = api_client.post(url, data=data, content_type="application/json")
+
+    # When
+    settings.CACHE_ENVIRONMENT_EVALUATION_CONTEXT_SECONDS = 60
+    in_memory_response = api_client.post(
+        url, data=data, content_type="application/json"
+    )
+
+    # Then
+    assert in_memory_response.status_code == status.HTTP_200_OK
+    assert _sort_flags(in_memory_response.json()) == _sort_flags(
+        database_response.json()
+    )
+    assert in_memory_response.json()["traits"] == database_response.json()["traits"]
+
+
+def test_get_identities_for_single_feature_evaluated_in_memory(
+    api_client: APIClient,
+    evaluation_environment: Environment,
+    identity: Identity,
+    feature: Feature,
+    settings,
+) -> None:
+    # Given
+    settings.CACHE_ENVIRONMENT_EVALUATION_CONTEXT_SECONDS = 60
+
+    api_client.credentials(HTTP_X_ENVIRONMENT_KEY=evaluation_environment.api_key)
+    base_url = reverse("api-v1:sdk-identities")
+    url = f"{base_url}?identifier={identity.identifier}&feature={feature.name}"
+
+    # When
+    response = api_client.get(url)
+
+    # Then
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["feature"]["id"] == feature.id
+    assert response.json()["feature_state_value"] == "segment override"
+
+
+def test_get_environment_evaluation_context_is_cached(
+    evaluation_environment: Environment,
+    settings,
+    django_assert_num_queries,
+) -> None:
+    # Given
+    settings.CACHE_ENVIRONMENT_EVALUATION_CONTEXT_SECONDS = 60
+    context = get_environment_evaluation_context(evaluation_environment)
+
+    # When
+    with django_assert_num_queries(0):
+        cached_context = get_environment_evaluation_context(evaluation_environment)
+
+    # Then
+    assert context is not None
+    assert cached_context == context
+
+
+def test_get_environment_evaluation_context_returns_none_if_identity_integration_configured(
+    evaluation_environment: Environment,
+    settings,
+) -> None:
+    # Given
+    settings.CACHE_ENVIRONMENT_EVALUATION_CONTEXT_SECONDS = 60
+    MixpanelConfiguration.objects.create(
+        environment=evaluation_environment, api_key="api-key"
+    )
+
+    # When
+    context = get_environment_evaluation_context(evaluation_environment)
+
+    # Then
+    assert context is None
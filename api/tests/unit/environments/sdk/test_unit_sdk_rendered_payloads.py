@@ -0,0 +1,173 @@
+import gzip
+import json
+
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from environments.identities.models import Identity
+from environments.models import Environment, EnvironmentAPIKey
+from environments.sdk.rendered_payloads import (
+    RenderedPayload,
+    get_rendered_payload_response,
+)
+from features.models import Feature
+
+
+def test_rendered_payload_from_data_gzips_content_if_configured(settings) -> None:
+    # Given
+    settings.CACHE_RENDERED_SDK_RESPONSES_GZIP = True
+    data = [{"foo": "bar"}]
+
+    # When
+    payload = RenderedPayload.from_data(data)
+
+    # Then
+    assert json.loads(payload.content) == data
+    assert gzip.decompress(payload.gzipped_content) == payload.content
+
+
+def test_rendered_payload_from_data_does_not_gzip_content_by_default(
+    settings,
+) -> None:
+    # Given
+    settings.CACHE_RENDERED_SDK_RESPONSES_GZIP = False
+
+    # When
+    payload = RenderedPayload.from_data({"foo": "bar"})
+
+    # Then
+    assert payload.gzipped_content is None
+
+
+def test_get_rendered_payload_response_serves_gzipped_content_if_accepted(
+    rf,
+) -> None:
+    # Given
+    payload = RenderedPayload(content=b"{}", gzipped_content=gzip.compress(b"{}"))
+    request = rf.get("/", HTTP_ACCEPT_ENCODING="gzip, deflate")
+
+    # When
+    response = get_rendered_payload_response(request, payload, headers={"foo": 1})
+
+    # Then
+    assert response.content == payload.gzipped_content
+    assert response["Content-Encoding"] == "gzip"
+    assert response["Vary"] == "Accept-Encoding"
+    assert response["foo"] == "1"
+
+
+def test_get_rendered_payload_response_serves_plain_content_if_gzip_not_accepted(
+    rf,
+) -> None:
+    # Given
+    payload = RenderedPayload(content=b"{}", gzipped_content=gzip.compress(b"{}"))
+    request = rf.get("/")
+
+    # When
+    response = get_rendered_payload_response(request, payload)
+
+    # Then
+    assert response.content == payload.content
+    assert not response.has_header("Content-Encoding")
+    assert response["Content-Type"] == "application/json"
+
+
+def test_get_flags_with_rendered_sdk_responses(
+    api_client: APIClient,
+    environment: Environment,
+    feature: Feature,
+    settings,
+) -> None:
+    # Given
+    settings.CACHE_FLAGS_SECONDS = 60
+    settings.CACHE_RENDERED_SDK_RESPONSES = True
+    settings.CACHE_RENDERED_SDK_RESPONSES_GZIP = True
+
+    api_client.credentials(HTTP_X_ENVIRONMENT_KEY=environment.api_key)
+    url = reverse("api-v1:flags")
+
+    # When
+    response = api_client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+
+    # Then
+    assert response.status_code == status.HTTP_200_OK
+    assert response["Content-Encoding"] == "gzip"
+    response_json = json.loads(gzip.decompress(response.content))
+    assert len(response_json) == 1
+    assert response_json[0]["feature"]["id"] == feature.id
+
+
+def test_get_identities_with_rendered_sdk_responses(
+    api_client: APIClient,
+    environment: Environment,
+    identity: Identity,
+    feature: Feature,
+    settings,
+) -> None:
+    # Given
+    settings.CACHE_RENDERED_SDK_RESPONSES = True
+
+    api_client.credentials(HTTP_X_ENVIRONMENT_KEY=environment.api_key)
+    url = "%s?identifier=%s" % (reverse("api-v1:sdk-identities"), identity.identifier)
+
+    # When
+    response = api_client.get(url)
+
+    # Then
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["flags"][0]["feature"]["id"] == feature.id
+
+
+def test_get_environment_document_with_rendered_sdk_responses(
+    api_client: APIClient,
+    environment: Environment,
+    environment_api_key: EnvironmentAPIKey,
+    feature: Feature,
+    settings,
+) -> None:
+    # Given
+    settings.CACHE_RENDERED_SDK_RESPONSES = True
+    settings.CACHE_ENVIRONMENT_DOCUMENT_SECONDS = 60
+
+    api_client.credentials(HTTP_X_ENVIRONMENT_KEY=environment_api_key.key)
+    url = reverse("api-v1:environment-document")
+
+    # When
+    response = api_client.get(url)
+
+    # Then
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["api_key"] == environment.api_key
+    assert response.json()["feature_states"][0]["feature"]["id"] == feature.id
+
+
+def test_get_environment_document_serves_gzipped_document_from_cache(
+    api_client: APIClient,
+    environment: Environment,
+    environment_api_key: EnvironmentAPIKey,
+    feature: Feature,
+    settings,
+) -> None:
+    # Given
+    settings.CACHE_ENVIRONMENT_DOCUMENT_SECONDS = 60
+    settings.CACHE_ENVIRONMENT_DOCUMENT_GZIP = True
+
+    api_client.credentials(HTTP_X_ENVIRONMENT_KEY=environment_api_key.key)
+    url = reverse("api-v1:environment-document")
+
+    # When
+    gzip_response = api_client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+    response = api_client.get(url)
+
+    # Then
+    assert gzip_response.status_code == status.HTTP_200_OK
+    assert gzip_response["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in gzip_response["Vary"]
+    gzip_document = json.loads(gzip.decompress(gzip_response.content))
+
+    assert response.status_code == status.HTTP_200_OK
+    assert "Content-Encoding" not in response
+    assert "Accept-Encoding" in response["Vary"]
+    assert response.json() == gzip_document
+    assert gzip_document["feature_states"][0]["feature"]["id"] == feature.id
@@ -1,8 +1,11 @@
 from audit.models import AuditLog
+from environments.models import Environment
 from environments.tasks import (
     process_environment_update,
     rebuild_environment_document,
 )
+from features.scheduling import get_next_scheduled_change
+from util.mappers import map_environment_to_environment_document
 
 
 def test_rebuild_environment_document(environment, mocker):
@@ -41,7 +44,9 @@ def test_process_environment_update_with_environment_audit_log(environment, mock
 
     # Then
     mock_environment_model_class.write_environments_to_dynamodb.assert_called_once_with(
-        environment_id=environment.id, project_id=environment.project.id
+        environment_id=environment.id,
+        project_id=environment.project.id,
+        audit_log=audit_log,
     )
     mock_send_environment_update_message_for_environment.assert_called_once_with(
         environment
@@ -69,9 +74,77 @@ def test_process_environment_update_with_project_audit_log(environment, mocker):
 
     # Then
     mock_environment_model_class.write_environments_to_dynamodb.assert_called_once_with(
-        environment_id=None, project_id=environment.project.id
+        environment_id=None, project_id=environment.project.id, audit_log=audit_log
     )
     mock_send_environment_update_message_for_environment.assert_not_called()
     mock_send_environment_update_message_for_project.assert_called_once_with(
         environment.project
     )
+
+
+def test_process_environment_update_caches_next_scheduled_change(
+    environment, mocker, django_assert_num_queries
+):
+    # Given
+    mocker.patch("environments.tasks.Environment", autospec=True)
+    mocker.patch("environments.tasks.send_environment_update_message_for_environment")
+    audit_log = AuditLog.objects.create(
+        project=environment.project, environment=environment
+    )
+
+    # When
+    process_environment_update(audit_log_id=audit_log.id)
+
+    # Then
+    environment.refresh_from_db()
+    with django_assert_num_queries(0):
+        get_next_scheduled_change(environment)
+
+
+def test_process_environment_update_caches_new_version_of_environment(
+    environment, mocker, django_assert_num_queries
+):
+    # Given
+    mocker.patch("environments.tasks.Environment", autospec=True)
+    mocker.patch("environments.tasks.send_environment_update_message_for_environment")
+    audit_log = AuditLog.objects.create(
+        project=environment.project, environment=environment
+    )
+
+    # When
+    process_environment_update(audit_log_id=audit_log.id)
+
+    # Then
+    environment.refresh_from_db()
+    with django_assert_num_queries(0):
+        cached_environment = Environment.get_from_cache(environment.api_key)
+    assert cached_environment.updated_at == environment.updated_at
+
+
+def test_process_environment_update_builds_environment_document_once(
+    dynamo_enabled_project_environment_one, mock_dynamo_env_wrapper, mocker, settings
+):
+    # Given
+    settings.CACHE_ENVIRONMENT_DOCUMENT_SECONDS = 60
+    environment = dynamo_enabled_project_environment_one
+    mocker.patch("environments.tasks.send_environment_update_message_for_environment")
+    audit_log = AuditLog.objects.create(
+        project=environment.project, environment=environment
+    )
+    mock_dynamo_env_wrapper.reset_mock()
+    build_environment_document = mocker.patch(
+        "environments.models.map_environment_to_environment_document",
+        wraps=map_environment_to_environment_document,
+    )
+
+    # When
+    process_environment_update(audit_log_id=audit_log.id)
+
+    # Then
+    # the document written to dynamodb is the one that is cached
+    args, _ = mock_dynamo_env_wrapper.write_environment_documents.call_args
+    (environment_document,) = args[0]
+    assert Environment.get_environment_document(environment.api_key) == (
+        environment_document
+    )
+    build_environment_document.assert_called_once_with(mocker.ANY)
@@ -0,0 +1,114 @@
+import pytest
+
+from environments.api_key_filter import BloomFilter, environment_key_filter
+from environments.models import Environment, EnvironmentAPIKey
+from projects.models import Project
+
+
+@pytest.fixture()
+def environment_key_filter_enabled(settings):
+    settings.ENVIRONMENT_KEY_FILTER_ENABLED = True
+    settings.ENVIRONMENT_KEY_FILTER_REFRESH_SECONDS = 60
+    environment_key_filter.invalidate()
+    yield
+    environment_key_filter.invalidate()
+
+
+def test_bloom_filter_contains_added_keys() -> None:
+    # Given
+    bloom_filter = BloomFilter(capacity=100, false_positive_rate=0.01)
+    keys = [f"key-{i}" for i in range(100)]
+
+    # When
+    for key in keys:
+        bloom_filter.add(key)
+
+    # Then
+    assert all(key in bloom_filter for key in keys)
+    false_positives = sum(f"other-key-{i}" in bloom_filter for i in range(1000))
+    assert false_positives < 50
+
+
+def test_get_from_cache_rejects_unknown_key_without_queries(
+    environment: Environment,
+    environment_key_filter_enabled: None,
+    django_assert_num_queries,
+) -> None:
+    # Given
+    Environment.get_from_cache(environment.api_key)
+
+    # When
+    with django_assert_num_queries(0):
+        unknown_environment = Environment.get_from_cache("unknown-key")
+
+    # Then
+    assert unknown_environment is None
+
+
+def test_environment_key_filter_includes_keys_created_after_it_is_built(
+    project: Project,
+    environment: Environment,
+    environment_key_filter_enabled: None,
+    django_capture_on_commit_callbacks,
+) -> None:
+    # Given
+    assert environment_key_filter.might_exist(environment.api_key)
+
+    # When
+    with django_capture_on_commit_callbacks(execute=True):
+        new_environment = Environment.objects.create(name="new", project=project)
+        environment_api_key = EnvironmentAPIKey.objects.create(
+            environment=new_environment, name="server key"
+        )
+
+    # Then
+    assert Environment.get_from_cache(new_environment.api_key) == new_environment
+    assert Environment.get_from_cache(environment_api_key.key) == new_environment
+
+
+def test_environment_key_filter_does_not_add_key_until_transaction_commits(
+    project: Project,
+    environment: Environment,
+    environment_key_filter_enabled: None,
+    django_capture_on_commit_callbacks,
+    mocker,
+) -> None:
+    # Given
+    add = mocker.patch.object(environment_key_filter, "add")
+
+    # When
+    with django_capture_on_commit_callbacks(execute=False) as callbacks:
+        new_environment = Environment.objects.create(name="new", project=project)
+
+    # Then
+    add.assert_not_called()
+    callbacks[0]()
+    add.assert_called_once_with(new_environment.api_key)
+
+
+def test_environment_key_filter_is_rebuilt_once_older_than_max_age(
+    project: Project,
+    environment: Environment,
+    environment_key_filter_enabled: None,
+    settings,
+    mocker,
+) -> None:
+    # Given
+    # a key created by another process which doesn't share the environment
+    # cache, so the version isn't changed
+    settings.ENVIRONMENT_KEY_FILTER_REFRESH_SECONDS = 0
+    settings.ENVIRONMENT_KEY_FILTER_MAX_AGE_SECONDS = 60
+    settings.ENVIRONMENT_KEY_FILTER_FALSE_POSITIVE_RATE = 0.000001
+    mocked_time = mocker.patch("environments.api_key_filter.time")
+    mocked_time.monotonic.return_value = 1000.0
+    assert environment_key_filter.might_exist(environment.api_key)
+
+    mocker.patch.object(Environment, "add_api_key_to_filter")
+    new_environment = Environment.objects.create(name="new", project=project)
+    assert not environment_key_filter.might_exist(new_environment.api_key)
+
+    # When
+    mocked_time.monotonic.return_value = 1060.0
+
+    # Then
+    assert environment_key_filter.might_exist(new_environment.api_key)
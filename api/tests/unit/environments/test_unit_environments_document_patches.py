@@ -0,0 +1,286 @@
+import typing
+
+import pytest
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+from pytest_mock import MockerFixture
+
+from audit.models import AuditLog
+from audit.related_object_type import RelatedObjectType
+from environments.dynamodb import DynamoEnvironmentWrapper
+from environments.dynamodb.document_patches import (
+    FeatureDocumentPatch,
+    SegmentDocumentPatch,
+    get_environment_document_patch,
+)
+from environments.models import Environment
+from features.models import Feature, FeatureSegment, FeatureState
+from projects.models import Project
+from segments.models import EQUAL, Condition, Segment, SegmentRule
+
+if typing.TYPE_CHECKING:
+    from util.mappers.dynamodb import Document
+
+
+def test_feature_document_patch_matches_rebuilt_document(
+    environment: Environment,
+    feature: Feature,
+    feature_state: FeatureState,
+    segment_featurestate: FeatureState,
+    environment_document_builder: typing.Callable[[Environment], "Document"],
+) -> None:
+    # Given
+    other_feature = Feature.objects.create(
+        name="other_feature", project=environment.project
+    )
+    previous_document = environment_document_builder(environment)
+
+    feature_state.enabled = True
+    feature_state.save()
+    segment_featurestate.enabled = True
+    segment_featurestate.save()
+    Feature.objects.filter(id=feature.id).update(is_server_key_only=True)
+    environment.refresh_from_db()
+
+    # When
+    document = FeatureDocumentPatch(feature_id=feature.id).apply(
+        previous_document, environment
+    )
+
+    # Then
+    assert document == environment_document_builder(environment)
+    assert [
+        feature_state_document["feature"]["id"]
+        for feature_state_document in document["feature_states"]
+    ] == [feature.id, other_feature.id]
+
+
+def test_feature_document_patch_removes_deleted_feature(
+    environment: Environment,
+    feature: Feature,
+    segment_featurestate: FeatureState,
+    environment_document_builder: typing.Callable[[Environment], "Document"],
+) -> None:
+    # Given
+    previous_document = environment_document_builder(environment)
+    feature.delete()
+    environment.refresh_from_db()
+
+    # When
+    document = FeatureDocumentPatch(feature_id=feature.id).apply(
+        previous_document, environment
+    )
+
+    # Then
+    assert document == environment_document_builder(environment)
+    assert document["feature_states"] == []
+    assert document["project"]["segments"][0]["feature_states"] == []
+
+
+def test_feature_document_patch_returns_none_if_segment_is_missing(
+    environment: Environment,
+    feature: Feature,
+    segment: Segment,
+    environment_document_builder: typing.Callable[[Environment], "Document"],
+) -> None:
+    # Given
+    previous_document = environment_document_builder(environment)
+    other_segment = Segment.objects.create(
+        name="other_segment", project=environment.project
+    )
+    feature_segment = FeatureSegment.objects.create(
+        feature=feature, segment=other_segment, environment=environment
+    )
+    FeatureState.objects.create(
+        feature=feature, feature_segment=feature_segment, environment=environment
+    )
+
+    # When
+    document = FeatureDocumentPatch(feature_id=feature.id).apply(
+        previous_document, environment
+    )
+
+    # Then
+    assert document is None
+
+
+def test_segment_document_patch_matches_rebuilt_document(
+    environment: Environment,
+    segment: Segment,
+    segment_rule: SegmentRule,
+    segment_featurestate: FeatureState,
+    environment_document_builder: typing.Callable[[Environment], "Document"],
+) -> None:
+    # Given
+    previous_document = environment_document_builder(environment)
+    Condition.objects.create(
+        rule=segment_rule, property="foo", operator=EQUAL, value="bar"
+    )
+    segment.name = "renamed_segment"
+    segment.save()
+
+    # When
+    document = SegmentDocumentPatch(segment_id=segment.id).apply(
+        previous_document, environment
+    )
+
+    # Then
+    assert document == environment_document_builder(environment)
+
+
+def test_segment_document_patch_adds_and_removes_segments(
+    environment: Environment,
+    segment: Segment,
+    environment_document_builder: typing.Callable[[Environment], "Document"],
+) -> None:
+    # Given
+    previous_document = environment_document_builder(environment)
+    new_segment = Segment.objects.create(
+        name="new_segment", project=environment.project
+    )
+
+    # When
+    document = SegmentDocumentPatch(segment_id=new_segment.id).apply(
+        previous_document, environment
+    )
+    segment.delete()
+    document = SegmentDocumentPatch(segment_id=segment.id).apply(document, environment)
+
+    # Then
+    assert document == environment_document_builder(environment)
+    assert [
+        segment_document["id"] for segment_document in document["project"]["segments"]
+    ] == [new_segment.id]
+
+
+def test_get_environment_document_patch(
+    environment: Environment,
+    feature: Feature,
+    feature_state: FeatureState,
+    segment: Segment,
+) -> None:
+    # Given
+    def create_audit_log(related_object_type: str, related_object_id: int, **kwargs):
+        return AuditLog(
+            environment=environment,
+            project=environment.project,
+            related_object_type=related_object_type,
+            related_object_id=related_object_id,
+            **kwargs,
+        )
+
+    # When
+    patches = [
+        get_environment_document_patch(audit_log)
+        for audit_log in (
+            create_audit_log(RelatedObjectType.FEATURE.name, feature.id),
+            create_audit_log(RelatedObjectType.SEGMENT.name, segment.id),
+            create_audit_log(
+                RelatedObjectType.FEATURE_STATE.name,
+                feature_state.id,
+                history_record_class_path=FeatureState.history_record_class_path,
+            ),
+            create_audit_log(RelatedObjectType.ENVIRONMENT.name, environment.id),
+            create_audit_log(RelatedObjectType.FEATURE_STATE.name, None),
+        )
+    ]
+
+    # Then
+    assert patches == [
+        FeatureDocumentPatch(feature_id=feature.id),
+        SegmentDocumentPatch(segment_id=segment.id),
+        FeatureDocumentPatch(feature_id=feature.id),
+        None,
+        None,
+    ]
+
+
+def test_patch_environments_returns_environments_to_rebuild(
+    mocker: MockerFixture,
+    project: Project,
+    environment: Environment,
+    feature: Feature,
+    environment_document_builder: typing.Callable[[Environment], "Document"],
+) -> None:
+    # Given
+    missing_environment = Environment.objects.create(
+        name="missing_environment", project=project
+    )
+    conflicting_environment = Environment.objects.create(
+        name="conflicting_environment", project=project
+    )
+    documents = {
+        env.api_key: environment_document_builder(env)
+        for env in (environment, conflicting_environment)
+    }
+    previous_updated_at = documents[environment.api_key]["updated_at"]
+
+    dynamo_environment_wrapper = DynamoEnvironmentWrapper()
+    mocked_dynamo_table = mocker.patch.object(dynamo_environment_wrapper, "_table")
+    mocked_dynamo_table.get_item.side_effect = lambda Key: (
+        {"Item": documents[Key["api_key"]]} if Key["api_key"] in documents else {}
+    )
+
+    def put_item(Item: "Document", ConditionExpression: typing.Any) -> None:
+        if Item["id"] == conflicting_environment.id:
+            raise ClientError(
+                {"Error": {"Code": "ConditionalCheckFailedException"}}, "PutItem"
+            )
+
+    mocked_dynamo_table.put_item.side_effect = put_item
+
+    # When
+    environment_ids_to_rebuild = dynamo_environment_wrapper.patch_environments(
+        Environment.objects.filter(project=project).order_by("id"),
+        FeatureDocumentPatch(feature_id=feature.id),
+    )
+
+    # Then
+    assert environment_ids_to_rebuild == [
+        missing_environment.id,
+        conflicting_environment.id,
+    ]
+    _, kwargs = mocked_dynamo_table.put_item.call_args_list[0]
+    assert kwargs["Item"]["id"] == environment.id
+    assert kwargs["ConditionExpression"] == Attr("updated_at").eq(previous_updated_at)
+
+
+@pytest.mark.parametrize(
+    "environment_ids_to_rebuild, expected_write_count",
+    (([], 0), (None, 1)),
+)
+def test_write_environments_to_dynamodb_patches_documents_for_audit_log(
+    dynamo_enabled_project: Project,
+    dynamo_enabled_project_environment_one: Environment,
+    mock_dynamo_env_wrapper: typing.Any,
+    environment_ids_to_rebuild: typing.Optional[typing.List[int]],
+    expected_write_count: int,
+) -> None:
+    # Given
+    feature = Feature.objects.create(name="feature", project=dynamo_enabled_project)
+    audit_log = AuditLog.objects.create(
+        environment=dynamo_enabled_project_environment_one,
+        project=dynamo_enabled_project,
+        related_object_type=RelatedObjectType.FEATURE.name,
+        related_object_id=feature.id,
+    )
+    mock_dynamo_env_wrapper.reset_mock()
+    mock_dynamo_env_wrapper.patch_environments.return_value = (
+        environment_ids_to_rebuild
+        if environment_ids_to_rebuild is not None
+        else [dynamo_enabled_project_environment_one.id]
+    )
+
+    # When
+    Environment.write_environments_to_dynamodb(
+        environment_id=dynamo_enabled_project_environment_one.id,
+        audit_log=audit_log,
+    )
+
+    # Then
+    args, _ = mock_dynamo_env_wrapper.patch_environments.call_args
+    assert args[0] == [dynamo_enabled_project_environment_one]
+    assert args[1] == FeatureDocumentPatch(feature_id=feature.id)
+    assert mock_dynamo_env_wrapper.write_environment_documents.call_count == (
+        expected_write_count
+    )
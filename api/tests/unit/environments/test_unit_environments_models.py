@@ -1,13 +1,25 @@
+import logging
+import pickle
 import typing
 from unittest.mock import MagicMock
 
 import pytest
 from core.request_origin import RequestOrigin
-from pytest_django.asserts import assertQuerysetEqual as assert_queryset_equal
-
-from environments.models import Environment, EnvironmentAPIKey, Webhook
-from features.models import Feature, FeatureState
+from django.utils import timezone
+
+from environments.auth_record import EnvironmentAuthRecord
+from environments.models import (
+    Environment,
+    EnvironmentAPIKey,
+    Webhook,
+    environment_cache,
+    environment_cache_local_tier,
+)
+from environments.sdk.rendered_payloads import RenderedPayload
+from features.models import Feature, FeatureSegment, FeatureState
+from integrations.mixpanel.models import MixpanelConfiguration
 from organisations.models import OrganisationRole
+from segments.evaluator import SegmentIndex
 from segments.models import Segment
 from util.mappers import map_environment_to_environment_document
 
@@ -53,13 +65,12 @@ def test_write_environments_to_dynamodb_with_environment(
     )
 
     # Then
-    args, kwargs = mock_dynamo_env_wrapper.write_environments.call_args
+    args, kwargs = mock_dynamo_env_wrapper.write_environment_documents.call_args
     assert kwargs == {}
     assert len(args) == 1
-    assert_queryset_equal(
-        args[0],
-        Environment.objects.filter(id=dynamo_enabled_project_environment_one.id),
-    )
+    assert [document["api_key"] for document in args[0]] == [
+        dynamo_enabled_project_environment_one.api_key
+    ]
 
 
 def test_write_environments_to_dynamodb_project(
@@ -75,12 +86,13 @@ def test_write_environments_to_dynamodb_project(
     Environment.write_environments_to_dynamodb(project_id=dynamo_enabled_project.id)
 
     # Then
-    args, kwargs = mock_dynamo_env_wrapper.write_environments.call_args
+    args, kwargs = mock_dynamo_env_wrapper.write_environment_documents.call_args
     assert kwargs == {}
     assert len(args) == 1
-    assert_queryset_equal(
-        args[0], Environment.objects.filter(project=dynamo_enabled_project)
-    )
+    assert [document["api_key"] for document in args[0]] == [
+        dynamo_enabled_project_environment_one.api_key,
+        dynamo_enabled_project_environment_two.api_key,
+    ]
 
 
 def test_write_environments_to_dynamodb_with_environment_and_project(
@@ -97,13 +109,12 @@ def test_write_environments_to_dynamodb_with_environment_and_project(
     )
 
     # Then
-    args, kwargs = mock_dynamo_env_wrapper.write_environments.call_args
+    args, kwargs = mock_dynamo_env_wrapper.write_environment_documents.call_args
     assert kwargs == {}
     assert len(args) == 1
-    assert_queryset_equal(
-        args[0],
-        Environment.objects.filter(id=dynamo_enabled_project_environment_one.id),
-    )
+    assert [document["api_key"] for document in args[0]] == [
+        dynamo_enabled_project_environment_one.api_key
+    ]
 
 
 @pytest.mark.parametrize(
@@ -201,13 +212,16 @@ def test_environment_get_environment_document_with_caching_when_document_in_cach
 ):
     # Given
     settings.CACHE_ENVIRONMENT_DOCUMENT_SECONDS = 60
+    Environment.get_from_cache(environment.api_key)
 
     mocked_environment_document_cache = mocker.patch(
         "environments.models.environment_document_cache"
     )
-    mocked_environment_document_cache.get.return_value = (
-        map_environment_to_environment_document(environment)
-    )
+    cache_key = f"{environment.api_key}:{environment.updated_at.timestamp()}"
+    mocked_environment_document_cache.get_many.return_value = {
+        cache_key: map_environment_to_environment_document(environment),
+        f"{cache_key}:fresh": True,
+    }
 
     # When
     with django_assert_num_queries(0):
@@ -216,6 +230,9 @@ def test_environment_get_environment_document_with_caching_when_document_in_cach
     # Then
     assert environment_document
     assert environment_document["api_key"] == environment.api_key
+    mocked_environment_document_cache.get_many.assert_called_once_with(
+        [cache_key, f"{cache_key}:fresh"]
+    )
 
 
 def test_environment_get_environment_document_with_caching_when_document_not_in_cache(
@@ -223,22 +240,70 @@ def test_environment_get_environment_document_with_caching_when_document_not_in_
 ):
     # Given
     settings.CACHE_ENVIRONMENT_DOCUMENT_SECONDS = 60
+    Environment.get_from_cache(environment.api_key)
 
     mocked_environment_document_cache = mocker.patch(
         "environments.models.environment_document_cache"
     )
+    mocked_environment_document_cache.get_many.return_value = {}
     mocked_environment_document_cache.get.return_value = None
 
     # When
-    with django_assert_num_queries(3):
+    with django_assert_num_queries(4):
         environment_document = Environment.get_environment_document(environment.api_key)
 
     # Then
     assert environment_document
     assert environment_document["api_key"] == environment.api_key
 
-    mocked_environment_document_cache.set.assert_called_once_with(
-        environment.api_key, environment_document
+    mocked_environment_document_cache.set.assert_any_call(
+        f"{environment.api_key}:{environment.updated_at.timestamp()}",
+        environment_document,
+        timeout=60 + settings.CACHE_STALE_SECONDS,
+    )
+
+
+def test_rebuild_environment_document_cache_sets_document_for_current_version(
+    environment: Environment,
+    feature: Feature,
+    django_assert_num_queries,
+    settings,
+) -> None:
+    # Given
+    settings.CACHE_ENVIRONMENT_DOCUMENT_SECONDS = 60
+    settings.CACHE_RENDERED_SDK_RESPONSES = True
+    previous_document = Environment.get_environment_document(environment.api_key)
+
+    # update the environment without triggering the task that rebuilds the cache
+    FeatureState.objects.filter(environment=environment, feature=feature).update(
+        enabled=True
+    )
+    Environment.objects.filter(id=environment.id).update(updated_at=timezone.now())
+    environment.refresh_from_db()
+
+    # When
+    environment.rebuild_environment_document_cache()
+
+    # Then
+    # readers keep getting the previous version until the environment in the
+    # environment cache is updated
+    assert Environment.get_environment_document(environment.api_key) == (
+        previous_document
+    )
+
+    environment_cache_local_tier.clear()
+    environment_cache.delete(environment.api_key)
+    # 1 query for the environment and 1 for each of the (database) cache entries
+    with django_assert_num_queries(3):
+        environment_document = Environment.get_environment_document(environment.api_key)
+        rendered_environment_document = Environment.get_rendered_environment_document(
+            environment.api_key
+        )
+
+    assert environment_document == map_environment_to_environment_document(environment)
+    assert environment_document["feature_states"][0]["enabled"] is True
+    assert rendered_environment_document.content == (
+        RenderedPayload.from_data(environment_document).content
     )
 
 
@@ -275,7 +340,8 @@ def test_get_segments_returns_only_segments_that_have_an_override(
     environment, segment, segment_featurestate, mocker, monkeypatch
 ):
     # Given
-    mock_environment_segments_cache = mocker.MagicMock()
+    mock_environment_segments_cache = mocker.MagicMock(default_timeout=60)
+    mock_environment_segments_cache.get_many.return_value = {}
     mock_environment_segments_cache.get.return_value = None
 
     monkeypatch.setattr(
@@ -291,9 +357,11 @@ def test_get_segments_returns_only_segments_that_have_an_override(
     # Then
     assert segments == [segment]
 
-    mock_environment_segments_cache.set.assert_called_once_with(
-        environment.id, segments
+    mock_environment_segments_cache.set.assert_any_call(
+        environment.id, mocker.ANY, timeout=mocker.ANY
     )
+    segment_index = mock_environment_segments_cache.set.call_args_list[0].args[1]
+    assert segment_index.segments == segments
 
 
 def test_get_segments_from_cache_does_not_hit_db_if_cache_hit(
@@ -305,8 +373,11 @@ def test_get_segments_from_cache_does_not_hit_db_if_cache_hit(
     django_assert_num_queries,
 ):
     # Given
-    mock_environment_segments_cache = mocker.MagicMock()
-    mock_environment_segments_cache.get.return_value = [segment]
+    mock_environment_segments_cache = mocker.MagicMock(default_timeout=60)
+    mock_environment_segments_cache.get_many.return_value = {
+        environment.id: SegmentIndex([segment]),
+        f"{environment.id}:fresh": True,
+    }
 
     monkeypatch.setattr(
         "environments.models.environment_segments_cache",
@@ -396,3 +467,162 @@ def test_delete_environment_with_committed_change_request(
 
     # Then
     assert environment.deleted_at is not None
+
+
+def test_get_from_cache_with_local_cache_tier_returns_updated_environment(
+    environment: Environment, settings
+) -> None:
+    # Given
+    settings.LOCAL_CACHE_TIER_SECONDS = 60
+    environment_cache_local_tier.clear()
+    assert Environment.get_from_cache(environment.api_key).name == environment.name
+
+    # When
+    environment.name = "updated"
+    environment.save()
+
+    # Then
+    assert Environment.get_from_cache(environment.api_key).name == "updated"
+    environment_cache_local_tier.clear()
+
+
+def test_get_from_cache_returns_environment_with_related_objects_from_cache(
+    environment: Environment,
+    django_assert_num_queries,
+) -> None:
+    # Given
+    MixpanelConfiguration.objects.create(environment=environment, api_key="key")
+    Environment.get_from_cache(environment.api_key)
+
+    # When
+    with django_assert_num_queries(0):
+        cached_environment = Environment.get_from_cache(environment.api_key)
+        organisation = cached_environment.project.organisation
+        mixpanel_config = cached_environment.mixpanel_config
+        has_amplitude_config = hasattr(cached_environment, "amplitude_config")
+
+    # Then
+    assert cached_environment == environment
+    assert cached_environment.updated_at == environment.updated_at
+    assert organisation == environment.project.organisation
+    assert mixpanel_config.api_key == "key"
+    assert mixpanel_config.environment is cached_environment
+    assert has_amplitude_config is False
+
+
+def test_environment_auth_record_is_smaller_than_environment(
+    environment: Environment,
+) -> None:
+    # Given
+    environment = Environment.objects.select_related(
+        "project", "project__organisation"
+    ).get(id=environment.id)
+
+    # When
+    auth_record = EnvironmentAuthRecord.from_environment(environment)
+
+    # Then
+    assert len(pickle.dumps(auth_record)) * 3 < len(pickle.dumps(environment))
+
+
+def test_filter_for_document_builder_only_prefetches_feature_states_for_environment(
+    environment: Environment,
+    feature: Feature,
+    segment: Segment,
+    feature_state: FeatureState,
+    segment_featurestate: FeatureState,
+    identity_featurestate: FeatureState,
+) -> None:
+    # Given
+    other_environment = Environment.objects.create(
+        name="other_environment", project=environment.project
+    )
+    other_feature_segment = FeatureSegment.objects.create(
+        feature=feature, segment=segment, environment=other_environment
+    )
+    FeatureState.objects.create(
+        feature=feature,
+        feature_segment=other_feature_segment,
+        environment=other_environment,
+    )
+
+    # When
+    document_environment = Environment.objects.filter_for_document_builder(
+        id=environment.id
+    ).get()
+
+    # Then
+    assert [
+        feature_state.id for feature_state in document_environment.feature_states.all()
+    ] == [feature_state.id]
+    (document_segment,) = document_environment.project.segments.all()
+    assert [
+        feature_segment.environment_id
+        for feature_segment in document_segment.feature_segments.all()
+    ] == [environment.id]
+    assert [
+        feature_state.id
+        for feature_segment in document_segment.feature_segments.all()
+        for feature_state in feature_segment.feature_states.all()
+    ] == [segment_featurestate.id]
+
+
+def test_get_environment_document_from_db_reports_build_cost(
+    settings,
+    environment: Environment,
+    feature: Feature,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    # Given
+    settings.ENABLE_DOCUMENT_BUILD_REPORTING = True
+    caplog.set_level(logging.INFO, logger="environments.document_builder")
+
+    # When
+    Environment._get_environment_document_from_db(environment.api_key)
+
+    # Then
+    (record,) = [
+        record
+        for record in caplog.records
+        if record.name == "environments.document_builder"
+    ]
+    assert record.getMessage() == (
+        f"Built 1 environment document(s) for project {environment.project_id} "
+        "with 4 queries returning 2 rows"
+    )
+
+
+def test_get_environment_document_from_db_does_not_report_build_cost_by_default(
+    environment: Environment,
+    feature: Feature,
+    caplog: pytest.LogCaptureFixture,
+    mocker,
+) -> None:
+    # Given
+    caplog.set_level(logging.INFO, logger="environments.document_builder")
+    mocked_count_queries = mocker.patch("environments.managers.count_queries")
+
+    # When
+    Environment._get_environment_document_from_db(environment.api_key)
+
+    # Then
+    mocked_count_queries.assert_not_called()
+    assert not [
+        record
+        for record in caplog.records
+        if record.name == "environments.document_builder"
+    ]
+
+
+def test_rebuild_environment_cache_removes_deleted_environment_from_cache(
+    environment: Environment,
+) -> None:
+    # Given
+    Environment.get_from_cache(environment.api_key)
+    environment.delete()
+
+    # When
+    environment.rebuild_environment_cache([environment.api_key])
+
+    # Then
+    assert environment_cache.get(environment.api_key) is None
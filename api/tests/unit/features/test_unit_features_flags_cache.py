@@ -0,0 +1,227 @@
+from core.request_origin import RequestOrigin
+
+from audit.models import AuditLog
+from environments.models import Environment
+from features.flags_cache import (
+    flags_cache,
+    get_environment_flag_data,
+    get_environment_flags_cache_key,
+    get_environment_flags_data,
+    rebuild_environment_flags_cache,
+)
+from features.models import Feature, FeatureState
+
+
+def test_get_environment_flags_cache_key_changes_with_environment_version(
+    environment: Environment,
+) -> None:
+    # Given
+    original_cache_key = get_environment_flags_cache_key(
+        environment, RequestOrigin.CLIENT
+    )
+
+    # When
+    environment.updated_at = environment.updated_at.replace(year=2100)
+    new_cache_key = get_environment_flags_cache_key(environment, RequestOrigin.CLIENT)
+
+    # Then
+    assert original_cache_key != new_cache_key
+
+
+def test_get_environment_flags_cache_key_differs_for_each_variant(
+    environment: Environment,
+) -> None:
+    # Given
+    variants = [
+        (request_origin, hide_disabled_flags)
+        for request_origin in RequestOrigin
+        for hide_disabled_flags in (False, True)
+    ]
+
+    # When
+    cache_keys = {
+        get_environment_flags_cache_key(environment, *variant) for variant in variants
+    }
+
+    # Then
+    assert len(cache_keys) == len(variants)
+
+
+def test_get_environment_flags_data_caches_payload(
+    environment: Environment,
+    feature: Feature,
+    settings,
+    django_assert_num_queries,
+) -> None:
+    # Given
+    settings.CACHE_FLAGS_SECONDS = 60
+    flags_cache.clear()
+
+    # When
+    data = get_environment_flags_data(environment, RequestOrigin.CLIENT)
+    with django_assert_num_queries(0):
+        cached_data = get_environment_flags_data(environment, RequestOrigin.CLIENT)
+
+    # Then
+    assert len(data) == 1
+    assert data[0]["feature"]["id"] == feature.id
+    assert cached_data == data
+
+
+def test_get_environment_flag_data_returns_flag_by_case_insensitive_feature_name(
+    environment: Environment,
+    feature: Feature,
+    settings,
+    django_assert_num_queries,
+) -> None:
+    # Given
+    settings.CACHE_FLAGS_SECONDS = 60
+    flags_cache.clear()
+    get_environment_flags_data(environment, RequestOrigin.SERVER)
+
+    # When
+    with django_assert_num_queries(0):
+        data = get_environment_flag_data(
+            environment, RequestOrigin.SERVER, feature.name.upper()
+        )
+        missing_data = get_environment_flag_data(
+            environment, RequestOrigin.SERVER, "missing_feature"
+        )
+
+    # Then
+    assert data["feature"]["id"] == feature.id
+    assert missing_data is None
+
+
+def test_rebuild_environment_flags_cache_builds_payload_for_each_request_origin(
+    environment: Environment,
+    feature: Feature,
+    settings,
+) -> None:
+    # Given
+    settings.CACHE_FLAGS_SECONDS = 60
+    flags_cache.clear()
+
+    feature.is_server_key_only = True
+    feature.save()
+
+    # When
+    rebuild_environment_flags_cache(environment)
+
+    # Then
+    assert (
+        flags_cache.get(
+            get_environment_flags_cache_key(environment, RequestOrigin.CLIENT)
+        ).payload
+        == []
+    )
+    server_data = flags_cache.get(
+        get_environment_flags_cache_key(environment, RequestOrigin.SERVER)
+    ).payload
+    assert len(server_data) == 1
+    assert server_data[0]["feature"]["id"] == feature.id
+
+
+def test_get_environment_flags_data_builds_all_variants_from_single_query(
+    environment: Environment,
+    feature: Feature,
+    settings,
+    django_assert_num_queries,
+) -> None:
+    # Given
+    settings.CACHE_FLAGS_SECONDS = 60
+    flags_cache.clear()
+
+    # When
+    # one query for the feature states and one for the next scheduled change
+    with django_assert_num_queries(2):
+        get_environment_flags_data(environment, RequestOrigin.CLIENT)
+
+    # Then
+    for request_origin in RequestOrigin:
+        for hide_disabled_flags in (False, True):
+            assert (
+                flags_cache.get(
+                    get_environment_flags_cache_key(
+                        environment, request_origin, hide_disabled_flags
+                    )
+                )
+                is not None
+            )
+
+
+def test_get_environment_flags_data_applies_all_filters_for_client_if_hide_disabled(
+    environment: Environment,
+    feature: Feature,
+    settings,
+) -> None:
+    # Given
+    settings.CACHE_FLAGS_SECONDS = 60
+    flags_cache.clear()
+
+    environment.hide_disabled_flags = True
+    environment.save()
+
+    feature.is_server_key_only = True
+    feature.save()
+    FeatureState.objects.filter(
+        feature=feature, environment=environment, identity=None
+    ).update(enabled=True)
+
+    Feature.objects.create(name="disabled_feature", project=environment.project)
+
+    # When
+    client_data = get_environment_flags_data(environment, RequestOrigin.CLIENT)
+    server_data = get_environment_flags_data(environment, RequestOrigin.SERVER)
+
+    # Then
+    assert client_data == []
+    assert [fs["feature"]["id"] for fs in server_data] == [feature.id]
+
+
+def test_rebuild_environment_flags_cache_does_nothing_if_cache_disabled(
+    environment: Environment,
+    feature: Feature,
+    settings,
+) -> None:
+    # Given
+    settings.CACHE_FLAGS_SECONDS = 0
+    flags_cache.clear()
+
+    # When
+    rebuild_environment_flags_cache(environment)
+
+    # Then
+    assert (
+        flags_cache.get(
+            get_environment_flags_cache_key(environment, RequestOrigin.SERVER)
+        )
+        is None
+    )
+
+
+def test_environment_flags_cache_is_rebuilt_when_audit_log_created(
+    environment: Environment,
+    feature: Feature,
+    settings,
+) -> None:
+    # Given
+    settings.CACHE_FLAGS_SECONDS = 60
+    flags_cache.clear()
+
+    feature_state = FeatureState.objects.get(
+        feature=feature, environment=environment, identity=None
+    )
+
+    feature_state.enabled = True
+    feature_state.save()
+
+    # When
+    AuditLog.objects.create(project=environment.project, environment=environment)
+
+    # Then
+    environment.refresh_from_db()
+    data = flags_cache.get(
+        get_environment_flags_cache_key(environment, RequestOrigin.SERVER)
+    ).payload
+    assert data[0]["enabled"] is True
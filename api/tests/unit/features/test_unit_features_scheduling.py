@@ -0,0 +1,117 @@
+from datetime import timedelta
+
+import pytest
+from core.request_origin import RequestOrigin
+from django.utils import timezone
+
+from environments.models import Environment
+from features.flags_cache import flags_cache, get_environment_flags_data
+from features.models import Feature, FeatureState
+from features.scheduling import (
+    get_next_scheduled_change,
+    get_timeout_until_scheduled_change,
+)
+
+
+def test_get_timeout_until_scheduled_change_returns_timeout_if_no_scheduled_change() -> (
+    None
+):
+    # When
+    timeout = get_timeout_until_scheduled_change(60, None)
+
+    # Then
+    assert timeout == 60
+
+
+@pytest.mark.freeze_time()
+@pytest.mark.parametrize(
+    "seconds_until_change, expected_timeout",
+    ((30, 30), (120, 60), (-10, 1)),
+)
+def test_get_timeout_until_scheduled_change_caps_timeout(
+    seconds_until_change: int, expected_timeout: int
+) -> None:
+    # Given
+    scheduled_change = timezone.now() + timedelta(seconds=seconds_until_change)
+
+    # When
+    timeout = get_timeout_until_scheduled_change(60, scheduled_change)
+
+    # Then
+    assert timeout == expected_timeout
+
+
+def test_get_next_scheduled_change_returns_earliest_committed_future_live_from(
+    environment: Environment,
+    feature: Feature,
+) -> None:
+    # Given
+    flags_cache.clear()
+    now = timezone.now()
+
+    # an uncommitted feature state that should be ignored
+    FeatureState.objects.create(
+        environment=environment,
+        feature=feature,
+        live_from=now + timedelta(minutes=30),
+        version=None,
+    )
+    next_live_from = now + timedelta(hours=1)
+    for version, live_from in ((2, next_live_from), (3, now + timedelta(hours=2))):
+        FeatureState.objects.create(
+            environment=environment,
+            feature=feature,
+            live_from=live_from,
+            version=version,
+        )
+
+    # When
+    next_scheduled_change = get_next_scheduled_change(environment)
+
+    # Then
+    assert next_scheduled_change == next_live_from
+
+
+def test_get_next_scheduled_change_returns_none_if_no_scheduled_changes(
+    environment: Environment,
+    feature: Feature,
+) -> None:
+    # Given
+    flags_cache.clear()
+
+    # When
+    next_scheduled_change = get_next_scheduled_change(environment)
+
+    # Then
+    assert next_scheduled_change is None
+
+
+@pytest.mark.freeze_time()
+def test_environment_flags_cache_expires_when_scheduled_change_goes_live(
+    environment: Environment,
+    feature: Feature,
+    settings,
+    freezer,
+) -> None:
+    # Given
+    settings.CACHE_FLAGS_SECONDS = 60 * 60 * 24
+    flags_cache.clear()
+
+    live_from = timezone.now() + timedelta(hours=1)
+    FeatureState.objects.create(
+        environment=environment,
+        feature=feature,
+        live_from=live_from,
+        version=2,
+        enabled=True,
+    )
+
+    data_before_change = get_environment_flags_data(environment, RequestOrigin.SERVER)
+
+    # When
+    freezer.move_to(live_from + timedelta(seconds=1))
+    data_after_change = get_environment_flags_data(environment, RequestOrigin.SERVER)
+
+    # Then
+    assert data_before_change[0]["enabled"] is False
+    assert data_after_change[0]["enabled"] is True
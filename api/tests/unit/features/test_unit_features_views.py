@@ -861,7 +861,7 @@ def test_update_feature_state_value_triggers_dynamo_rebuild(
 
     # Then
     assert response.status_code == 200
-    mock_dynamo_environment_wrapper.write_environments.assert_called_once()
+    mock_dynamo_environment_wrapper.write_environment_documents.assert_called_once()
 
 
 @pytest.mark.parametrize(
@@ -1429,3 +1429,49 @@ def test_update_segment_override__using_simple_feature_state_viewset__denies_upd
 
     # Then
     assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.parametrize("cache_flags_seconds", (0, 60))
+def test_get_flags_for_single_feature(
+    api_client: APIClient,
+    environment: Environment,
+    feature: Feature,
+    settings,
+    cache_flags_seconds: int,
+) -> None:
+    # Given
+    settings.CACHE_FLAGS_SECONDS = cache_flags_seconds
+
+    api_client.credentials(HTTP_X_ENVIRONMENT_KEY=environment.api_key)
+    url = "%s?feature=%s" % (reverse("api-v1:flags"), feature.name.upper())
+
+    # When
+    response = api_client.get(url)
+
+    # Then
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["feature"]["id"] == feature.id
+
+
+@pytest.mark.parametrize("cache_flags_seconds", (0, 60))
+def test_get_flags_for_single_server_key_only_feature_with_client_key_returns_404(
+    api_client: APIClient,
+    environment: Environment,
+    feature: Feature,
+    settings,
+    cache_flags_seconds: int,
+) -> None:
+    # Given
+    settings.CACHE_FLAGS_SECONDS = cache_flags_seconds
+
+    feature.is_server_key_only = True
+    feature.save()
+
+    api_client.credentials(HTTP_X_ENVIRONMENT_KEY=environment.api_key)
+    url = "%s?feature=%s" % (reverse("api-v1:flags"), feature.name)
+
+    # When
+    response = api_client.get(url)
+
+    # Then
+    assert response.status_code == status.HTTP_404_NOT_FOUND
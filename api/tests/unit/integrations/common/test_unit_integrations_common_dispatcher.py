@@ -0,0 +1,186 @@
+import threading
+import time
+import typing
+
+from pytest_mock import MockerFixture
+
+from integrations.amplitude.amplitude import AmplitudeWrapper
+from integrations.amplitude.models import AmplitudeConfiguration
+from integrations.common.dispatcher import IdentityIntegrationDispatcher
+from integrations.common.wrapper import AbstractBaseIdentityIntegrationWrapper
+from integrations.mixpanel.mixpanel import MixpanelWrapper
+from integrations.mixpanel.models import MixpanelConfiguration
+
+
+class RecordingWrapper(AbstractBaseIdentityIntegrationWrapper):
+    def __init__(self, batch_key: typing.Hashable = None) -> None:
+        self.batch_key = batch_key
+        self.sent: typing.List[typing.List[dict]] = []
+
+    def _identify_user(self, user_data: dict) -> None:
+        self.sent.append([user_data])
+
+    def _identify_users(self, user_data: typing.List[dict]) -> None:
+        self.sent.append(user_data)
+
+    def get_batch_key(self) -> typing.Hashable:
+        return self.batch_key
+
+    def generate_user_data(self, identity, feature_states, trait_models) -> dict:
+        return {}
+
+
+def test_dispatcher_sends_batches_for_wrappers_with_the_same_batch_key() -> None:
+    # Given
+    dispatcher = IdentityIntegrationDispatcher(
+        max_workers=1, max_queue_size=10, max_batch_size=10
+    )
+    batched_wrapper = RecordingWrapper(batch_key="key")
+    unbatched_wrapper = RecordingWrapper()
+
+    # block the worker until everything has been dispatched
+    release_worker = threading.Event()
+    blocking_wrapper = RecordingWrapper()
+    blocking_wrapper._identify_user = lambda user_data: release_worker.wait()
+    dispatcher.dispatch(blocking_wrapper, {})
+
+    # When
+    for i in range(3):
+        dispatcher.dispatch(batched_wrapper, {"user": i})
+        dispatcher.dispatch(unbatched_wrapper, {"user": i})
+    release_worker.set()
+
+    # Then
+    assert dispatcher.join(timeout=5)
+    assert batched_wrapper.sent == [[{"user": 0}, {"user": 1}, {"user": 2}]]
+    assert unbatched_wrapper.sent == [[{"user": 0}], [{"user": 1}], [{"user": 2}]]
+    assert dispatcher.stats["RecordingWrapper"] == {"dispatched": 7, "sent": 7}
+
+
+def test_dispatcher_drops_items_when_queue_is_full() -> None:
+    # Given
+    dispatcher = IdentityIntegrationDispatcher(
+        max_workers=1, max_queue_size=1, max_batch_size=1
+    )
+    release_worker = threading.Event()
+    wrapper = RecordingWrapper()
+    wrapper._identify_user = lambda user_data: release_worker.wait()
+    dispatcher.dispatch(wrapper, {})
+    # wait for the worker to take the first item off the queue
+    while dispatcher._queues["RecordingWrapper"]:
+        time.sleep(0.01)
+
+    # When
+    queued = dispatcher.dispatch(wrapper, {})
+    dropped = dispatcher.dispatch(wrapper, {})
+    release_worker.set()
+
+    # Then
+    assert queued is True
+    assert dropped is False
+    assert dispatcher.join(timeout=5)
+    assert dispatcher.stats["RecordingWrapper"] == {
+        "dispatched": 2,
+        "dropped": 1,
+        "sent": 2,
+    }
+
+
+def test_dispatcher_counts_failures(mocker: MockerFixture) -> None:
+    # Given
+    dispatcher = IdentityIntegrationDispatcher(
+        max_workers=1, max_queue_size=10, max_batch_size=10
+    )
+    wrapper = RecordingWrapper()
+    wrapper._identify_user = mocker.MagicMock(side_effect=Exception("error"))
+
+    # When
+    dispatcher.dispatch(wrapper, {})
+
+    # Then
+    assert dispatcher.join(timeout=5)
+    assert dispatcher.stats["RecordingWrapper"] == {
+        "dispatched": 1,
+        "failed": 1,
+    }
+
+
+def test_dispatcher_drain_waits_for_items_to_be_sent(settings) -> None:
+    # Given
+    settings.IDENTITY_INTEGRATIONS_DISPATCHER_DRAIN_SECONDS = 5
+    dispatcher = IdentityIntegrationDispatcher(
+        max_workers=1, max_queue_size=10, max_batch_size=1
+    )
+    wrapper = RecordingWrapper()
+    # the first item is sent slowly, so the items are still queued on exit
+    release_worker = threading.Event()
+    identify_user = wrapper._identify_user
+
+    def identify_user_when_released(user_data: dict) -> None:
+        release_worker.wait()
+        identify_user(user_data)
+
+    wrapper._identify_user = identify_user_when_released
+    for i in range(3):
+        dispatcher.dispatch(wrapper, {"user": i})
+
+    # When
+    threading.Timer(0.1, release_worker.set).start()
+    dispatcher.drain()
+
+    # Then
+    assert wrapper.sent == [[{"user": 0}], [{"user": 1}], [{"user": 2}]]
+
+
+def test_dispatcher_drain_gives_up_after_timeout(settings, caplog) -> None:
+    # Given
+    settings.IDENTITY_INTEGRATIONS_DISPATCHER_DRAIN_SECONDS = 0
+    dispatcher = IdentityIntegrationDispatcher(
+        max_workers=1, max_queue_size=10, max_batch_size=1
+    )
+    release_worker = threading.Event()
+    wrapper = RecordingWrapper()
+    wrapper._identify_user = lambda user_data: release_worker.wait()
+    dispatcher.dispatch(wrapper, {})
+    dispatcher.dispatch(wrapper, {})
+
+    # When
+    dispatcher.drain()
+
+    # Then
+    release_worker.set()
+    assert caplog.messages == ["Exiting with 2 identity integration event(s) not sent."]
+
+
+def test_amplitude_identify_users_sends_single_request(mocker: MockerFixture) -> None:
+    # Given
+    mock_session = mocker.patch("integrations.amplitude.amplitude.get_session")
+    wrapper = AmplitudeWrapper(AmplitudeConfiguration(api_key="key"))
+
+    # When
+    wrapper._identify_users([{"user_id": "a"}, {"user_id": "b"}])
+
+    # Then
+    mock_session.return_value.post.assert_called_once_with(
+        wrapper.url,
+        data={
+            "api_key": "key",
+            "identification": '[{"user_id": "a"}, {"user_id": "b"}]',
+        },
+    )
+
+
+def test_mixpanel_identify_users_sends_single_request(mocker: MockerFixture) -> None:
+    # Given
+    mock_session = mocker.patch("integrations.mixpanel.mixpanel.get_session")
+    wrapper = MixpanelWrapper(MixpanelConfiguration(api_key="key"))
+
+    # When
+    wrapper._identify_users([[{"$distinct_id": "a"}], [{"$distinct_id": "b"}]])
+
+    # Then
+    mock_session.return_value.post.assert_called_once_with(
+        wrapper.url,
+        headers=wrapper.headers,
+        json=[{"$distinct_id": "a"}, {"$distinct_id": "b"}],
+    )
@@ -47,6 +47,9 @@ def test_environments_are_updated_in_dynamodb_when_project_id_updated(
     dynamo_enabled_project.save()
 
     # Then
-    mock_environments_wrapper.write_environments.assert_called_once_with(
-        [dynamo_enabled_project_environment_one, dynamo_enabled_project_environment_two]
-    )
+    mock_environments_wrapper.write_environment_documents.assert_called_once()
+    args, _ = mock_environments_wrapper.write_environment_documents.call_args
+    assert [document["api_key"] for document in args[0]] == [
+        dynamo_enabled_project_environment_one.api_key,
+        dynamo_enabled_project_environment_two.api_key,
+    ]
@@ -0,0 +1,248 @@
+import pickle
+
+import pytest
+from core.constants import BOOLEAN, FLOAT, INTEGER, STRING
+
+from environments.identities.models import Identity
+from environments.identities.traits.models import Trait
+from projects.models import Project
+from segments.evaluator import (
+    CompiledCondition,
+    CompiledSegment,
+    SegmentIndex,
+    get_traits_by_key,
+)
+from segments.models import (
+    CONTAINS,
+    EQUAL,
+    GREATER_THAN,
+    IN,
+    IS_NOT_SET,
+    MODULO,
+    NOT_CONTAINS,
+    NOT_EQUAL,
+    PERCENTAGE_SPLIT,
+    REGEX,
+    Condition,
+    Segment,
+    SegmentRule,
+)
+
+
+@pytest.mark.parametrize(
+    "operator, condition_value, trait_value_type, trait_value_field, trait_value, expected_result",
+    (
+        (EQUAL, "10", INTEGER, "integer_value", 10, True),
+        (EQUAL, "not-an-int", INTEGER, "integer_value", 10, False),
+        (GREATER_THAN, "1.5", FLOAT, "float_value", 2.5, True),
+        (EQUAL, "true", BOOLEAN, "boolean_value", True, True),
+        (GREATER_THAN, "true", BOOLEAN, "boolean_value", True, False),
+        (CONTAINS, "bar", STRING, "string_value", "foobar", True),
+        (NOT_CONTAINS, "bar", STRING, "string_value", "foobar", False),
+        (REGEX, "[a-z]+$", STRING, "string_value", "foo", True),
+        (REGEX, "[a-z", STRING, "string_value", "foo", False),
+        (GREATER_THAN, "1.0.0:semver", STRING, "string_value", "1.0.1", True),
+        (EQUAL, "1.0:semver", STRING, "string_value", "1.0:semver", False),
+        (GREATER_THAN, "1.0.0:semver", STRING, "string_value", "not-semver", False),
+        (NOT_EQUAL, "1.0.0:semver", STRING, "string_value", "not-semver", False),
+        (IN, "foo,bar", STRING, "string_value", "bar", True),
+        (IN, "1,2", INTEGER, "integer_value", 3, False),
+        (MODULO, "2|0", INTEGER, "integer_value", 4, True),
+        (MODULO, "invalid", INTEGER, "integer_value", 4, False),
+        (MODULO, "2|0", STRING, "string_value", "4", False),
+    ),
+)
+def test_compiled_condition_matches(
+    identity: Identity,
+    operator: str,
+    condition_value: str,
+    trait_value_type: str,
+    trait_value_field: str,
+    trait_value: object,
+    expected_result: bool,
+) -> None:
+    # Given
+    condition = Condition(operator=operator, property="key", value=condition_value)
+    trait = Trait(
+        trait_key="key",
+        value_type=trait_value_type,
+        identity=identity,
+        **{trait_value_field: trait_value},
+    )
+
+    # When
+    result = CompiledCondition(condition).matches(get_traits_by_key([trait]), identity)
+
+    # Then
+    assert result is expected_result
+    assert condition.does_identity_match(identity, [trait]) is expected_result
+
+
+def test_compiled_segment_matches_nested_rules_without_queries(
+    segment: Segment,
+    segment_rule: SegmentRule,
+    identity: Identity,
+    django_assert_num_queries,
+) -> None:
+    # Given
+    Condition.objects.create(
+        rule=segment_rule, operator=EQUAL, property="foo", value="bar"
+    )
+    nested_rule = SegmentRule.objects.create(
+        rule=segment_rule, type=SegmentRule.NONE_RULE
+    )
+    Condition.objects.create(
+        rule=nested_rule, operator=IS_NOT_SET, property="baz", value=None
+    )
+    Condition.objects.create(
+        rule=nested_rule, operator=PERCENTAGE_SPLIT, property=None, value="0"
+    )
+
+    compiled_segment = segment.get_compiled_segment()
+    matching_traits = get_traits_by_key(
+        [
+            Trait(trait_key="foo", string_value="bar", identity=identity),
+            Trait(trait_key="baz", string_value="qux", identity=identity),
+        ]
+    )
+    not_matching_traits = get_traits_by_key(
+        [Trait(trait_key="foo", string_value="bar", identity=identity)]
+    )
+
+    # When
+    with django_assert_num_queries(0):
+        matches = compiled_segment.matches(matching_traits, identity)
+        does_not_match = compiled_segment.matches(not_matching_traits, identity)
+
+    # Then
+    assert matches is True
+    assert does_not_match is False
+
+
+def test_compiled_segment_without_rules_does_not_match(
+    segment: Segment,
+    identity: Identity,
+) -> None:
+    # Given
+    compiled_segment = CompiledSegment(segment)
+
+    # When
+    result = compiled_segment.matches({}, identity)
+
+    # Then
+    assert result is False
+
+
+def test_compiled_segment_can_be_pickled(
+    segment: Segment,
+    segment_rule: SegmentRule,
+    identity: Identity,
+) -> None:
+    # Given
+    Condition.objects.create(
+        rule=segment_rule, operator=REGEX, property="foo", value="ba[rz]"
+    )
+    segment.get_compiled_segment()
+
+    # When
+    unpickled_segment = pickle.loads(pickle.dumps(segment))
+
+    # Then
+    assert unpickled_segment._compiled_segment is not None
+    assert unpickled_segment.get_compiled_segment().matches(
+        get_traits_by_key(
+            [Trait(trait_key="foo", string_value="baz", identity=identity)]
+        ),
+        identity,
+    )
+
+
+def _create_segment(
+    project: Project,
+    name: str,
+    conditions: list[tuple[str, str | None]],
+    rule_type: str = SegmentRule.ALL_RULE,
+) -> Segment:
+    segment = Segment.objects.create(name=name, project=project)
+    rule = SegmentRule.objects.create(segment=segment, type=rule_type)
+    for operator, trait_key in conditions:
+        Condition.objects.create(
+            rule=rule, operator=operator, property=trait_key, value="1"
+        )
+    return segment
+
+
+def test_segment_index_get_candidate_segments(
+    project: Project,
+) -> None:
+    # Given
+    foo_segment = _create_segment(project, "foo", [(EQUAL, "foo")])
+    bar_segment = _create_segment(project, "bar", [(EQUAL, "bar")])
+    foo_or_bar_segment = _create_segment(
+        project, "foo_or_bar", [(EQUAL, "foo"), (EQUAL, "bar")], SegmentRule.ANY_RULE
+    )
+    not_foo_segment = _create_segment(
+        project, "not_foo", [(EQUAL, "foo")], SegmentRule.NONE_RULE
+    )
+    foo_not_set_segment = _create_segment(project, "foo_not_set", [(IS_NOT_SET, "foo")])
+    percentage_split_segment = _create_segment(
+        project, "percentage_split", [(PERCENTAGE_SPLIT, None)]
+    )
+    empty_segment = Segment.objects.create(name="empty", project=project)
+
+    segment_index = SegmentIndex(project.segments.all())
+
+    # When
+    candidate_segments = segment_index.get_candidate_segments({"bar": Trait()})
+
+    # Then
+    assert candidate_segments == [
+        bar_segment,
+        foo_or_bar_segment,
+        not_foo_segment,
+        foo_not_set_segment,
+        percentage_split_segment,
+    ]
+    assert foo_segment not in candidate_segments
+    assert empty_segment not in candidate_segments
+
+
+def test_identity_get_segments_only_evaluates_candidate_segments(
+    project: Project,
+    identity: Identity,
+    mocker,
+) -> None:
+    # Given
+    matching_segment = _create_segment(project, "matching", [(EQUAL, "foo")])
+    _create_segment(project, "other", [(EQUAL, "bar")])
+    Trait.objects.create(
+        identity=identity, trait_key="foo", value_type=INTEGER, integer_value=1
+    )
+    matches_spy = mocker.spy(CompiledSegment, "matches")
+
+    # When
+    segments = identity.get_segments()
+
+    # Then
+    assert segments == [matching_segment]
+    assert matches_spy.call_count == 1
+
+
+def test_project_get_segments_from_cache_compiles_segments(
+    project: Project,
+    segment: Segment,
+    segment_rule: SegmentRule,
+    settings,
+    django_assert_num_queries,
+) -> None:
+    # Given
+    settings.CACHE_PROJECT_SEGMENTS_SECONDS = 60
+    project.get_segments_from_cache()
+
+    # When
+    with django_assert_num_queries(0):
+        segments = project.get_segments_from_cache()
+        compiled_segment = segments[0].get_compiled_segment()
+
+    # Then
+    assert compiled_segment.segment_id == segment.id
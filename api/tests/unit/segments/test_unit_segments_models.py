@@ -14,7 +14,7 @@ def test_percentage_split_calculation_divides_value_by_100_before_comparison(
 ):
     # Given
     mock_get_hashed_percentage_for_object_ids = mocker.patch(
-        "segments.models.get_hashed_percentage_for_object_ids"
+        "segments.evaluator.get_hashed_percentage_for_object_ids"
     )
 
     condition = Condition.objects.create(
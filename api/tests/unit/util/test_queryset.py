@@ -1,6 +1,6 @@
 from environments.identities.models import Identity
 from environments.identities.traits.models import Trait
-from util.queryset import iterator_with_prefetch
+from util.queryset import QueryCount, count_queries, iterator_with_prefetch
 
 
 def test_iterator_with_prefetch_adds_order_by_to_queryset_if_not_present(
@@ -47,3 +47,32 @@ def test_iterator_with_prefetch_make_correct_number_of_queries(
         for identity in iterator:
             assert identity.environment.name
             assert identity.identity_traits.all().first().trait_key
+
+
+def test_count_queries_counts_queries_and_rows(environment, identity):
+    # Given
+    Identity.objects.create(identifier="other_identity", environment=environment)
+
+    # When
+    with count_queries() as query_count:
+        list(Identity.objects.filter(environment=environment))
+        Identity.objects.filter(identifier="not_an_identity").first()
+
+    # Then
+    assert query_count == QueryCount(queries=2, rows=2)
+
+
+def test_count_queries_counts_queries_on_all_connections(mocker):
+    # Given
+    # a primary and a replica connection
+    connections = [mocker.MagicMock(), mocker.MagicMock()]
+    mocker.patch("util.queryset.connections.all", return_value=connections)
+
+    # When
+    with count_queries():
+        pass
+
+    # Then
+    for connection in connections:
+        connection.execute_wrapper.assert_called_once_with(mocker.ANY)
+        connection.execute_wrapper.return_value.__enter__.assert_called_once()
@@ -0,0 +1,262 @@
+import threading
+import time
+
+import pytest
+from django.core.cache.backends.locmem import LocMemCache
+from pytest_mock import MockerFixture
+
+from util.cache import (
+    LocalCacheTier,
+    get_or_build,
+    invalidate_local_cache_tiers,
+    set_built_value,
+)
+
+
+@pytest.fixture()
+def cache() -> LocMemCache:
+    cache = LocMemCache("test-util-cache", {})
+    yield cache
+    cache.clear()
+
+
+@pytest.fixture()
+def local_tier(settings) -> LocalCacheTier:
+    settings.LOCAL_CACHE_TIER_SECONDS = 60
+    settings.LOCAL_CACHE_TIER_MAX_ENTRIES = 2
+    return LocalCacheTier("test")
+
+
+def test_get_or_build_builds_value_once_while_fresh(
+    cache: LocMemCache, mocker: MockerFixture
+) -> None:
+    # Given
+    build = mocker.MagicMock(return_value="value")
+
+    # When
+    values = [get_or_build(cache, "key", build, timeout=60) for _ in range(2)]
+
+    # Then
+    assert values == ["value", "value"]
+    build.assert_called_once_with()
+
+
+def test_get_or_build_serves_value_set_ahead_of_time(
+    cache: LocMemCache, mocker: MockerFixture
+) -> None:
+    # Given
+    set_built_value(cache, "key", "value", timeout=60)
+    build = mocker.MagicMock(return_value="other")
+
+    # When
+    value = get_or_build(cache, "key", build, timeout=60)
+
+    # Then
+    assert value == "value"
+    build.assert_not_called()
+
+
+def test_get_or_build_serves_stale_value_while_another_worker_rebuilds(
+    cache: LocMemCache, mocker: MockerFixture
+) -> None:
+    # Given
+    get_or_build(cache, "key", lambda: "old", timeout=60)
+    cache.delete("key:fresh")
+    cache.add("key:building", True)
+    build = mocker.MagicMock(return_value="new")
+
+    # When
+    value = get_or_build(cache, "key", build, timeout=60)
+
+    # Then
+    assert value == "old"
+    build.assert_not_called()
+
+    # and once the other worker has finished, a stale value is rebuilt
+    cache.delete("key:building")
+    assert get_or_build(cache, "key", build, timeout=60) == "new"
+    assert get_or_build(cache, "key", build, timeout=60) == "new"
+    build.assert_called_once_with()
+
+
+def test_get_or_build_concurrent_misses_build_value_once(
+    cache: LocMemCache,
+) -> None:
+    # Given
+    build_count = 0
+
+    def build() -> str:
+        nonlocal build_count
+        build_count += 1
+        time.sleep(0.1)
+        return "value"
+
+    values = []
+    threads = [
+        threading.Thread(
+            target=lambda: values.append(get_or_build(cache, "key", build, timeout=60))
+        )
+        for _ in range(5)
+    ]
+
+    # When
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Then
+    assert values == ["value"] * 5
+    assert build_count == 1
+
+
+def test_get_or_build_does_not_cache_when_timeout_is_zero(
+    cache: LocMemCache, mocker: MockerFixture
+) -> None:
+    # Given
+    build = mocker.MagicMock(return_value="value")
+
+    # When
+    get_or_build(cache, "key", build, timeout=0)
+    get_or_build(cache, "key", build, timeout=0)
+
+    # Then
+    assert build.call_count == 2
+    assert cache.get("key") is None
+
+
+def test_get_or_build_uses_local_tier_until_key_invalidated(
+    cache: LocMemCache, local_tier: LocalCacheTier, mocker: MockerFixture
+) -> None:
+    # Given
+    build = mocker.MagicMock(side_effect=["old", "new"])
+    get_or_build(cache, "key", build, timeout=60, local_tier=local_tier)
+    # values in the local tier are used even if the shared cache changes
+    cache.set("key", "changed")
+
+    # When
+    value = get_or_build(cache, "key", build, timeout=60, local_tier=local_tier)
+    cache.delete("key")
+    invalidate_local_cache_tiers(cache, ["key"])
+    invalidated_value = get_or_build(
+        cache, "key", build, timeout=60, local_tier=local_tier
+    )
+
+    # Then
+    assert value == "old"
+    assert invalidated_value == "new"
+    assert local_tier.stats == {
+        "local": {"hits": 1, "misses": 2},
+        "shared": {"hits": 0, "misses": 2},
+    }
+
+
+def test_local_cache_tier_evicts_least_recently_used_entries(
+    cache: LocMemCache,
+    local_tier: LocalCacheTier,
+) -> None:
+    # Given
+    local_tier.set("a", "a", None)
+    local_tier.set("b", "b", None)
+    local_tier.get(cache, "a")
+
+    # When
+    local_tier.set("c", "c", None)
+
+    # Then
+    assert local_tier.get(cache, "a") == ("a", None)
+    assert local_tier.get(cache, "b") == (None, None)
+    assert local_tier.get(cache, "c") == ("c", None)
+
+
+def test_get_or_build_only_checks_local_tier_version_periodically(
+    cache: LocMemCache,
+    local_tier: LocalCacheTier,
+    settings,
+    mocker: MockerFixture,
+) -> None:
+    # Given
+    settings.LOCAL_CACHE_TIER_VERSION_CHECK_SECONDS = 5
+    mocked_time = mocker.patch("util.cache.time")
+    mocked_time.monotonic.return_value = 1000.0
+    build = mocker.MagicMock(side_effect=["old", "new"])
+    get_or_build(cache, "key", build, timeout=60, local_tier=local_tier)
+
+    # another process invalidates the key
+    cache.delete("key")
+    cache.set("key:version", "new-version")
+    cache_get = mocker.spy(cache, "get")
+
+    # When
+    mocked_time.monotonic.return_value = 1004.0
+    value_before_check = get_or_build(
+        cache, "key", build, timeout=60, local_tier=local_tier
+    )
+    calls_before_check = cache_get.call_count
+    mocked_time.monotonic.return_value = 1005.0
+    value_after_check = get_or_build(
+        cache, "key", build, timeout=60, local_tier=local_tier
+    )
+
+    # Then
+    assert value_before_check == "old"
+    assert calls_before_check == 0
+    assert value_after_check == "new"
+
+
+def test_invalidate_local_cache_tiers_discards_local_values_immediately(
+    cache: LocMemCache,
+    local_tier: LocalCacheTier,
+    settings,
+    mocker: MockerFixture,
+) -> None:
+    # Given
+    settings.LOCAL_CACHE_TIER_VERSION_CHECK_SECONDS = 60
+    build = mocker.MagicMock(side_effect=["old", "new"])
+    get_or_build(cache, "key", build, timeout=60, local_tier=local_tier)
+
+    # When
+    cache.delete("key")
+    invalidate_local_cache_tiers(cache, ["key"])
+    value = get_or_build(cache, "key", build, timeout=60, local_tier=local_tier)
+
+    # Then
+    assert value == "new"
+
+
+def test_get_or_build_does_not_keep_value_in_local_tier_beyond_its_timeout(
+    cache: LocMemCache,
+    local_tier: LocalCacheTier,
+    mocker: MockerFixture,
+) -> None:
+    # Given
+    mocked_time = mocker.patch("util.cache.time")
+    mocked_time.monotonic.return_value = 1000.0
+    build = mocker.MagicMock(side_effect=["old", "new"])
+    get_or_build(cache, "key", build, timeout=lambda value: 10, local_tier=local_tier)
+    # the value has expired from the shared cache
+    cache.delete("key")
+
+    # When
+    mocked_time.monotonic.return_value = 1010.0
+    value = get_or_build(
+        cache, "key", build, timeout=lambda value: 10, local_tier=local_tier
+    )
+
+    # Then
+    assert value == "new"
+
+
+def test_local_cache_tier_does_not_keep_value_with_no_timeout_beyond_its_ttl(
+    cache: LocMemCache, local_tier: LocalCacheTier, mocker: MockerFixture
+) -> None:
+    # Given
+    mocked_time = mocker.patch("util.cache.time")
+    mocked_time.monotonic.return_value = 1000.0
+    local_tier.set("key", "value", None, timeout=None)
+
+    # When
+    mocked_time.monotonic.return_value = 1060.0
+
+    # Then
+    assert local_tier.get(cache, "key") == (None, None)
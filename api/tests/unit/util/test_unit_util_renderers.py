@@ -0,0 +1,56 @@
+import json
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+from rest_framework.renderers import JSONRenderer
+
+from util import renderers
+from util.renderers import parse_gzipped_json, render_gzipped_json, render_json
+
+
+@pytest.mark.parametrize("use_orjson", (True, False))
+def test_render_json_matches_drf_json_renderer(use_orjson, mocker) -> None:
+    # Given
+    if use_orjson:
+        pytest.importorskip("orjson")
+    else:
+        mocker.patch.object(renderers, "orjson", None)
+
+    data = {
+        "string": "föo",
+        "integer": 1,
+        "decimal": Decimal("1.5"),
+        "boolean": True,
+        "none": None,
+        "list": [{"foo": "bar"}],
+        "integer_keys": {1: "foo", 2: "bar"},
+        "uuid": uuid.UUID("0b1f8e3a-5c59-4f3a-9d42-4d7a0a1e8a3b"),
+        "utc_datetime": datetime(2023, 1, 2, 3, 4, 5, 6789, tzinfo=timezone.utc),
+        "offset_datetime": datetime(
+            2023, 1, 2, 3, 4, 5, tzinfo=timezone(timedelta(hours=1))
+        ),
+        "naive_datetime": datetime(2023, 1, 2, 3, 4, 5),
+        "date": date(2023, 1, 2),
+    }
+
+    # When
+    rendered = render_json(data)
+
+    # Then
+    # (the encoding of non-ASCII characters differs, which is fine for clients)
+    assert isinstance(rendered, bytes)
+    assert json.loads(rendered) == json.loads(JSONRenderer().render(data))
+
+
+def test_parse_gzipped_json_returns_rendered_data() -> None:
+    # Given
+    data = {"integer": 1, "decimal": Decimal("1.5"), "list": [{"foo": "bär"}]}
+
+    # When
+    rendered = render_gzipped_json(data)
+
+    # Then
+    assert parse_gzipped_json(rendered) == data
+    assert isinstance(parse_gzipped_json(rendered)["decimal"], Decimal)
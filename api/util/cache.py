@@ -0,0 +1,357 @@
+"""
+Read-through caching that avoids stampeding the database when entries expire.
+
+`get_or_build` follows the usual get -> miss -> build -> set pattern, but:
+
+ - concurrent misses for the same key in a process wait for a single build
+   rather than all building the value at the same time (single-flight).
+ - across processes, the process that builds a value holds a lock key in the
+   (shared) cache while it does so. Other processes serve the existing value if
+   there is one, or wait for the build to finish for up to
+   `CACHE_REBUILD_LOCK_SECONDS` otherwise.
+ - entries are kept for `CACHE_STALE_SECONDS` after their timeout so that they
+   can be served while they are rebuilt, and are rebuilt early, at a random point
+   in the last `CACHE_EARLY_REFRESH_FRACTION` of their timeout, so that entries
+   set at the same time aren't all rebuilt at the same time.
+
+Whether an entry is fresh is tracked by a separate `<key>:fresh` marker so that
+the values themselves are stored as-is. Deleting the value (e.g. to invalidate
+it after a write) means it is rebuilt on the next request rather than served
+stale.
+
+A `LocalCacheTier` can also be given to keep the values in process memory for
+up to `LOCAL_CACHE_TIER_SECONDS` (or the timeout of the value, if that is
+shorter), avoiding a round trip to the shared cache (and unpickling the value)
+on most requests. Each value in the local tier is stored with the version of its
+key in the shared cache at the time, and is only used while that version is
+unchanged. The version is checked at most every
+`LOCAL_CACHE_TIER_VERSION_CHECK_SECONDS`, so `invalidate_local_cache_tiers` must
+be called alongside deleting keys from the shared cache; it drops the values
+from the local tiers of the calling process straight away, and other processes
+stop using them within that interval. Caches whose keys are never deleted (e.g.
+because they are keyed on the version of the environment) rely on the timeout
+alone. Values in the local tier are shared between threads so must not be
+mutated.
+"""
+import random
+import threading
+import time
+import typing
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+T = typing.TypeVar("T")
+
+_WAIT_INTERVAL_SECONDS = 0.05
+
+
+class _KeyLocks:
+    """
+    Locks for keys that are currently being built, which are removed once no
+    thread is waiting for them.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._locks: typing.Dict[typing.Hashable, typing.List] = {}
+
+    @contextmanager
+    def hold(self, key: typing.Hashable) -> typing.Iterator[None]:
+        with self._lock:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+
+_key_locks = _KeyLocks()
+
+local_cache_tiers: typing.Dict[str, "LocalCacheTier"] = {}
+
+
+class LocalCacheTier:
+    """
+    Size bounded, process-local LRU cache that sits in front of a shared cache.
+
+    The number of hits and misses in both the local tier and the shared cache
+    behind it are available from `stats`.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[typing.Any, tuple]" = OrderedDict()
+        self._stats = Counter()
+        local_cache_tiers[name] = self
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return settings.LOCAL_CACHE_TIER_SECONDS > 0
+
+    @property
+    def stats(self) -> typing.Dict[str, typing.Dict[str, int]]:
+        with self._lock:
+            return {
+                tier: {
+                    "hits": self._stats[f"{tier}_hits"],
+                    "misses": self._stats[f"{tier}_misses"],
+                }
+                for tier in ("local", "shared")
+            }
+
+    def get(
+        self, cache: BaseCache, key: typing.Any
+    ) -> typing.Tuple[typing.Optional[typing.Any], typing.Any]:
+        """
+        Get the value for the key from the local tier, or None if it isn't there
+        or has been invalidated, along with the version of the key in the shared
+        cache (which is only read if it hasn't been checked recently).
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] <= now:
+                del self._entries[key]
+                entry = None
+            if entry is not None and now < entry[3]:
+                return self._hit(key, entry)
+
+        version = cache.get(_get_version_key(key))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] != version:
+                self._stats["local_misses"] += 1
+                return None, version
+
+            entry = self._entries[key] = (
+                *entry[:3],
+                now + settings.LOCAL_CACHE_TIER_VERSION_CHECK_SECONDS,
+            )
+            return self._hit(key, entry)
+
+    def set(
+        self,
+        key: typing.Any,
+        value: typing.Any,
+        version: typing.Any,
+        timeout: typing.Optional[int] = None,
+    ) -> None:
+        """
+        :param timeout: the timeout of the value in the shared cache, if any. The
+            value is never kept in the local tier for longer than this.
+        """
+        local_timeout = settings.LOCAL_CACHE_TIER_SECONDS
+        if timeout is not None:
+            local_timeout = min(timeout, local_timeout)
+        if local_timeout <= 0:
+            return
+
+        now = time.monotonic()
+        version_checked_until = now + settings.LOCAL_CACHE_TIER_VERSION_CHECK_SECONDS
+        with self._lock:
+            self._entries[key] = (
+                value,
+                version,
+                now + local_timeout,
+                version_checked_until,
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.LOCAL_CACHE_TIER_MAX_ENTRIES:
+                self._entries.popitem(last=False)
+
+    def discard(self, keys: typing.Iterable[typing.Any]) -> None:
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def _hit(
+        self, key: typing.Any, entry: tuple
+    ) -> typing.Tuple[typing.Any, typing.Any]:
+        # must be called while holding the lock
+        self._entries.move_to_end(key)
+        self._stats["local_hits"] += 1
+        return entry[0], entry[1]
+
+    def record_shared_lookup(self, hit: bool) -> None:
+        with self._lock:
+            self._stats["shared_hits" if hit else "shared_misses"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+def get_local_cache_tier_stats() -> typing.Dict[str, typing.Dict[str, dict]]:
+    return {name: tier.stats for name, tier in local_cache_tiers.items()}
+
+
+def invalidate_local_cache_tiers(
+    cache: BaseCache, keys: typing.Iterable[typing.Any]
+) -> None:
+    """
+    Change the version of the given keys in the shared cache so that the values
+    for them in the local tiers of every process are no longer used.
+    """
+    keys = list(keys)
+    version = time.time_ns()
+    # the versions don't expire so that they can't go back to a previous value
+    cache.set_many({_get_version_key(key): version for key in keys}, timeout=None)
+    for local_cache_tier in local_cache_tiers.values():
+        local_cache_tier.discard(keys)
+
+
+def get_or_build(
+    cache: BaseCache,
+    key: typing.Any,
+    build: typing.Callable[[], T],
+    timeout: typing.Union[int, None, typing.Callable[[T], typing.Optional[int]]] = (
+        DEFAULT_TIMEOUT
+    ),
+    local_tier: LocalCacheTier = None,
+) -> T:
+    """
+    Get the value for the key from the cache, using `build` to build it (and set
+    it in the cache) if the cache doesn't have a fresh value. `build` must not
+    return None since that is indistinguishable from a cache miss.
+
+    :param timeout: the timeout to set the value with, or a function that takes
+        the value and returns the timeout. Defaults to the cache's timeout.
+    :param local_tier: optional process-local tier to check before the cache.
+    """
+    if timeout == 0 or (timeout is DEFAULT_TIMEOUT and cache.default_timeout == 0):
+        # caching is disabled
+        return build()
+
+    if local_tier is None:
+        return _get_or_build(cache, key, build, timeout)[0]
+
+    if not local_tier.is_enabled():
+        value, hit = _get_or_build(cache, key, build, timeout)
+        local_tier.record_shared_lookup(hit)
+        return value
+
+    value, version = local_tier.get(cache, key)
+    if value is None:
+        value, hit = _get_or_build(cache, key, build, timeout)
+        local_tier.record_shared_lookup(hit)
+        local_tier.set(key, value, version, _resolve_timeout(cache, timeout, value))
+    return value
+
+
+def set_built_value(
+    cache: BaseCache,
+    key: typing.Any,
+    value: T,
+    timeout: typing.Union[int, None, typing.Callable[[T], typing.Optional[int]]] = (
+        DEFAULT_TIMEOUT
+    ),
+) -> None:
+    """
+    Set a value that has been built ahead of time (e.g. to warm the cache) so
+    that it is served as fresh by `get_or_build`.
+    """
+    timeout = _resolve_timeout(cache, timeout, value)
+    if timeout is None or timeout <= 0:
+        # don't expire the value (or don't cache it at all)
+        cache.set_many({key: value, f"{key}:fresh": True}, timeout=timeout)
+    else:
+        fresh_timeout = timeout * (
+            1 - random.uniform(0, settings.CACHE_EARLY_REFRESH_FRACTION)
+        )
+        cache.set(key, value, timeout=timeout + settings.CACHE_STALE_SECONDS)
+        cache.set(f"{key}:fresh", True, timeout=max(int(fresh_timeout), 1))
+
+
+def _get_version_key(key: typing.Any) -> str:
+    return f"{key}:version"
+
+
+def _resolve_timeout(
+    cache: BaseCache,
+    timeout: typing.Union[int, None, typing.Callable[[T], typing.Optional[int]]],
+    value: T,
+) -> typing.Optional[int]:
+    if callable(timeout):
+        return timeout(value)
+    if timeout is DEFAULT_TIMEOUT:
+        return cache.default_timeout
+    return timeout
+
+
+def _get_or_build(
+    cache: BaseCache,
+    key: typing.Any,
+    build: typing.Callable[[], T],
+    timeout: typing.Union[int, None, typing.Callable[[T], typing.Optional[int]]],
+) -> typing.Tuple[T, bool]:
+    """
+    Get the value for the key from the cache or build it, and whether it was
+    served from the cache.
+    """
+    fresh_key = f"{key}:fresh"
+    cached_values = cache.get_many([key, fresh_key])
+    value = cached_values.get(key)
+    if value is not None:
+        if fresh_key not in cached_values and _acquire_build_lock(cache, key):
+            return _build_and_set(cache, key, build, timeout, locked=True), False
+        # either the value is fresh or it is being rebuilt by another worker
+        return value, True
+
+    with _key_locks.hold((id(cache), key)):
+        # another thread in this process may have built the value while this
+        # one was waiting for the lock
+        value = cache.get(key)
+        if value is not None:
+            return value, True
+
+        locked = _acquire_build_lock(cache, key)
+        if not locked:
+            value = _wait_for_value(cache, key)
+            if value is not None:
+                return value, True
+
+        return _build_and_set(cache, key, build, timeout, locked=locked), False
+
+
+def _build_and_set(
+    cache: BaseCache,
+    key: typing.Any,
+    build: typing.Callable[[], T],
+    timeout: typing.Union[int, None, typing.Callable[[T], typing.Optional[int]]],
+    locked: bool,
+) -> T:
+    try:
+        value = build()
+        set_built_value(cache, key, value, timeout)
+        return value
+    finally:
+        if locked:
+            cache.delete(f"{key}:building")
+
+
+def _acquire_build_lock(cache: BaseCache, key: typing.Any) -> bool:
+    return cache.add(
+        f"{key}:building", True, timeout=settings.CACHE_REBUILD_LOCK_SECONDS
+    )
+
+
+def _wait_for_value(cache: BaseCache, key: typing.Any) -> typing.Optional[typing.Any]:
+    deadline = time.monotonic() + settings.CACHE_REBUILD_LOCK_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(_WAIT_INTERVAL_SECONDS)
+        value = cache.get(key)
+        if value is not None:
+            return value
+        if cache.get(f"{key}:building") is None:
+            # the other worker failed to build the value
+            break
+    return None
@@ -19,6 +19,7 @@ if TYPE_CHECKING:  # pragma: no cover
 
 __all__ = (
     "map_engine_identity_to_identity_document",
+    "map_engine_model_to_document",
     "map_environment_api_key_to_environment_api_key_document",
     "map_environment_to_environment_document",
     "map_identity_to_identity_document",
@@ -57,6 +58,13 @@ def map_engine_identity_to_identity_document(
     }
 
 
+def map_engine_model_to_document(engine_model: BaseModel) -> Document:
+    return {
+        field_name: _map_value_to_document_value(value)
+        for field_name, value in engine_model
+    }
+
+
 def map_identity_to_identity_document(
     identity: "Identity",
 ) -> Document:
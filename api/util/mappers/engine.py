@@ -123,6 +123,23 @@ def map_feature_state_to_engine(
     )
 
 
+def map_feature_states_to_engine(
+    feature_states: Iterable["FeatureState"],
+) -> List[FeatureStateModel]:
+    """
+    Maps the live feature state with the highest priority for each feature, in
+    the same way as `map_environment_to_engine`.
+    The multivariate values of the feature states should be prefetched.
+    """
+    return [
+        map_feature_state_to_engine(
+            feature_state,
+            feature_state.multivariate_feature_state_values.all(),
+        )
+        for feature_state in _get_prioritised_feature_states(feature_states)
+    ]
+
+
 def map_mv_fs_value_to_engine(
     mv_fs_value: "MultivariateFeatureStateValue",
 ) -> MultivariateFeatureStateValueModel:
@@ -398,6 +415,8 @@ def _get_project_segment_feature_states(
     for segment in project_segments:
         segment_feature_states = feature_states_by_segment_id.setdefault(segment.pk, [])
         for feature_segment in segment.feature_segments.all():
+            # the segments are shared by the environments in the project that
+            # are built together
             if feature_segment.environment_id != environment_id:
                 continue
             segment_feature_states += _get_prioritised_feature_states(
@@ -1,4 +1,9 @@
+import typing
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass
+
 from django.core.paginator import Paginator
+from django.db import connections
 
 
 def iterator_with_prefetch(queryset, chunk_size=2000):
@@ -14,3 +19,31 @@ def iterator_with_prefetch(queryset, chunk_size=2000):
     paginator = Paginator(queryset, chunk_size)
     for index in range(paginator.num_pages):
         yield from paginator.get_page(index + 1)
+
+
+@dataclass
+class QueryCount:
+    queries: int = 0
+    rows: int = 0
+
+
+@contextmanager
+def count_queries() -> typing.Iterator[QueryCount]:
+    """
+    Count the queries executed on any of the database connections in the block
+    (since the router may send reads to a replica), and the rows that they
+    returned (or affected).
+    """
+    query_count = QueryCount()
+
+    def execute_wrapper(execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        query_count.queries += 1
+        # the row count isn't available for all queries (or backends)
+        query_count.rows += max(context["cursor"].rowcount, 0)
+        return result
+
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(execute_wrapper))
+        yield query_count
@@ -1,8 +1,26 @@
+import gzip
+import json
+import logging
+from decimal import Decimal
 from json import JSONEncoder
 from typing import Any, Type
 
 from pydantic.json import pydantic_encoder
 from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+
+    logger.debug("Using orjson library for rendering JSON.")
+except ImportError:
+    # orjson is an optional dependency which just speeds up rendering
+    logger.debug("Unable to import orjson. Falling back to json.")
+    orjson = None
+
+_drf_encoder = encoders.JSONEncoder()
 
 
 class PydanticJSONEncoder(JSONEncoder):
@@ -12,3 +30,42 @@ class PydanticJSONEncoder(JSONEncoder):
 
 class PydanticJSONRenderer(JSONRenderer):
     encoder_class: Type[JSONEncoder] = PydanticJSONEncoder
+
+
+def render_json(data: Any) -> bytes:
+    """
+    Render the given data to (compact) UTF-8 encoded JSON bytes, equivalent to
+    those rendered by DRF's JSONRenderer. Uses orjson if it is installed, falling
+    back to the json module (with DRF's encoder) if not.
+    """
+    if orjson is not None:
+        # orjson's own datetime format differs from DRF's (e.g. it uses +00:00
+        # rather than Z for UTC), so datetimes are passed to DRF's encoder too
+        return orjson.dumps(
+            data,
+            default=_drf_encoder.default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+        )
+
+    return json.dumps(
+        data,
+        cls=encoders.JSONEncoder,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def render_gzipped_json(data: Any) -> bytes:
+    """
+    Render the given data to gzipped JSON bytes (see `render_json`).
+    """
+    return gzip.compress(render_json(data), mtime=0)
+
+
+def parse_gzipped_json(content: bytes) -> Any:
+    """
+    Parse JSON bytes rendered by `render_gzipped_json`. Non-integer numbers are
+    parsed as Decimals, in the same way as they are read from dynamodb.
+    """
+    return json.loads(gzip.decompress(content), parse_float=Decimal)